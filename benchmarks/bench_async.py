@@ -0,0 +1,86 @@
+"""
+benchmark of concurrent requests: `_flask.BaseModel` on a thread pool vs `_asyncio.AsyncBaseModel` on asyncio.
+each request reads a row by `get_or_none` and a page by `page_items`, on the same sqlite file.
+NOTE: aiosqlite runs each connection in its own thread, and sqlite file engines are not pooled by default,
+      so the gain of asyncio shows on network databases (asyncpg/aiomysql) rather than here.
+
+usage:
+    python benchmarks/bench_async.py [requests=500] [threads=32] [rows=1000]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from sqlalchemy import Column, Integer, String
+from pyco_sqlalchemy._flask import db, BaseModel
+from pyco_sqlalchemy._asyncio import adb, AsyncBaseModel, async_db_session_maker
+
+
+class SyncItem(db.Model, BaseModel):
+    __tablename__ = "item"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32))
+
+
+class AsyncItem(adb.Model, AsyncBaseModel):
+    __tablename__ = "item"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32))
+
+
+def bench_threads(db_file, requests, threads, rows):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///{}".format(db_file)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    def request(i):
+        with app.app_context():
+            m = SyncItem.get_or_none(id=i % rows + 1)
+            page = SyncItem.page_items(name=m.name, limit=10)
+            db.session.remove()
+            return len(page["items"])
+
+    with app.app_context():
+        db.create_all()
+        SyncItem.insert_many([dict(id=i + 1, name="n{}".format(i % 50)) for i in range(rows)])
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        assert all(pool.map(request, range(requests)))
+    return time.perf_counter() - t0
+
+
+async def bench_asyncio(db_file, requests, rows):
+    adb.init_engine("sqlite+aiosqlite:///{}".format(db_file))
+
+    async def request(i):
+        async with async_db_session_maker(auto_close=True):
+            m = await AsyncItem.get_or_none(id=i % rows + 1)
+            page = await AsyncItem.page_items(name=m.name, limit=10)
+            return len(page["items"])
+
+    t0 = time.perf_counter()
+    assert all(await asyncio.gather(*[request(i) for i in range(requests)]))
+    dt = time.perf_counter() - t0
+    await adb.dispose()
+    return dt
+
+
+def main(requests=500, threads=32, rows=1000):
+    db_fd, db_file = tempfile.mkstemp(suffix="sqlite.db")
+    try:
+        print("requests={} threads={} rows={}".format(requests, threads, rows))
+        dt = bench_threads(db_file, requests, threads, rows)
+        print("{:<8} {:>8.1f}ms {:>8.0f} req/s".format("threads", dt * 1000, requests / dt))
+        dt = asyncio.run(bench_asyncio(db_file, requests, rows))
+        print("{:<8} {:>8.1f}ms {:>8.0f} req/s".format("asyncio", dt * 1000, requests / dt))
+    finally:
+        os.close(db_fd)
+        os.unlink(db_file)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
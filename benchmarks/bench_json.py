@@ -0,0 +1,63 @@
+"""
+benchmark of serializing model lists: `utils.json_dumps([m.to_dict() ...])` vs `BaseModel.dumps_many`.
+
+usage:
+    python benchmarks/bench_json.py [rows]
+"""
+import sys
+import time
+import uuid
+from flask import Flask
+from pyco_sqlalchemy import utils, serializer
+from pyco_sqlalchemy._flask import CoModel, db
+from pyco_sqlalchemy.serializer import ModelSerializer
+
+
+class Record(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    uid = db.Column(db.String(36))
+    name = db.Column(db.String(32))
+    payload = db.Column(db.JSON)
+    score = db.Column(db.Float)
+
+
+def timeit(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def main(rows=10000):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        Record.insert_many(
+            dict(uid=str(uuid.uuid4()), name="r{}".format(i), payload=dict(i=i, tags=["a", "b"]), score=i / 7)
+            for i in range(rows)
+        )
+        ms = Record.filter_by()
+        cases = [
+            ("json_dumps(to_dict)", lambda: utils.json_dumps([m.to_dict() for m in ms])),
+            ("json_stringify(to_dict)", lambda: utils.json_stringify([m.to_dict() for m in ms])),
+            ("dumps_many[stdlib]", lambda: ModelSerializer(Record, use_orjson=False).dumps(ms)),
+        ]
+        if serializer.orjson is not None:
+            cases.append(("dumps_many[orjson]", lambda: Record.dumps_many(ms)))
+        base = None
+        print("rows={}".format(rows))
+        print("{:<26}{:>12}{:>10}".format("case", "ms", "speedup"))
+        for name, fn in cases:
+            dt = timeit(fn)
+            base = base or dt
+            print("{:<26}{:>12.1f}{:>9.1f}x".format(name, dt * 1000, base / dt))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""
+benchmark of loading rows with JSON columns never read: eager `JsonText` vs `JsonText(lazy=True)`,
+and storage of the former `indent=2` encoding vs compact.
+
+usage:
+    python benchmarks/bench_json_columns.py [rows=100000]
+"""
+import sys
+import time
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, select, func
+from pyco_sqlalchemy._types import JsonText, OrderedJson
+
+
+def make_table(metadata, name, **kws):
+    return Table(
+        name, metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(32)),
+        Column("profile", JsonText(**kws)),
+        Column("settings", OrderedJson(lazy=kws.get("lazy", False))),
+    )
+
+
+def main(rows=100000):
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    tables = dict(
+        pretty=make_table(metadata, "pretty", indent=2),
+        eager=make_table(metadata, "eager"),
+        lazy=make_table(metadata, "lazy", lazy=True),
+    )
+    metadata.create_all(engine)
+    doc = dict(tags=["a", "b", "c"], scores=list(range(30)), meta=dict(owner="dev", level=3, flags=[True, False]))
+    params = [dict(id=i, name="n{}".format(i), profile=doc, settings=doc) for i in range(rows)]
+    print("rows={}".format(rows))
+    with engine.begin() as conn:
+        for name, tbl in tables.items():
+            conn.execute(tbl.insert(), params)
+            size = conn.execute(select(func.sum(func.length(tbl.c.profile)))).scalar()
+            print("{:<8} profile storage: {:>10} bytes".format(name, size))
+
+        for name, tbl in tables.items():
+            t0 = time.perf_counter()
+            names = [row.name for row in conn.execute(select(tbl))]
+            dt = time.perf_counter() - t0
+            assert len(names) == rows
+            print("{:<8} load rows, JSON unused: {:>8.1f}ms".format(name, dt * 1000))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
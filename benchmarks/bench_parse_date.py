@@ -0,0 +1,54 @@
+"""
+benchmark of `utils.parse_date` over mixed-format strings, layered parser vs dateutil only.
+
+usage:
+    python benchmarks/bench_parse_date.py [count=1000000]
+"""
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+from dateutil.parser import parse as dateutil_parse
+from pyco_sqlalchemy import utils
+
+
+def make_datestrs(count, seed=0):
+    rnd = random.Random(seed)
+    t0 = datetime(2020, 1, 1)
+    formats = [
+        (70, lambda t: t.isoformat()),
+        (10, lambda t: t.replace(tzinfo=utils.TZ_UTC).isoformat().replace("+00:00", "Z")),
+        (10, lambda t: t.strftime("%Y/%m/%d %H:%M:%S")),
+        (5, lambda t: t.strftime("%a, %d %b %Y %H:%M:%S +0800")),
+        (5, lambda t: "{:.3f}".format(t.timestamp())),
+    ]
+    weights = [w for w, _ in formats]
+    fns = [fn for _, fn in formats]
+    ts = [t0 + timedelta(seconds=rnd.randrange(300000000), microseconds=rnd.randrange(1000000)) for _ in range(count)]
+    return [rnd.choices(fns, weights)[0](t) for t in ts]
+
+
+def legacy_parse_date(val, tz=utils.TZ_LOCAL):
+    try:
+        return datetime.fromtimestamp(dateutil_parse(val).timestamp(), tz=tz)
+    except ValueError:
+        # dateutil fails on epoch strings
+        return datetime.fromtimestamp(float(val), tz=tz)
+
+
+def main(count=1000000):
+    datestrs = make_datestrs(count)
+    print("count={}".format(count))
+    t0 = time.perf_counter()
+    results = [utils.parse_date(s) for s in datestrs]
+    t1 = time.perf_counter()
+    legacy = [legacy_parse_date(s) for s in datestrs]
+    t2 = time.perf_counter()
+    assert results == legacy
+    print("{:<12}{:>10.2f}s{:>10.2f}us/call".format("layered", t1 - t0, (t1 - t0) / count * 1e6))
+    print("{:<12}{:>10.2f}s{:>10.2f}us/call".format("dateutil", t2 - t1, (t2 - t1) / count * 1e6))
+    print("speedup: {:.1f}x".format((t2 - t1) / (t1 - t0)))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
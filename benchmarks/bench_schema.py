@@ -0,0 +1,66 @@
+"""
+micro-benchmark of the per-call cost of `strict_form`, `primary_keys` and `to_dict`
+on a 40-column model, ModelSchema vs the former per-call introspection.
+
+usage:
+    python benchmarks/bench_schema.py [number]
+"""
+import sys
+import timeit
+from flask import Flask
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from pyco_sqlalchemy._flask import BaseModel, db
+
+N_COLUMNS = 40
+
+Wide = type("Wide", (db.Model, BaseModel), dict(
+    id=db.Column(db.Integer, primary_key=True),
+    **{"c{}".format(i): db.Column(db.String(32)) for i in range(1, N_COLUMNS)}
+))
+
+
+def legacy_strict_form(cls, data):
+    form = {}
+    for k, v in data.items():
+        col = getattr(cls, k, None)
+        if isinstance(col, InstrumentedAttribute):
+            form[k] = v
+    return form
+
+
+def legacy_primary_keys(cls):
+    return [m.name for m in cls.__table__.primary_key.columns]
+
+
+def legacy_to_dict(m):
+    d = dict(_type=m.__class__.__name__)
+    for col in m.columns():
+        d[col.name] = getattr(m, col.name)
+    return d
+
+
+def main(number=20000):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        form = {"c{}".format(i): str(i) for i in range(1, N_COLUMNS)}
+        form.update(unknown=1, _type="Wide")
+        m = Wide(id=1, **legacy_strict_form(Wide, form))
+        Wide._schema()
+
+        cases = [
+            ("strict_form", lambda: legacy_strict_form(Wide, form), lambda: Wide.strict_form(form)),
+            ("primary_keys", lambda: legacy_primary_keys(Wide), lambda: Wide.primary_keys()),
+            ("to_dict", lambda: legacy_to_dict(m), lambda: m.to_dict()),
+        ]
+        print("{:<14}{:>14}{:>14}{:>10}".format("call", "legacy(us)", "schema(us)", "speedup"))
+        for name, legacy, current in cases:
+            t0 = min(timeit.repeat(legacy, number=number, repeat=3)) / number * 1e6
+            t1 = min(timeit.repeat(current, number=number, repeat=3)) / number * 1e6
+            print("{:<14}{:>14.2f}{:>14.2f}{:>9.1f}x".format(name, t0, t1, t0 / t1))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
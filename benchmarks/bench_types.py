@@ -0,0 +1,74 @@
+"""
+benchmark of binding a column of values with a few hundred distinct strings:
+per-value `process_bind_param` (the former TypeDecorator path) vs memoized `bind_processor`
+vs `normalize_many`.
+
+usage:
+    python benchmarks/bench_types.py [rows=1000000] [distinct=300]
+"""
+import re
+import sys
+import time
+import random
+from sqlalchemy.dialects import sqlite
+from pyco_sqlalchemy._types import BoolField, SnakeField, StringTags, SortedTags
+
+
+def legacy_snake_case(s):
+    # the former `regex.snake_case`, which compiled the pattern per call
+    s = re.sub('[^0-9a-zA-Z]+', '_', s.strip())
+    a = re.compile('((?<=[a-z0-9])[A-Z]|(?!^)[A-Z](?=[a-z]))')
+    return a.sub(r'_\1', s).lower()
+
+
+def make_values(rows, distinct, seed=0):
+    rnd = random.Random(seed)
+    words = ["alpha", "Beta", "gammaRay", "HTTPCode", "delta", "Epsilon", "zeta", "etaValue"]
+    pool = {
+        "snake": ["{}{}{}".format(rnd.choice(words), rnd.choice(words), i) for i in range(distinct)],
+        "tags": [", ".join(rnd.sample(words, 3)) + ", t{}".format(i) for i in range(distinct)],
+        "bool": [rnd.choice([" yes", "No ", "false", "1", "0", "ok", "无"]) + " " * (i % 3) for i in range(distinct)],
+    }
+    return {k: [rnd.choice(v) for _ in range(rows)] for k, v in pool.items()}
+
+
+def run(fn, values):
+    t0 = time.perf_counter()
+    for v in values:
+        fn(v)
+    return time.perf_counter() - t0
+
+
+def main(rows=1000000, distinct=300):
+    dialect = sqlite.dialect()
+    values = make_values(rows, distinct)
+    cases = [
+        ("SnakeField", SnakeField(64), values["snake"]),
+        ("StringTags", StringTags(128), values["tags"]),
+        ("SortedTags", SortedTags(), values["tags"]),
+        ("BoolField", BoolField(), values["bool"]),
+    ]
+    print("rows={} distinct={}".format(rows, distinct))
+    print("{:<12}{:>12}{:>12}{:>16}{:>10}".format("type", "legacy(s)", "memo(s)", "normalize(s)", "speedup"))
+    for name, tp, vs in cases:
+        impl = tp.dialect_impl(dialect)
+        impl_processor = impl.impl.bind_processor(dialect)
+        if name == "SnakeField":
+            legacy_param = lambda v, d: legacy_snake_case(v)
+        else:
+            legacy_param = impl.process_bind_param
+        if impl_processor:
+            legacy = lambda v: impl_processor(legacy_param(v, dialect))
+        else:
+            legacy = lambda v: legacy_param(v, dialect)
+        t_legacy = run(legacy, vs)
+        t_memo = run(impl.bind_processor(dialect), vs)
+        t0 = time.perf_counter()
+        tp.normalize_many(vs)
+        t_batch = time.perf_counter() - t0
+        print("{:<12}{:>12.2f}{:>12.2f}{:>16.2f}{:>9.1f}x".format(name, t_legacy, t_memo, t_batch, t_legacy / t_memo))
+        print("  memo_stats: {}".format(type(tp).memo_stats()))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,652 @@
+"""
+reproducible benchmark suite of the ORM helpers, column types and utils, on a sqlite file.
+
+each benchmark is timed `--repeat` times, a run calls the operation `--ops` times on a table of `--rows` rows,
+setup of a run (seeding rows, etc.) is not timed. results are the min/median microseconds per operation.
+
+usage:
+    python benchmarks/suite.py [--rows 10000] [--ops 200] [--repeat 7] [--only orm.,types.]
+    python benchmarks/suite.py --json baseline.json
+    python benchmarks/suite.py --baseline baseline.json [--threshold 0.1]  # exit 1 if regressed
+
+regressions are judged by min time, which is the least disturbed by other processes, the threshold is widened
+by the spread (median/min - 1) of both runs, and the regressed benchmarks are rerun `--confirm` times,
+so noisy benchmarks do not fail on unchanged code.
+    python benchmarks/suite.py --profile prof/  # prof/<name>.prof of one more run per benchmark
+
+flamegraph of a profile, eg: `flameprof prof/orm.insert.prof > insert.svg`, or `snakeviz prof/orm.insert.prof`
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import subprocess
+import cProfile
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+import sqlalchemy
+from flask import Flask
+from sqlalchemy.dialects import sqlite
+from pyco_sqlalchemy import utils, regex, transfer
+from pyco_sqlalchemy._types import BoolField, SnakeField, StringTags, SortedTags, JsonText, OrderedJson
+from pyco_sqlalchemy._flask import db, CoModel
+from pyco_sqlalchemy.instrument import instrument
+from pyco_sqlalchemy.cache import LRUCache
+
+# regression threshold of min time, the IO bound benchmarks are noisier
+THRESHOLDS = {"orm.": 0.25, "instrument.": 0.25, "transfer.": 0.25, "startup.": 0.25, "tags.": 0.25}
+DEFAULT_THRESHOLD = 0.10
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    # factory(env) => run() => count of operations, the factory is the untimed setup of a run
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+class Item(db.Model, CoModel):
+    __tablename__ = "bench_item"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(32), index=True)
+    grp = db.Column(db.Integer, index=True)
+    tags = db.Column(StringTags(128))
+    payload = db.Column(JsonText())
+
+
+class ImportItem(db.Model, CoModel):
+    __tablename__ = "bench_import_item"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(32))
+    grp = db.Column(db.Integer)
+    tags = db.Column(StringTags(128))
+    payload = db.Column(JsonText())
+
+
+class TaggedItem(db.Model, CoModel):
+    __tablename__ = "bench_tagged_item"
+    __tag_index__ = ("tags",)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tags = db.Column(StringTags(128))
+
+
+class Env(object):
+    """
+    rows: rows of the seeded table, ops: operations per run
+    """
+
+    def __init__(self, rows, ops, seed=0):
+        self.rows = rows
+        self.ops = ops
+        self.rnd = random.Random(seed)
+        self._seq = 0
+        self._fd, self.db_file = tempfile.mkstemp(suffix="sqlite.db")
+        self.url = "sqlite:///{}".format(self.db_file)
+        # directory of the files of benchmarks, eg: exported tables
+        self.tmp = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = self.url
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        Item.insert_many(self.make_row(i) for i in range(rows))
+
+    def make_row(self, i):
+        return dict(name="n{}".format(i), grp=i % 100, tags="t{}, t{}".format(i % 7, i % 11),
+                    payload=dict(i=i, tags=["a", "b"], nested=dict(k=i % 13)))
+
+    def seq(self):
+        self._seq += 1
+        return self.rows + self._seq
+
+    def ids(self, n):
+        return [self.rnd.randint(1, self.rows) for _ in range(n)]
+
+    def close(self):
+        db.session.remove()
+        self.ctx.pop()
+        os.close(self._fd)
+        os.unlink(self.db_file)
+        shutil.rmtree(self.tmp)
+
+
+def _fresh(env):
+    # drop the identity map between runs
+    db.session.remove()
+
+
+@benchmark("orm.insert")
+def bench_insert(env):
+    rows = [env.make_row(env.seq()) for _ in range(env.ops)]
+
+    def run():
+        for row in rows:
+            Item.insert(row)
+        return len(rows)
+    return run
+
+
+@benchmark("orm.upsert_one")
+def bench_upsert_one(env):
+    ids = env.ids(env.ops)
+    _fresh(env)
+
+    def run():
+        for i in ids:
+            Item.upsert_one(dict(name="n{}".format(i - 1)), grp=i % 50)
+        return len(ids)
+    return run
+
+
+@benchmark("orm.filter_by")
+def bench_filter_by(env):
+    groups = [env.rnd.randint(0, 99) for _ in range(env.ops)]
+    _fresh(env)
+
+    def run():
+        for g in groups:
+            Item.filter_by(grp=g)
+            db.session.expunge_all()
+        return len(groups)
+    return run
+
+
+@benchmark("orm.get_or_none")
+def bench_get_or_none(env):
+    ids = env.ids(env.ops)
+    _fresh(env)
+
+    def run():
+        for i in ids:
+            Item.get_or_none(id=i)
+        return len(ids)
+    return run
+
+
+def _page_items_bench(deep, **kws):
+    def factory(env):
+        offset = max(env.rows - 20, 0) if deep else 0
+        _fresh(env)
+
+        def run():
+            for _ in range(env.ops):
+                Item.page_items(limit=20, offset=offset, **kws)
+                db.session.expunge_all()
+            return env.ops
+        return run
+    return factory
+
+
+benchmark("orm.page_items.shallow")(_page_items_bench(deep=False))
+benchmark("orm.page_items.deep")(_page_items_bench(deep=True))
+benchmark("orm.page_items.deep_no_total")(_page_items_bench(deep=True, total="none"))
+
+
+@benchmark("orm.page_items.cursor")
+def bench_page_items_cursor(env):
+    # walk the whole table by keyset pagination, ops are pages
+    _fresh(env)
+
+    def run():
+        n = 0
+        cursor = ""
+        while cursor is not None:
+            page = Item.page_items(limit=100, cursor=cursor, total="none")
+            cursor = page["next_cursor"]
+            db.session.expunge_all()
+            n += 1
+        return n
+    return run
+
+
+@benchmark("orm.count")
+def bench_count(env):
+    groups = [env.rnd.randint(0, 99) for _ in range(env.ops)]
+
+    def run():
+        for g in groups:
+            Item.count(grp=g)
+        return len(groups)
+    return run
+
+
+@benchmark("orm.to_dict")
+def bench_to_dict(env):
+    items = Item.filter_by(grp=1)
+
+    def run():
+        n = 0
+        for _ in range(max(env.ops // len(items), 1)):
+            for m in items:
+                m.to_dict()
+                n += 1
+        return n
+    return run
+
+
+@benchmark("orm.update")
+def bench_update(env):
+    _fresh(env)
+    items = [Item.get_or_none(id=i) for i in env.ids(env.ops)]
+
+    def run():
+        for m in items:
+            m.update(grp=env.rnd.randint(0, 99), tags="u1,u2")
+        return len(items)
+    return run
+
+
+@benchmark("orm.discard")
+def bench_discard(env):
+    ids = Item.insert_many([env.make_row(env.seq()) for _ in range(env.ops)], return_pks=True)
+
+    def run():
+        for i in ids:
+            Item.discard(id=i)
+        return len(ids)
+    return run
+
+
+def _instrumented(factory):
+    # the operations of factory while `instrument` is enabled, its overhead is the ratio to the plain benchmark
+    def wrapped(env):
+        run = factory(env)
+
+        def instrumented_run():
+            # N+1 detection is off, the operations repeat the same statements
+            instrument.enable(slow_ms=None, n_plus_one=None)
+            try:
+                return run()
+            finally:
+                instrument.disable()
+        return instrumented_run
+    return wrapped
+
+
+benchmark("instrument.get_or_none")(_instrumented(bench_get_or_none))
+benchmark("instrument.filter_by")(_instrumented(bench_filter_by))
+benchmark("instrument.to_dict")(_instrumented(bench_to_dict))
+
+
+def _result_cached(factory):
+    # the operations of factory through a new `_result_cache` of Item, ratio to the plain benchmark is the gain
+    def wrapped(env):
+        run = factory(env)
+
+        def cached_run():
+            Item._result_cache = LRUCache(maxsize=1000, ttl=60)
+            try:
+                return run()
+            finally:
+                Item._result_cache = None
+        return cached_run
+    return wrapped
+
+
+benchmark("orm.filter_by.cached")(_result_cached(bench_filter_by))
+benchmark("orm.page_items.shallow.cached")(_result_cached(BENCHMARKS["orm.page_items.shallow"]))
+benchmark("orm.count.cached")(_result_cached(bench_count))
+
+
+def _export_bench(workers):
+    def factory(env):
+        # ops are the exported rows
+        _fresh(env)
+        out = tempfile.mkdtemp(dir=env.tmp)
+
+        def run():
+            return transfer.export_table(Item, env.url, out, workers=workers, partitions=max(workers, 1))["rows"]
+        return run
+    return factory
+
+
+benchmark("transfer.export_table")(_export_bench(workers=0))
+benchmark("transfer.export_table.workers")(_export_bench(workers=2))
+
+
+@benchmark("transfer.import_file")
+def bench_import_file(env):
+    # ops are the imported rows of a JSONL file, into an empty table
+    path = os.path.join(env.tmp, "import.jsonl")
+    with open(path, "w") as fp:
+        for i in range(env.ops * 10):
+            fp.write(json.dumps(env.make_row(i)) + "\n")
+    with db.engine.begin() as conn:
+        conn.execute(ImportItem.__table__.delete())
+
+    def run():
+        return ImportItem.import_file(path, chunk_size=1000, resume=False)["rows"]
+    return run
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cold start of an app: import, `db.warmup` if enabled, and the first request,
+# a model with a relationship makes mappers non-trivial
+STARTUP_CODE = """
+import os, tempfile
+from flask import Flask
+from pyco_sqlalchemy._flask import db, CoModel
+
+
+class Author(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(32))
+    books = db.relationship("Book", backref="author")
+
+
+class Book(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey("author.id"))
+    title = db.Column(db.String(32))
+
+
+db_file = os.path.join(tempfile.mkdtemp(dir={tmp!r}), "startup.db")
+app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + db_file
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_WARMUP"] = {warmup}
+db.init_app(app)
+with app.app_context():
+    db.create_all()
+    db.engine.execute(Author.__table__.insert(), dict(id=1, name="a"))
+    a = Author.get_or_none(id=1)
+    a.to_dict()
+    Book.filter_by(author_id=a.id)
+"""
+
+
+def _startup_bench(code, **kws):
+    def factory(env):
+        # ops are new interpreters, the time includes the start of the interpreter
+        proc_env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        argv = [sys.executable, "-c", code.format(tmp=env.tmp, **kws)]
+        n = max(env.ops // 200, 1)
+
+        def run():
+            for _ in range(n):
+                subprocess.run(argv, env=proc_env, check=True, capture_output=True)
+            return n
+        return run
+    return factory
+
+
+for _module in ("pyco_sqlalchemy", "pyco_sqlalchemy.utils", "pyco_sqlalchemy.transfer",
+                "pyco_sqlalchemy._asyncio", "pyco_sqlalchemy._flask"):
+    benchmark("startup.import" + _module[len("pyco_sqlalchemy"):])(_startup_bench("import " + _module))
+benchmark("startup.first_request")(_startup_bench(STARTUP_CODE, warmup=False))
+benchmark("startup.first_request.warmup")(_startup_bench(STARTUP_CODE, warmup=True))
+
+
+def _tags_bench(query):
+    def factory(env):
+        # ops are queries of the tags of 1/1000 rows, seeded on the first use
+        _fresh(env)
+        if not TaggedItem.count():
+            TaggedItem.insert_many(dict(tags="t{},g{}".format(i % 1000, i % 7)) for i in range(1, env.rows + 1))
+            TaggedItem.rebuild_tag_index(batch_size=10000)
+        n = max(env.ops // 10, 1)
+
+        def run():
+            for _ in range(n):
+                query()
+                db.session.expunge_all()
+            return n
+        return run
+    return factory
+
+
+benchmark("tags.like.any_of")(_tags_bench(lambda: TaggedItem.query.filter(TaggedItem.tags.like("%t42,%")).all()))
+benchmark("tags.index.any_of")(_tags_bench(lambda: TaggedItem.filter_by_tags("tags", any_of="t42")))
+benchmark("tags.like.all_of")(_tags_bench(
+    lambda: TaggedItem.query.filter(TaggedItem.tags.like("%t42,%"), TaggedItem.tags.like("%g0%")).all()))
+benchmark("tags.index.all_of")(_tags_bench(lambda: TaggedItem.filter_by_tags("tags", all_of="t42,g0")))
+
+
+def _type_values(rnd, n):
+    words = ["alpha", "Beta", "gammaRay", "HTTPCode", "delta"]
+    return dict(
+        snake=["{}{}{}".format(rnd.choice(words), rnd.choice(words), i % 300) for i in range(n)],
+        tags=["{}, {}, t{}".format(rnd.choice(words), rnd.choice(words), i % 300) for i in range(n)],
+        bool=[rnd.choice([" yes", "No ", "false", "1", "0"]) for _ in range(n)],
+        json=[dict(i=i, name=rnd.choice(words), values=list(range(i % 10))) for i in range(n)],
+    )
+
+
+_TYPES = [
+    ("snake", SnakeField(64)),
+    ("tags", StringTags(128)),
+    ("tags", SortedTags()),
+    ("bool", BoolField()),
+    ("json", JsonText()),
+    ("json", OrderedJson()),
+]
+
+
+@benchmark("types.bind")
+def bench_types_bind(env):
+    dialect = sqlite.dialect()
+    values = _type_values(env.rnd, env.ops * 10)
+    processors = [(tp.dialect_impl(dialect).bind_processor(dialect), values[key]) for key, tp in _TYPES]
+
+    def run():
+        n = 0
+        for process, vs in processors:
+            if process is None:
+                continue
+            for v in vs:
+                process(v)
+            n += len(vs)
+        return n
+    return run
+
+
+@benchmark("types.result")
+def bench_types_result(env):
+    dialect = sqlite.dialect()
+    values = _type_values(env.rnd, env.ops * 10)
+    processors = []
+    for key, tp in _TYPES:
+        impl = tp.dialect_impl(dialect)
+        bind = impl.bind_processor(dialect) or (lambda v: v)
+        result = impl.result_processor(dialect, None)
+        if result is not None:
+            processors.append((result, [bind(v) for v in values[key]]))
+
+    def run():
+        n = 0
+        for process, vs in processors:
+            for v in vs:
+                process(v)
+            n += len(vs)
+        return n
+    return run
+
+
+@benchmark("utils.parse_date")
+def bench_parse_date(env):
+    t0 = datetime(2021, 3, 22, 20, 32, 2)
+    fmts = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%SZ", "%Y/%m/%d %H:%M", "%d %b %Y %H:%M:%S", "%Y-%m-%d"]
+    values = [(t0.replace(day=1 + i % 28)).strftime(fmts[i % len(fmts)]) for i in range(env.ops * 10)]
+    values += [str(1616416322 + i) for i in range(env.ops)]
+
+    def run():
+        for v in values:
+            utils.parse_date(v)
+        return len(values)
+    return run
+
+
+def _json_docs(n):
+    t0 = datetime(2021, 3, 22, 20, 32, 2)
+    return [dict(id=i, name="n{}".format(i), created_time=t0, tags=["a", "b"], nested=dict(k=i)) for i in range(n)]
+
+
+@benchmark("utils.json_dumps")
+def bench_json_dumps(env):
+    docs = _json_docs(env.ops * 10)
+
+    def run():
+        for d in docs:
+            utils.json_dumps(d)
+        return len(docs)
+    return run
+
+
+@benchmark("utils.json_stringify")
+def bench_json_stringify(env):
+    docs = _json_docs(env.ops * 10)
+    for d in docs:
+        d["obj"] = object()
+
+    def run():
+        for d in docs:
+            utils.json_stringify(d)
+        return len(docs)
+    return run
+
+
+@benchmark("regex")
+def bench_regex(env):
+    words = ["getHTTPResponseCode", "user_name", "Hello World-2", "XMLHttpRequest", " a.b,c "]
+    values = [words[i % len(words)] + str(i % 50) for i in range(env.ops * 10)]
+    funcs = [regex.snake_case, regex.camel_case, regex.title_case, regex.alphanumeric, regex.simple_case]
+
+    def run():
+        for f in funcs:
+            for v in values:
+                f(v)
+        return len(values) * len(funcs)
+    return run
+
+
+def run_benchmark(env, factory, repeat, profile_path=None):
+    # one untimed run to warm up caches, eg: memoized binds, compiled statements
+    factory(env)()
+    times = []
+    for _ in range(repeat):
+        run = factory(env)
+        t0 = time.perf_counter()
+        n = run()
+        times.append((time.perf_counter() - t0) / n * 1e6)
+    if profile_path:
+        run = factory(env)
+        prof = cProfile.Profile()
+        prof.runcall(run)
+        prof.dump_stats(profile_path)
+    return dict(ops=n, min_us=min(times), median_us=statistics.median(times), ops_per_sec=1e6 / statistics.median(times))
+
+
+def threshold_of(name, default=DEFAULT_THRESHOLD):
+    for prefix, threshold in THRESHOLDS.items():
+        if name.startswith(prefix):
+            return max(threshold, default)
+    return default
+
+
+def spread_of(r):
+    return r["median_us"] / r["min_us"] - 1 if r["min_us"] else 0
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # => [(name, ratio, regressed)], ratio of min time current/baseline,
+    # the threshold is widened by the spread of the runs of both
+    rows = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = r["min_us"] / base["min_us"]
+        limit = threshold_of(name, threshold) + spread_of(r) + spread_of(base)
+        rows.append((name, ratio, ratio > 1 + limit))
+    return rows
+
+
+def run_suite(names, args, profile=None):
+    # => {name: result}, on a new seeded table
+    env = Env(args.rows, args.ops, seed=args.seed)
+    results = {}
+    print("{:<32}{:>8}{:>12}{:>12}{:>12}".format("benchmark", "ops", "min(us)", "median(us)", "ops/s"))
+    try:
+        for name in names:
+            prof = os.path.join(profile, name + ".prof") if profile else None
+            r = results[name] = run_benchmark(env, BENCHMARKS[name], args.repeat, prof)
+            print("{:<32}{:>8}{:>12.2f}{:>12.2f}{:>12.0f}".format(
+                name, r["ops"], r["min_us"], r["median_us"], r["ops_per_sec"]))
+    finally:
+        env.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="rows of the seeded table")
+    parser.add_argument("--ops", type=int, default=200, help="operations per run")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default="", help="comma separated prefixes of benchmark names")
+    parser.add_argument("--json", help="write results to the JSON file")
+    parser.add_argument("--baseline", help="compare with the JSON file of a previous run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="max ratio of slowdown, the orm.* benchmarks use at least {}".format(THRESHOLDS["orm."]))
+    parser.add_argument("--confirm", type=int, default=2, help="reruns of the regressed benchmarks against --baseline")
+    parser.add_argument("--profile", help="directory of cProfile outputs")
+    args = parser.parse_args(argv)
+
+    prefixes = [p for p in args.only.split(",") if p]
+    names = [name for name in BENCHMARKS if not prefixes or any(name.startswith(p) for p in prefixes)]
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    results = run_suite(names, args, args.profile)
+
+    report = dict(
+        meta=dict(
+            time=datetime.now().isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            sqlalchemy=sqlalchemy.__version__,
+            sqlite=sqlite3.sqlite_version,
+            rows=args.rows, ops=args.ops, repeat=args.repeat, seed=args.seed,
+        ),
+        results=results,
+    )
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)["results"]
+        rows = compare(results, baseline, args.threshold)
+        # noise only slows down, rerun the regressed ones and keep the best
+        for _ in range(args.confirm):
+            regressed = [name for name, _, regressed in rows if regressed]
+            if not regressed:
+                break
+            print("\nrerun {}".format(", ".join(regressed)))
+            for name, r in run_suite(regressed, args).items():
+                if r["min_us"] < results[name]["min_us"]:
+                    results[name] = r
+            rows = compare(results, baseline, args.threshold)
+        print("\n{:<32}{:>10}".format("vs baseline", "ratio"))
+        for name, ratio, regressed in rows:
+            print("{:<32}{:>9.2f}x{}".format(name, ratio, "  REGRESSED" if regressed else ""))
+        if any(regressed for _, _, regressed in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,3 +26,32 @@ _UTF8MB4 = "utf8mb4_unicode_ci"
 BINARY = "BINARY"
 NOCASE = "NOCASE"
 RTRIM = "RTRIM"
+
+# public names are imported from their submodules on first access, eg: `from pyco_sqlalchemy import db`,
+# so `import pyco_sqlalchemy` does not import flask/flask_sqlalchemy/sqlalchemy.
+_LAZY_NAMES = {
+    "db": "._flask",
+    "BaseModel": "._flask",
+    "CoModel": "._flask",
+    "db_session_maker": "._flask",
+    "batch_writes": "._flask",
+    "primary_reads": "._flask",
+    "adb": "._asyncio",
+    "AsyncBaseModel": "._asyncio",
+    "AsyncCoModel": "._asyncio",
+    "async_db_session_maker": "._asyncio",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    import importlib
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -0,0 +1,281 @@
+"""
+asyncio variant of `_flask.BaseModel`, for ASGI services.
+require:
+    SQLAlchemy>=1.4
+    an async driver, eg: aiosqlite, asyncpg, aiomysql
+
+>>> from pyco_sqlalchemy._asyncio import adb, AsyncBaseModel
+>>> class User(adb.Model, AsyncBaseModel):
+        id = Column(Integer, primary_key=True)
+>>> adb.init_engine("sqlite+aiosqlite:///app.db")
+>>> async with async_db_session_maker(auto_close=True):
+        user = await User.insert(id=1)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import func, select, delete
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_scoped_session
+from . import utils
+from .utils import pformat
+from ._base import logger, errors, ModelMixin, CoMixin
+
+
+class AsyncSQLAlchemy(object):
+    """
+    - Model: declarative base of async models
+    - session: `AsyncSession` scoped per asyncio task, call `await session.remove()` at the end of a task,
+        or use `async_db_session_maker(auto_close=True)`
+    """
+
+    def __init__(self):
+        self.Model = declarative_base()
+        self.engine = None
+        # ORM objects are not refreshed after commit, the lazy IO is not allowed under asyncio
+        factory = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+        self.session = async_scoped_session(factory, scopefunc=asyncio.current_task)
+
+    def init_engine(self, url, **engine_kws):
+        self.engine = create_async_engine(url, **engine_kws)
+        self.session.configure(bind=self.engine)
+        return self.engine
+
+    async def create_all(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(self.Model.metadata.create_all)
+
+    async def drop_all(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(self.Model.metadata.drop_all)
+
+    async def dispose(self):
+        await self.session.remove()
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+adb = AsyncSQLAlchemy()
+
+
+@asynccontextmanager
+async def async_db_session_maker(auto_commit=False, auto_close=False):
+    # same as `_flask.db_session_maker`, the session is scoped per asyncio task
+    sess = adb.session
+    try:
+        yield sess
+        if auto_commit:
+            try:
+                await sess.commit()
+            except Exception as e:
+                logger.exception(e)
+                await sess.rollback()
+                raise e
+    finally:
+        if auto_close:
+            await sess.remove()
+
+
+class AsyncBaseModel(ModelMixin):
+    """ sample:
+    >>> class TableName(adb.Model, AsyncBaseModel):
+        pass
+    >>> m = await TableName.get_or_none(id=1)
+    """
+
+    @classmethod
+    async def insert(cls, data=None, **kwargs):
+        m = cls.initial(data, **kwargs)
+        await m.save()
+        return m
+
+    @classmethod
+    def _make_query(cls, condition=None, query=None, limit=None, offset=None, order_by=None,
+                    only=None, defer=None, load=None, **condition_kws):
+        # returns `select(cls)`, execute it by `adb.session`
+        # NOTE: lazy loading raises under asyncio, load relationships by `load`
+        condition = cls.strict_form(condition, **condition_kws)
+        stmt = query if query is not None else select(cls)
+        stmt = stmt.filter_by(**condition)
+        options = cls._load_options(only, defer, load)
+        if options:
+            stmt = stmt.options(*options)
+        if isinstance(order_by, (list, tuple)):
+            stmt = stmt.order_by(*order_by)
+        elif order_by is not None:
+            stmt = stmt.order_by(order_by)
+        if isinstance(limit, int) and limit >= 0:
+            stmt = stmt.limit(limit)
+            if isinstance(offset, int) and offset >= 0:
+                stmt = stmt.offset(offset)
+        return stmt
+
+    @staticmethod
+    async def _all(stmt):
+        result = await adb.session.execute(stmt)
+        return result.scalars().all()
+
+    @classmethod
+    async def discard(cls, condition=None, limit=1, **condition_kws):
+        # In Case of incorrect operation, default limit 1;
+        condition = cls.strict_form(condition, **condition_kws)
+        async with async_db_session_maker() as sess:
+            result = await sess.execute(delete(cls).filter_by(**condition))
+            n = result.rowcount
+            if limit and limit < n:
+                await sess.rollback()
+                msg = "You're trying discard {} rows of {}, which is over limit={}".format(n, cls.__name__, limit)
+                raise errors.SecurityError(msg)
+            else:
+                await sess.commit()
+            return n
+
+    @classmethod
+    async def _seek_page(cls, stmt, limit, order_by, cursor):
+        keys = cls._order_keys(order_by)
+        if cursor:
+            try:
+                values = utils.decode_cursor(cursor)
+                assert len(values) == len(keys)
+            except Exception:
+                raise errors.BadRequest("Invalid cursor of {}: {}".format(cls.__name__, cursor))
+            stmt = stmt.filter(cls._seek_condition(keys, values))
+        stmt = stmt.order_by(*[col.desc() if is_desc else col.asc() for col, _, is_desc in keys])
+        if limit > 0:
+            items = await cls._all(stmt.limit(limit + 1))
+            has_more = len(items) > limit
+            items = items[:limit]
+        elif limit == 0:
+            items = []
+            has_more = bool(await cls._all(stmt.limit(1)))
+        else:
+            items = await cls._all(stmt)
+            has_more = False
+        next_cursor = None
+        if has_more and items:
+            next_cursor = utils.encode_cursor([getattr(items[-1], k) for _, k, _ in keys])
+        elif has_more:
+            next_cursor = cursor
+        return dict(limit=limit, next_cursor=next_cursor, has_more=has_more, items=items)
+
+    @classmethod
+    async def _count_rows(cls, stmt, total="exact"):
+        # same strategies as `_flask.BaseModel._count_rows`, but "estimate" is always counted exactly
+        pk = getattr(cls, cls._schema().primary_keys[0])
+        if total == "none":
+            return None
+        elif isinstance(total, str) and total.startswith("capped:"):
+            cap = int(total[len("capped:"):])
+            sub = stmt.with_only_columns(pk).limit(cap).subquery()
+            stmt = select(func.count()).select_from(sub)
+        elif total in ("exact", "estimate"):
+            stmt = stmt.with_only_columns(func.count(pk)).order_by(None)
+        else:
+            raise ValueError("Unknown count strategy of {}: {}".format(cls.__name__, total))
+        return (await adb.session.execute(stmt)).scalar()
+
+    @classmethod
+    async def page_items(cls, condition=None, limit=10, offset=0, order_by=None, cursor=None, total="exact",
+                         **condition_kws):
+        # refer: `_flask.BaseModel.page_items`
+        stmt = cls._make_query(condition, **condition_kws)
+        n = await cls._count_rows(stmt, total)
+        if cursor is not None:
+            page = await cls._seek_page(stmt, limit, order_by, cursor)
+            page.update(total=n)
+            return page
+        if isinstance(order_by, (list, tuple)):
+            stmt = stmt.order_by(*order_by)
+        elif order_by is not None:
+            stmt = stmt.order_by(order_by)
+        if total == "exact":
+            if limit > 0:
+                items = await cls._all(stmt.limit(limit).offset(offset))
+            elif limit == 0:
+                items = []
+            else:
+                items = await cls._all(stmt)
+            has_more = n > offset + len(items)
+        elif limit > 0:
+            items = await cls._all(stmt.limit(limit + 1).offset(offset))
+            has_more = len(items) > limit
+            items = items[:limit]
+        elif limit == 0:
+            items = []
+            has_more = bool(await cls._all(stmt.offset(offset).limit(1)))
+        else:
+            items = await cls._all(stmt.offset(offset))
+            has_more = False
+        next_offset = offset + len(items)
+        return dict(total=n, limit=limit, next_offset=next_offset, has_more=has_more, items=items)
+
+    @classmethod
+    async def filter_by(cls, condition=None, **condition_kws):
+        stmt = cls._make_query(condition, **condition_kws)
+        return await cls._all(stmt)
+
+    @classmethod
+    async def count(cls, condition=None, total="exact", **condition_kws):
+        stmt = cls._make_query(condition, **condition_kws)
+        return await cls._count_rows(stmt, total)
+
+    @classmethod
+    async def get_or_none(cls, condition=None, only=None, defer=None, load=None, **condition_kws):
+        stmt = cls._make_query(condition, only=only, defer=defer, load=load, **condition_kws)
+        result = await adb.session.execute(stmt)
+        return result.scalars().one_or_none()
+
+    @classmethod
+    async def upsert_one(cls, condition: dict, **updated_kws):
+        m = await cls.get_or_none(condition)
+        if isinstance(m, cls):
+            await m.update(updated_kws)
+        else:
+            m = await cls.insert(condition, **updated_kws)
+        return m
+
+    @classmethod
+    async def getOr404(cls, **condition_kws):
+        m = await cls.get_or_none(condition_kws)
+        if isinstance(m, cls):
+            return m
+        else:
+            name = cls.__name__
+            msg = "Data Not Found: {}: {}".format(name, pformat(condition_kws))
+            raise errors.NotFound(msg)
+
+    async def update(self, form=None, __force=False, **kwargs):
+        is_modified = self._set_form(form, __force, **kwargs)
+        if is_modified:
+            await self.save()
+
+    async def save(self):
+        sess = adb.session
+        sess.add(self)
+        try:
+            await sess.commit()
+        except Exception:
+            await sess.rollback()
+            raise
+
+    async def remove(self):
+        sess = adb.session
+        await sess.delete(self)
+        await sess.commit()
+
+
+class AsyncCoModel(CoMixin, AsyncBaseModel):
+
+    @classmethod
+    async def lastOrNone(cls, only=None, defer=None, load=None, **kwargs):
+        order_by = kwargs.pop("order_by", cls.created_time.desc())
+        stmt = cls._make_query(kwargs, limit=1, order_by=order_by, only=only, defer=defer, load=load)
+        result = await adb.session.execute(stmt)
+        return result.scalars().one_or_none()
+
+    @classmethod
+    async def lastOr404(cls, **kwargs):
+        m = await cls.lastOrNone(**kwargs)
+        if isinstance(m, cls):
+            return m
+        msg = "Data Not Found: {}: {}".format(cls.__name__, pformat(kwargs))
+        raise errors.NotFound(msg)
@@ -0,0 +1,325 @@
+"""
+framework-independent parts of the models, shared by `_flask.BaseModel` and `_asyncio.AsyncBaseModel`.
+"""
+import os
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, inspect, event, and_, or_, tuple_, literal
+from sqlalchemy.orm import configure_mappers, load_only, selectinload, joinedload, defer as orm_defer
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm.attributes import InstrumentedAttribute, flag_modified
+from . import utils
+from .serializer import ModelSerializer
+
+errors = utils.LazyModule("werkzeug.exceptions")
+
+logger_name = os.environ.get("FLASK_SQL_LOGGER", "flask.app")
+logger = logging.getLogger(logger_name)
+
+_EAGER_LOADERS = dict(selectin=selectinload, joined=joinedload)
+
+
+class ModelSchema(object):
+    """
+    precomputed schema of a mapped BaseModel, built once when its mapper is configured.
+    - keys: attribute names accepted by `strict_form`
+    - column_names: names of table columns
+    - primary_keys: names of primary key columns
+    - immutable_keys: keys ignored by `update`, refer: `_immutable_keys`
+    - column_attrs: column name => attribute name
+    - attr_columns: attribute name => column key, for Core statements
+    """
+    __slots__ = ('keys', 'column_names', 'primary_keys', 'immutable_keys', 'column_attrs', 'attr_columns')
+
+    def __init__(self, cls):
+        mapper = inspect(cls)
+        tbl = cls.__table__
+        self.keys = frozenset(
+            k for k, v in mapper.class_manager.items() if isinstance(v, InstrumentedAttribute)
+        )
+        self.column_names = frozenset(c.name for c in tbl.columns)
+        self.primary_keys = tuple(c.name for c in tbl.primary_key.columns)
+        column_attrs = {}
+        attr_columns = {}
+        for prop in mapper.column_attrs:
+            col = prop.columns[0]
+            if col.table is tbl:
+                column_attrs.setdefault(col.name, prop.key)
+                attr_columns[prop.key] = col.key
+        self.column_attrs = tuple((c.name, column_attrs.get(c.name, c.name)) for c in tbl.columns)
+        self.attr_columns = attr_columns
+        # NOTE: `_immutable_keys` may be overridden, and it reads `primary_keys` from here
+        self.immutable_keys = ()
+        cls._schema_cache = self
+        self.immutable_keys = frozenset(cls._immutable_keys())
+
+
+class ModelMixin(object):
+    """
+    schema/form helpers of a mapped model, without session.
+    """
+
+    @classmethod
+    def columns(cls):
+        tbl = getattr(cls, "__table__", None)
+        if tbl is None:
+            name = cls.__name__
+            desc = 'Service Unavailable: DbModel<{}> '.format(name)
+            msg = "API-ERROR:{}\nDbModel<{}> must be subclass of db.Model!".format(desc, name)
+            logger.exception(msg)
+            raise errors.ServiceUnavailable(desc)
+        else:
+            return tbl.columns
+
+    @classmethod
+    def _schema(cls) -> ModelSchema:
+        schema = cls.__dict__.get('_schema_cache')
+        if schema is None:
+            cls.columns()
+            configure_mappers()
+            schema = cls.__dict__.get('_schema_cache') or ModelSchema(cls)
+        return schema
+
+    @classmethod
+    def serializer(cls) -> ModelSerializer:
+        ser = cls.__dict__.get('_serializer_cache')
+        if ser is None:
+            ser = cls._serializer_cache = ModelSerializer(cls)
+        return ser
+
+    @classmethod
+    def dumps_many(cls, items):
+        # compact JSON bytes of models (eg: `cls.filter_by()`), compatible with `utils.json_stringify`
+        return cls.serializer().dumps(items)
+
+    @classmethod
+    def dump_many(cls, items, fp, batch_size=1000):
+        # write models (eg: `cls.iter_by()`) as JSON array to a writable stream, return count of rows
+        return cls.serializer().dump(items, fp, batch_size=batch_size)
+
+    @classmethod
+    def primary_keys(cls):
+        return list(cls._schema().primary_keys)
+
+    @classmethod
+    def _immutable_keys(cls):
+        # limit columns should not updated by cls.update(form)
+        pks = cls.primary_keys()
+        return pks
+
+    @classmethod
+    def strict_form(cls, data=None, **kwargs):
+        if data is None:
+            data = kwargs
+        elif isinstance(data, dict):
+            if kwargs:
+                data2 = dict(**data)
+                data2.update(kwargs)
+                data = data2
+        else:
+            raise TypeError('data value must be dict or None')
+
+        keys = cls._schema().keys
+        form = {k: v for k, v in data.items() if k in keys}
+        return form
+
+    @classmethod
+    def _insert_form(cls, data=None, **kwargs):
+        # form of a new row, shared by cls.initial and cls.insert_many
+        return cls.strict_form(data, **kwargs)
+
+    @classmethod
+    def _chunk_defaults(cls):
+        # values filled once per chunk of cls.insert_many, if absent in the row
+        return {}
+
+    @classmethod
+    def initial(cls, data=None, **kwargs):
+        form = cls._insert_form(data, **kwargs)
+        m = cls(**form)
+        return m
+
+    @classmethod
+    def _order_keys(cls, order_by=None):
+        # [(column, attribute_key, is_desc), ...] of order_by, ends with primary keys as tie-breaker
+        if order_by is None:
+            order_by = []
+        elif not isinstance(order_by, (list, tuple)):
+            order_by = [order_by]
+        mapper = inspect(cls)
+        keys = []
+        for ob in order_by:
+            is_desc = False
+            if isinstance(ob, str):
+                ob = getattr(cls, ob)
+            if isinstance(ob, UnaryExpression) and ob.modifier in (operators.desc_op, operators.asc_op):
+                is_desc = ob.modifier is operators.desc_op
+                ob = ob.element
+            if isinstance(ob, InstrumentedAttribute):
+                ob = ob.__clause_element__()
+            try:
+                prop = mapper.get_property_by_column(ob)
+            except Exception:
+                raise ValueError("order_by of {} must be mapped columns: {}".format(cls.__name__, ob))
+            keys.append((ob, prop.key, is_desc))
+
+        is_desc = keys[-1][2] if keys else False
+        attrs = {k for _, k, _ in keys}
+        column_attrs = dict(cls._schema().column_attrs)
+        for name in cls._schema().primary_keys:
+            attr = column_attrs[name]
+            if attr not in attrs:
+                keys.append((getattr(cls, attr).__clause_element__(), attr, is_desc))
+        return keys
+
+    @staticmethod
+    def _seek_condition(keys, values):
+        # rows after $values in the order of $keys, eg: `WHERE (k, pk) > (v, pk_v)`
+        if len({is_desc for _, _, is_desc in keys}) == 1:
+            left = tuple_(*[col for col, _, _ in keys])
+            right = tuple_(*[literal(v, col.type) for (col, _, _), v in zip(keys, values)])
+            return left < right if keys[0][2] else left > right
+        clauses = []
+        for i, (col, _, is_desc) in enumerate(keys):
+            eqs = [c == v for (c, _, _), v in zip(keys[:i], values[:i])]
+            clauses.append(and_(*eqs, col < values[i] if is_desc else col > values[i]))
+        return or_(*clauses)
+
+    @classmethod
+    def _load_options(cls, only=None, defer=None, load=None):
+        """
+        loader options of a query:
+        :param only: attribute names to load, the others are deferred, primary keys are always loaded
+        :param defer: attribute names to defer
+        :param load: relationships to load eagerly, names by `selectinload`, or {name: "selectin" | "joined"}
+        """
+        options = []
+        if only:
+            options.append(load_only(*[cls._load_attr(k) for k in only]))
+        for k in defer or ():
+            options.append(orm_defer(cls._load_attr(k)))
+        if isinstance(load, str):
+            load = [load]
+        if isinstance(load, (list, tuple)):
+            load = dict.fromkeys(load, "selectin")
+        for k, strategy in (load or {}).items():
+            loader = _EAGER_LOADERS.get(strategy)
+            if loader is None:
+                raise ValueError("Unknown load strategy of {}.{}: {}".format(cls.__name__, k, strategy))
+            options.append(loader(cls._load_attr(k)))
+        return options
+
+    @classmethod
+    def _load_attr(cls, key):
+        attr = getattr(cls, key, None) if isinstance(key, str) else key
+        if not isinstance(attr, InstrumentedAttribute):
+            raise ValueError("{} has no mapped attribute: {}".format(cls.__name__, key))
+        return attr
+
+    def to_dict(self, **kwargs):
+        d = dict(_type=self.__class__.__name__)
+        loaded = self.__dict__
+        state = loaded.get('_sa_instance_state')
+        # columns deferred by `only/defer` of the query are left out instead of lazy loading,
+        # their loaders are set on the state until loaded or expired
+        deferred = state.callables if state is not None else None
+        for name, attr in self._schema().column_attrs:
+            if deferred and attr in deferred and attr not in loaded:
+                continue
+            d[name] = getattr(self, attr)
+        d.update(kwargs)
+        return d
+
+    @classmethod
+    def _update_values(cls, values=None, force=False, **kwargs):
+        # values of `strict_form` to update rows, without immutable keys unless force
+        data = cls.strict_form(values, **kwargs)
+        if not force:
+            keys = cls._schema().immutable_keys
+            for k in [k for k in data if k in keys]:
+                msg = "Immutable Field {}.{}, ignore updating `{}`".format(cls.__name__, k, data.pop(k))
+                logger.warning(msg)
+        return data
+
+    def _set_form(self, form=None, force=False, **kwargs):
+        # set the mutable fields of form, return True if any modified
+        data = self.strict_form(form, **kwargs)
+        keys = self._schema().immutable_keys
+        is_modified = False
+        for k, v in data.items():
+            is_mutable = k not in keys
+            if force or is_mutable:
+                is_modified = True
+                setattr(self, k, v)
+                if isinstance(v, (dict, list, tuple)):
+                    flag_modified(self, k)
+            else:
+                v0 = getattr(self, k, None)
+                tp = self.__class__.__name__
+                msg = "Immutable Field {}.{}, ignore updating `{} => {}`".format(tp, k, v0, v)
+                logger.warning(msg)
+        return is_modified
+
+
+@event.listens_for(ModelMixin, 'mapper_configured', propagate=True)
+def _build_schema(mapper, cls):
+    # rebuild even if built before, relationships/backrefs are complete now
+    ModelSchema(cls)
+
+
+class CoMixin(ModelMixin):
+    """
+    - __created_index__: declare an index of `created_time`, used by `lastOrNone/range_by/latest_per`
+    - __created_group__: column name, eg: "device_id", the index is composite of (group, created_time)
+    """
+    __created_index__ = True
+    __created_group__ = None
+
+    @declared_attr
+    def created_time(self):
+        return Column(DateTime, default=utils.now)
+
+    @declared_attr
+    def updated_time(self):
+        return Column(DateTime, default=utils.now, onupdate=utils.now)
+
+    @classmethod
+    def _insert_form(cls, data=None, **kwargs):
+        form = cls.strict_form(data, **kwargs)
+        created_time = form.pop('created_time', None)
+        if isinstance(created_time, datetime):
+            form['created_time'] = created_time
+        elif isinstance(created_time, str):
+            form['created_time'] = utils.parse_date(created_time)
+
+        updated_time = form.pop('updated_time', None)
+        if isinstance(updated_time, datetime):
+            form['updated_time'] = updated_time
+        elif isinstance(updated_time, str):
+            form['updated_time'] = utils.parse_date(updated_time)
+        return form
+
+    @classmethod
+    def _chunk_defaults(cls):
+        # call `utils.now` once per chunk, instead of column default per row
+        t = utils.now()
+        return dict(created_time=t, updated_time=t)
+
+
+@event.listens_for(CoMixin, 'instrument_class', propagate=True)
+def _created_index(mapper, cls):
+    tbl = mapper.local_table
+    if not cls.__created_index__ or tbl is None or "created_time" not in tbl.c:
+        return
+    group = cls.__created_group__
+    cols = [tbl.c[group], tbl.c.created_time] if group else [tbl.c.created_time]
+    names = [c.name for c in cols]
+    # declared already, or inherited by single table inheritance
+    for ix in tbl.indexes:
+        if [c.name for c in ix.columns][:len(names)] == names:
+            return
+    if len(cols) == 1 and cols[0].index:
+        return
+    Index("ix_{}_{}".format(tbl.name, "_".join(names)), *cols)
@@ -1,24 +1,236 @@
 """
 require:
-    Flask-SQLAlchemy>=2.4.0
+    SQLAlchemy>=1.4
+    Flask-SQLAlchemy>=2.5.0
+
+read replicas(optional), the read helpers of BaseModel are routed to replicas of the default bind:
+    SQLALCHEMY_BINDS = {"replica1": "mysql://...", "replica2": "mysql://..."}
+    SQLALCHEMY_REPLICA_BINDS = ["replica1", "replica2"]
+    SQLALCHEMY_REPLICA_STRATEGY = "round_robin"  # or "least_latency"
+    SQLALCHEMY_REPLICA_STICKY_SECONDS = 2  # read from primary in N seconds after a write is committed
+    # callable of the key to stick across requests, eg: `lambda: flask.session.get("uid")`,
+    # None to stick the db session of the request only
+    SQLALCHEMY_REPLICA_STICKY_KEY = None
+
+warmup(optional), move the cost of the first requests to `db.init_app`, or call `db.warmup(app)` after
+the models are imported:
+    SQLALCHEMY_WARMUP = True  # configure mappers, build schemas of models, pre-open pooled connections
+    SQLALCHEMY_WARMUP_CONNECTIONS = 1  # connections opened per engine, capped by the pool size
 """
 
-import os
-import logging
-from pprint import pformat
-from datetime import datetime
+import copy
+import time
+import itertools
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
-from sqlalchemy import func
-from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm.attributes import InstrumentedAttribute, flag_modified
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, inspect, event, tuple_, text, select
+from sqlalchemy.orm import Session, sessionmaker, configure_mappers, aliased
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.util import find_tables
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import werkzeug.exceptions as errors
-from . import utils
+from . import utils, tag_index
+from .utils import pformat
+from ._base import logger, ModelMixin, CoMixin
+# re-exported, they were defined here before `_base`
+from ._base import logger_name, ModelSchema  # noqa: F401
+
+# execution option of read-only queries, which may be routed to replicas
+_READ_REPLICA = "pyco_read_replica"
+# `Session.info` flags: the current transaction has written, or `primary_reads` blocks
+_WROTE = "pyco_wrote"
+_PRIMARY_READS = "pyco_primary_reads"
+# `Session.info` of the sticky deadline, without `sticky_key`
+_STICKY_UNTIL = "pyco_sticky_until"
+
+
+def _replica_reads(qry):
+    return qry.execution_options(**{_READ_REPLICA: True})
+
+
+class ReplicaPool(object):
+    """
+    replica engines of the default bind, refer: `SQLALCHEMY_REPLICA_*` configs.
+    - round_robin: pick replicas in turn
+    - least_latency: pick the replica with the least EWMA latency of its statements
+    """
+    STRATEGIES = ("round_robin", "least_latency")
+    STICKY_MAXSIZE = 10000
+
+    def __init__(self, engines, strategy="round_robin", sticky_seconds=2, sticky_key=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError("Unknown replica strategy: {}".format(strategy))
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.sticky_seconds = sticky_seconds
+        self.sticky_key = sticky_key
+        self.latency = {e: 0.0 for e in self.engines}
+        self._counter = itertools.count()
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+        if strategy == "least_latency":
+            for e in self.engines:
+                event.listen(e, "before_cursor_execute", self._before_execute)
+                event.listen(e, "after_cursor_execute", self._after_execute)
+
+    @classmethod
+    def from_app(cls, app):
+        pool = app.extensions.get("pyco_replicas")
+        if pool is None:
+            config = app.config
+            keys = config.get("SQLALCHEMY_REPLICA_BINDS") or ()
+            pool = cls(
+                [db.get_engine(app, bind=k) for k in keys],
+                strategy=config.get("SQLALCHEMY_REPLICA_STRATEGY", "round_robin"),
+                sticky_seconds=config.get("SQLALCHEMY_REPLICA_STICKY_SECONDS", 2),
+                sticky_key=config.get("SQLALCHEMY_REPLICA_STICKY_KEY"),
+            )
+            pool = app.extensions.setdefault("pyco_replicas", pool)
+        return pool
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("pyco_replica_t0", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        dt = time.perf_counter() - conn.info["pyco_replica_t0"].pop()
+        e = conn.engine
+        self.latency[e] = self.latency[e] * 0.8 + dt * 0.2
+
+    def pick(self):
+        if self.strategy == "least_latency":
+            return min(self.engines, key=self.latency.__getitem__)
+        return self.engines[next(self._counter) % len(self.engines)]
+
+    def stick(self, sess):
+        # read your writes: reads of the key, or of the session without `sticky_key`, go to primary in `sticky_seconds`
+        if not self.sticky_seconds:
+            return
+        until = time.monotonic() + self.sticky_seconds
+        if self.sticky_key is None:
+            sess.info[_STICKY_UNTIL] = until
+            return
+        key = self.sticky_key()
+        with self._lock:
+            self._sticky[key] = until
+            self._sticky.move_to_end(key)
+            while len(self._sticky) > self.STICKY_MAXSIZE:
+                self._sticky.popitem(last=False)
+
+    def is_sticky(self, sess):
+        if self.sticky_key is None:
+            until = sess.info.get(_STICKY_UNTIL)
+        elif self._sticky:
+            until = self._sticky.get(self.sticky_key())
+        else:
+            return False
+        return until is not None and until > time.monotonic()
+
+
+class RoutingSession(SignallingSession):
+    """
+    routes queries with the `_READ_REPLICA` option to a replica, unless:
+    - the model has a `__bind_key__`
+    - the current transaction has flushed or executed DML, or inside `primary_reads`
+    - a write was committed in the sticky window, by the session or of the same `sticky_key`
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        bind = super().get_bind(mapper, clause)
+        if clause is None:
+            return bind
+        if getattr(clause, "is_dml", False):
+            self.info[_WROTE] = True
+        elif bind is self.bind and getattr(clause, "_execution_options", {}).get(_READ_REPLICA):
+            info = self.info
+            if not (info.get(_WROTE) or info.get(_PRIMARY_READS)):
+                pool = ReplicaPool.from_app(self.app)
+                if pool.engines and not pool.is_sticky(self):
+                    return pool.pick()
+        return bind
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _routing_after_flush(sess, flush_context):
+    sess.info[_WROTE] = True
 
-db = SQLAlchemy()
 
-logger_name = os.environ.get("FLASK_SQL_LOGGER", "flask.app")
-logger = logging.getLogger(logger_name)
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _routing_after_transaction_end(sess, transaction):
+    if transaction.parent is None and sess.info.pop(_WROTE, None):
+        pool = sess.app.extensions.get("pyco_replicas")
+        if pool is not None and pool.engines:
+            pool.stick(sess)
+
+
+def _supports_window(bind):
+    # window functions: SQLite>=3.25, MySQL>=8.0, MariaDB>=10.2, PostgreSQL
+    dialect = bind.dialect
+    if dialect.server_version_info is None and isinstance(bind, Engine):
+        # the version is read by the first connection of the engine
+        bind.connect().close()
+    version = dialect.server_version_info or ()
+    if dialect.name == "sqlite":
+        return version >= (3, 25)
+    elif dialect.name in ("mysql", "mariadb"):
+        return version >= ((10, 2) if getattr(dialect, "is_mariadb", False) else (8, 0))
+    return True
+
+
+def _prewarm_pool(engine, n):
+    # open n connections at once then return them to the pool, the first also initializes the dialect
+    if isinstance(engine.pool, QueuePool):
+        n = min(n, engine.pool.size())
+    conns = []
+    try:
+        for _ in range(max(n, 1)):
+            conns.append(engine.connect())
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        super().init_app(app)
+        if app.config.get("SQLALCHEMY_WARMUP"):
+            self.warmup(app)
+
+    def warmup(self, app=None, connections=None):
+        """
+        configure mappers, build `_schema`/`serializer` of the models, and pre-open pooled connections
+        of the default bind and SQLALCHEMY_BINDS.
+        :return: dict(models, connections, seconds)
+        """
+        app = self.get_app(app)
+        t0 = time.perf_counter()
+        configure_mappers()
+        models = 0
+        for mapper in self.Model.registry.mappers:
+            cls = mapper.class_
+            if issubclass(cls, ModelMixin) and getattr(cls, "__table__", None) is not None:
+                cls._schema()
+                cls.serializer()
+                models += 1
+        if connections is None:
+            connections = app.config.get("SQLALCHEMY_WARMUP_CONNECTIONS", 1)
+        n = 0
+        if connections:
+            for key in [None] + list(app.config.get("SQLALCHEMY_BINDS") or ()):
+                n += _prewarm_pool(self.get_engine(app, bind=key), connections)
+        ReplicaPool.from_app(app)
+        dt = time.perf_counter() - t0
+        logger.info("db warmup: {} models, {} connections in {:.3f}s".format(models, n, dt))
+        return dict(models=models, connections=n, seconds=dt)
+
+
+db = RoutingSQLAlchemy()
 
 
 @contextmanager
@@ -39,6 +251,109 @@ def db_session_maker(auto_commit=False, auto_close=False):
         sess.close()
 
 
+# depth of `batch_writes` blocks, kept in `Session.info`, which is scoped per app context/thread.
+_BATCH_WRITES = "pyco_batch_writes"
+
+
+def in_batch_writes():
+    return db.session().info.get(_BATCH_WRITES, 0) > 0
+
+
+def _commit(flush=False):
+    # commit now, or defer to the exit of `batch_writes`
+    if in_batch_writes():
+        if flush:
+            db.session.flush()
+    else:
+        db.session.commit()
+
+
+@contextmanager
+def batch_writes(savepoint=False):
+    """
+    group commit: `save/update/remove/discard/force_remove_multiple/insert_many/upsert_many` in the block
+    only add/flush, commit once at the exit of the outermost block, or rollback on error.
+    :param savepoint: nested block runs in a SAVEPOINT, rollback only itself on error.
+    sample:
+    >>> with batch_writes():
+            u = User.insert(name="dev")   # flushed, u.id is available
+            u.update(email="dev@pypi.com")
+    """
+    sess = db.session()
+    depth = sess.info.get(_BATCH_WRITES, 0)
+    sess.info[_BATCH_WRITES] = depth + 1
+    try:
+        if depth and savepoint:
+            with sess.begin_nested():
+                yield sess
+        else:
+            yield sess
+        if depth == 0:
+            sess.commit()
+    except Exception as e:
+        if depth == 0:
+            logger.exception(e)
+            sess.rollback()
+        raise e
+    finally:
+        sess.info[_BATCH_WRITES] = depth
+
+
+def init_batch_writes(app):
+    # group commit for every request of $app, existing call sites need no change.
+    # NOTE: the writes are committed only if the response status < 400.
+    @app.before_request
+    def _begin_batch_writes():
+        db.session().info[_BATCH_WRITES] = 1
+
+    @app.after_request
+    def _commit_batch_writes(response):
+        sess = db.session()
+        if sess.info.get(_BATCH_WRITES) and response.status_code < 400:
+            sess.info[_BATCH_WRITES] = 0
+            try:
+                sess.commit()
+            except Exception as e:
+                logger.exception(e)
+                sess.rollback()
+                raise e
+        return response
+
+    @app.teardown_request
+    def _rollback_batch_writes(exc=None):
+        sess = db.session()
+        if sess.info.pop(_BATCH_WRITES, 0):
+            sess.rollback()
+
+
+@contextmanager
+def primary_reads():
+    # read helpers in the block query the primary, eg: read-modify-write
+    sess = db.session()
+    depth = sess.info.get(_PRIMARY_READS, 0)
+    sess.info[_PRIMARY_READS] = depth + 1
+    try:
+        yield sess
+    finally:
+        sess.info[_PRIMARY_READS] = depth
+
+
+@contextmanager
+def _chunk_transaction():
+    # commit once when the block exits, or rollback on error
+    sess = db.session
+    if in_batch_writes():
+        yield sess
+        return
+    try:
+        yield sess
+        sess.commit()
+    except Exception as e:
+        logger.exception(e)
+        sess.rollback()
+        raise e
+
+
 def force_remove_multiple(*models, silent=False):
     count = 0
     for m in models:
@@ -50,79 +365,279 @@ def force_remove_multiple(*models, silent=False):
             if silent:
                 logger.error(msg)
             else:
-                db.session.rollback()
+                if not in_batch_writes():
+                    db.session.rollback()
                 raise errors.NotFound(msg)
     if count > 0:
-        db.session.commit()
+        _commit()
+
+
+# keys of `_pk_cache` written in the current transaction, dropped again when it ends.
+_PK_CACHE_PENDING = "pyco_pk_cache_pending"
+
+
+def _pk_cache_models(cls):
+    # the model and its mapped ancestors, which may cache the same row
+    for mapper in inspect(cls).iterate_to_root():
+        cache = getattr(mapper.class_, "_pk_cache", None)
+        if cache is not None:
+            yield mapper.class_, cache
+
+
+def _pk_cache_invalidate(sess, cls, ident=None):
+    # ident is None: drop all keys of the model, eg: after bulk `discard`
+    models = list(_pk_cache_models(cls))
+    if not models:
+        return
+    pending = sess.info.setdefault(_PK_CACHE_PENDING, set())
+    for model, cache in models:
+        key = (model._pk_cache_namespace(), ident)
+        pending.add((cache, key))
+        if ident is None:
+            cache.clear(key[0])
+        else:
+            cache.delete(key)
+
 
+def _copy_mutable(value):
+    # cached column values must not share JSON objects with the models, which may be edited in place,
+    # plain dicts/lists are copied by comprehensions, much faster than `copy.deepcopy`
+    tp = type(value)
+    if tp is dict:
+        return {k: _copy_mutable(v) for k, v in value.items()}
+    elif tp is list:
+        return [_copy_mutable(v) for v in value]
+    elif isinstance(value, (dict, list, set)):
+        return copy.deepcopy(value)
+    return value
 
-class BaseModel():
+
+def _pk_cache_pending(sess, cache, key):
+    pending = sess.info.get(_PK_CACHE_PENDING)
+    return bool(pending) and ((cache, key) in pending or (cache, (key[0], None)) in pending)
+
+
+@event.listens_for(Session, "after_flush")
+def _pk_cache_after_flush(sess, flush_context):
+    for m in list(sess.dirty) + list(sess.deleted):
+        if isinstance(m, BaseModel):
+            _pk_cache_invalidate(sess, type(m), inspect(m).identity)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _pk_cache_after_transaction_end(sess, transaction):
+    # the outermost transaction is committed or rolled back, readers may have cached the old row meanwhile
+    if transaction.parent is None:
+        pending = sess.info.pop(_PK_CACHE_PENDING, None)
+        for cache, (namespace, ident) in pending or ():
+            if ident is None:
+                cache.clear(namespace)
+            else:
+                cache.delete((namespace, ident))
+
+
+# generations of tables, a new value is taken from the counter on every write, which makes old keys of
+# `_result_cache` unreachable. tables written in the current transaction are bumped again when it ends.
+_table_generations = {}
+_generation_counter = itertools.count(1)
+_RESULT_PENDING = "pyco_result_pending"
+
+
+def _bump_tables(sess, tables):
+    pending = sess.info.setdefault(_RESULT_PENDING, set())
+    for name in tables:
+        _table_generations[name] = next(_generation_counter)
+        pending.add(name)
+
+
+@event.listens_for(Session, "after_flush")
+def _result_cache_after_flush(sess, flush_context):
+    mappers = {inspect(m).mapper for m in itertools.chain(sess.new, sess.dirty, sess.deleted)}
+    _bump_tables(sess, {tbl.name for mapper in mappers for tbl in mapper.tables})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _result_cache_on_execute(state):
+    # bulk paths: `discard`, `discard_in_batches`, `update_where`, `insert_many`, `upsert_many`
+    if state.is_insert or state.is_update or state.is_delete:
+        tbl = getattr(state.statement, "table", None)
+        if tbl is not None:
+            _bump_tables(state.session, [tbl.name])
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _result_cache_after_transaction_end(sess, transaction):
+    # readers may have cached the rows committed before, while the transaction was open
+    if transaction.parent is None:
+        for name in sess.info.pop(_RESULT_PENDING, None) or ():
+            _table_generations[name] = next(_generation_counter)
+
+
+def _freeze(value):
+    # hashable value of a bound parameter, eg: list of an expanding IN
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class BaseModel(ModelMixin):
     """ sample:
     >>> class TableName(db.Model, BaseModel):
         pass
     """
+    # opt-in primary key cache of `get_or_none/getOr404`, eg: `_pk_cache = cache.LRUCache(maxsize=10000, ttl=60)`
+    _pk_cache = None
+    # opt-in result cache of `filter_by/page_items/count`, eg: `_result_cache = cache.LRUCache(maxsize=1000, ttl=5)`
+    # - ttl: max staleness in seconds, writes of other processes are not seen until the key expires
+    # - stats: hits/misses/evictions of the backend, refer: `cache.CacheBackend`
+    # rows are cached as column tuples, queries with only/defer/load options are not cached.
+    _result_cache = None
 
     @classmethod
-    def columns(cls):
-        tbl = getattr(cls, "__table__", None)
-        if tbl is None:
-            name = cls.__name__
-            desc = 'Service Unavailable: DbModel<{}> '.format(name)
-            msg = "API-ERROR:{}\nDbModel<{}> must be subclass of db.Model!".format(desc, name)
-            logger.exception(msg)
-            raise errors.ServiceUnavailable(desc)
-        else:
-            return tbl.columns
+    def insert(cls, data=None, **kwargs):
+        m = cls.initial(data, **kwargs)
+        m.save()
+        return m
 
     @classmethod
-    def primary_keys(cls):
-        tbl = cls.__table__
-        pks = [m.name for m in tbl.primary_key.columns]
-        return pks
+    def insert_many(cls, rows, chunk_size=1000, return_pks=False):
+        """
+        insert rows by chunked executemany, commit once per chunk.
+        NOTE: rows are sent by Core `INSERT`, ORM events/session are bypassed.
+        :return: count of inserted rows, or list of primary keys if `return_pks`
+        """
+        attr_keys = cls._schema().attr_columns
+        stmt = cls.__table__.insert()
+        count = 0
+        pks = []
+        for chunk in utils.chunked(rows, chunk_size):
+            defaults = cls._chunk_defaults()
+            groups = {}
+            params = []
+            for row in chunk:
+                form = cls._insert_form(row)
+                for k, v in defaults.items():
+                    form.setdefault(k, v)
+                p = {attr_keys[k]: v for k, v in form.items() if k in attr_keys}
+                params.append(p)
+                groups.setdefault(tuple(sorted(p)), []).append(p)
+
+            with _chunk_transaction() as db_sess:
+                if return_pks:
+                    for p in params:
+                        pk = db_sess.execute(stmt, p).inserted_primary_key
+                        pks.append(pk[0] if len(pk) == 1 else tuple(pk))
+                else:
+                    for keys, group in groups.items():
+                        if keys:
+                            # executemany requires the same keys for all params
+                            db_sess.execute(stmt, group)
+                        else:
+                            for p in group:
+                                db_sess.execute(stmt, p)
+            count += len(params)
+        return pks if return_pks else count
 
     @classmethod
-    def _immutable_keys(cls):
-        # limit columns should not updated by cls.update(form)
-        pks = cls.primary_keys()
-        return pks
+    def _upsert_stmt(cls, dialect, conflict_cols, set_cols):
+        # dialect modules are imported on demand
+        tbl = cls.__table__
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(tbl)
+            if not set_cols:
+                return stmt.on_conflict_do_nothing(index_elements=conflict_cols)
+            return stmt.on_conflict_do_update(
+                index_elements=conflict_cols, set_={k: stmt.excluded[k] for k in set_cols}
+            )
+        elif dialect in ("mysql", "mariadb"):
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(tbl)
+            # NOTE: `ON DUPLICATE KEY UPDATE` requires one column at least, set the conflict key as itself.
+            set_cols = set_cols or conflict_cols[:1]
+            return stmt.on_duplicate_key_update({k: stmt.inserted[k] for k in set_cols})
+        raise NotImplementedError("upsert_many of {} is not supported on {}".format(cls.__name__, dialect))
 
     @classmethod
-    def strict_form(cls, data=None, **kwargs):
-        if data is None:
-            data = kwargs
-        elif isinstance(data, dict):
-            if kwargs:
-                data2 = dict(**data)
-                data2.update(kwargs)
-                data = data2
-        else:
-            raise TypeError('data value must be dict or None')
+    def upsert_many(cls, rows, conflict_keys=None, update_keys=None, chunk_size=1000):
+        """
+        insert rows, or update the existing rows conflict on `conflict_keys`, commit once per chunk.
+        compiled to `INSERT ... ON CONFLICT DO UPDATE` (sqlite/postgresql) or `ON DUPLICATE KEY UPDATE` (mysql).
+        :param conflict_keys: keys of a unique constraint, default primary keys, required in every row.
+        :param update_keys: keys updated on conflict, default keys given by the row, `_immutable_keys` are ignored.
+            columns with `onupdate` (eg: CoModel.updated_time) are updated with the inserting value.
+        :return: dict(inserted=n1, updated=n2), rows of the same conflict keys in one chunk are merged, last wins.
+        """
+        schema = cls._schema()
+        attr_keys = schema.attr_columns
+        if not conflict_keys:
+            conflict_keys = [dict(schema.column_attrs)[name] for name in schema.primary_keys]
+        conflict_cols = [attr_keys[k] for k in conflict_keys]
+        if update_keys is not None:
+            for k in set(update_keys) & schema.immutable_keys:
+                logger.warning("Immutable Field {}.{}, ignore upserting".format(cls.__name__, k))
+        excluded = schema.immutable_keys | set(conflict_keys)
+        onupdate_cols = [c.key for c in cls.__table__.columns if c.onupdate is not None]
+        dialect = db.session().get_bind(mapper=inspect(cls)).dialect.name
 
-        form = {}
-        for k, v in data.items():
-            col = getattr(cls, k, None)
-            if isinstance(col, InstrumentedAttribute):
-                form[k] = v
-        return form
+        inserted = updated = 0
+        for chunk in utils.chunked(rows, chunk_size):
+            defaults = cls._chunk_defaults()
+            unique = {}
+            for row in chunk:
+                form = cls._insert_form(row)
+                missing = [k for k in conflict_keys if form.get(k) is None]
+                if missing:
+                    raise ValueError("upsert_many of {} require conflict keys: {}".format(cls.__name__, missing))
+                keys = form.keys() if update_keys is None else update_keys
+                set_cols = {attr_keys[k] for k in keys if k in attr_keys and k not in excluded}
+                for k, v in defaults.items():
+                    form.setdefault(k, v)
+                p = {attr_keys[k]: v for k, v in form.items() if k in attr_keys}
+                set_cols.update(c for c in onupdate_cols if c in p)
+                set_cols.intersection_update(p)
+                unique[tuple(p[c] for c in conflict_cols)] = (tuple(sorted(set_cols)), p)
 
-    @classmethod
-    def initial(cls, data=None, **kwargs):
-        form = cls.strict_form(data, **kwargs)
-        m = cls(**form)
-        return m
+            groups = {}
+            for ident, (set_cols, p) in unique.items():
+                groups.setdefault((tuple(sorted(p)), set_cols), []).append((ident, p))
+
+            with _chunk_transaction() as db_sess:
+                for (_, set_cols), group in groups.items():
+                    existing = cls._count_existing(db_sess, conflict_cols, [ident for ident, _ in group])
+                    stmt = cls._upsert_stmt(dialect, conflict_cols, set_cols)
+                    db_sess.execute(stmt, [p for _, p in group])
+                    inserted += len(group) - existing
+                    updated += existing if set_cols else 0
+                _pk_cache_invalidate(db_sess(), cls)
+        return dict(inserted=inserted, updated=updated)
 
     @classmethod
-    def insert(cls, data=None, **kwargs):
-        m = cls.initial(data, **kwargs)
-        m.save()
-        return m
+    def _count_existing(cls, db_sess, cols, idents):
+        # count rows whose $cols values in $idents
+        tbl = cls.__table__
+        if len(cols) == 1:
+            cond = tbl.c[cols[0]].in_([ident[0] for ident in idents])
+        else:
+            cond = tuple_(*[tbl.c[c] for c in cols]).in_(idents)
+        return db_sess.execute(select(func.count()).select_from(tbl).where(cond)).scalar()
 
     @classmethod
-    def _make_query(cls, condition=None, query=None, limit=None, offset=None, order_by=None, **condition_kws):
+    def _make_query(cls, condition=None, query=None, limit=None, offset=None, order_by=None,
+                    only=None, defer=None, load=None, **condition_kws):
         # NOTE: ERROR raise if call query.[update({})/delete()] after limit()/offset()/distinct()/group_by()/order_by()
+        # only/defer/load: refer `_load_options`
         condition = cls.strict_form(condition, **condition_kws)
         qry = query or cls.query
-        qry = qry.filter_by(**condition)
+        qry = _replica_reads(qry.filter_by(**condition))
+        options = cls._load_options(only, defer, load)
+        if options:
+            qry = qry.options(*options)
         if isinstance(order_by, (list, tuple)):
             qry = qry.order_by(*order_by)
         elif order_by is not None:
@@ -135,61 +650,494 @@ class BaseModel():
         return qry
 
     @classmethod
-    def discard(cls, condition=None, limit=1, **condition_kws):
-        # In Case of incorrect operation, default limit 1;
+    def _where_query(cls, db_sess, condition=None, where=None):
+        # query of $condition by `strict_form`, and SQL expressions of $where
+        qry = db_sess.query(cls).filter_by(**cls.strict_form(condition))
+        if isinstance(where, (list, tuple)):
+            qry = qry.filter(*where)
+        elif where is not None:
+            qry = qry.filter(where)
+        return qry
+
+    @classmethod
+    def discard(cls, condition=None, limit=1, precheck=False, **condition_kws):
+        """
+        In Case of incorrect operation, default limit 1;
+        :param precheck: count up to limit+1 rows before DELETE, raise SecurityError without deleting if over limit,
+            the rows deleted are still checked after DELETE.
+        """
         condition = cls.strict_form(condition, **condition_kws)
         with db_session_maker(auto_commit=False) as db_sess:
+            qry = db_sess.query(cls).filter_by(**condition)
+            if precheck and limit:
+                pk = getattr(cls, cls._schema().primary_keys[0])
+                sub = qry.with_entities(pk).limit(limit + 1).subquery()
+                if db_sess.query(func.count()).select_from(sub).scalar() > limit:
+                    msg = "You're trying discard over {} rows of {}, which is over limit".format(limit, cls.__name__)
+                    raise errors.SecurityError(msg)
+            # inside `batch_writes`, only rollback the SAVEPOINT
+            txn = db_sess.begin_nested() if in_batch_writes() else db_sess
+            pks = qry.with_entities(*inspect(cls).primary_key).all() if tag_index.indexed(cls) else None
             # n = cls.query.filter_by(**condition).delete()
-            n = db_sess.query(cls).filter_by(**condition).delete()
+            n = qry.delete()
+            if pks:
+                tag_index.delete_rows(cls._tag_connection(db_sess), cls, pks)
+            _pk_cache_invalidate(db_sess(), cls)
             if limit and limit < n:
-                db_sess.rollback()
+                txn.rollback()
                 msg = "You're trying discard {} rows of {}, which is over limit={}".format(n, cls.__name__, limit)
                 raise errors.SecurityError(msg)
             else:
-                db_sess.commit()
+                txn.commit()
             return n
 
     @classmethod
-    def page_items(cls, condition=None, limit=10, offset=0, order_by=None, **condition_kws):
+    def discard_in_batches(cls, condition=None, batch_size=1000, pause=0, progress=None, after=None, where=None,
+                           **condition_kws):
+        """
+        delete matched rows by chunks of primary keys, commit once per chunk, so locks are held shortly.
+        :param where: SQL expressions besides condition, eg: `Post.created_time < cutoff`
+        :param pause: seconds to sleep between chunks
+        :param progress: callback of dict(deleted, batch, last, elapsed) after each chunk,
+            `last` is the last primary key deleted, pass it as `after` to resume a purge interrupted.
+        :return: count of deleted rows
+        """
+        condition = cls.strict_form(condition, **condition_kws)
+        keys = cls._order_keys()
+        cols = [col for col, _, _ in keys]
+        pk_cols = cols[0] if len(cols) == 1 else tuple_(*cols)
+        # the condition is evaluated in python to sync the session, SQL expressions are fetched
+        sync = "evaluate" if where is None else "fetch"
+        t0 = time.monotonic()
+        deleted = 0
+        while True:
+            with _chunk_transaction() as db_sess:
+                qry = cls._where_query(db_sess, condition, where)
+                if after is not None:
+                    values = after if isinstance(after, (list, tuple)) else [after]
+                    qry = qry.filter(cls._seek_condition(keys, values))
+                rows = qry.with_entities(*cols).order_by(*cols).limit(batch_size).all()
+                if not rows:
+                    break
+                idents = [r[0] for r in rows] if len(cols) == 1 else [tuple(r) for r in rows]
+                n = cls._where_query(db_sess, condition, where).filter(pk_cols.in_(idents)) \
+                    .delete(synchronize_session=sync)
+                if tag_index.indexed(cls):
+                    tag_index.delete_rows(cls._tag_connection(db_sess), cls, idents)
+                _pk_cache_invalidate(db_sess(), cls)
+            deleted += n
+            after = idents[-1]
+            if progress is not None:
+                progress(dict(deleted=deleted, batch=n, last=after, elapsed=time.monotonic() - t0))
+            if len(rows) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return deleted
+
+    @classmethod
+    def update_where(cls, condition=None, values=None, limit=1, force=False, where=None):
+        """
+        set $values of rows matched by $condition in one UPDATE, values are filtered by `strict_form`,
+        immutable keys are ignored unless force, `onupdate` columns (eg: `CoModel.updated_time`) are set by SQL.
+        In Case of incorrect operation, default limit 1, the rows updated are checked before commit.
+        loaded objects of cls expire the updated attributes, which are reloaded on next access.
+        :param where: SQL expressions besides condition
+        :return: count of updated rows
+        """
+        values = cls._update_values(values, force)
+        if not values:
+            return 0
+        tbl = cls.__table__
+        keys = list(values) + [attr for name, attr in cls._schema().column_attrs if tbl.c[name].onupdate is not None]
+        with db_session_maker(auto_commit=False) as db_sess:
+            # inside `batch_writes`, only rollback the SAVEPOINT
+            txn = db_sess.begin_nested() if in_batch_writes() else db_sess
+            tagged = [k for k in values if k in getattr(cls, "__tag_index__", ())] if tag_index.indexed(cls) else ()
+            if tagged:
+                pks = cls._where_query(db_sess, condition, where).with_entities(*inspect(cls).primary_key).all()
+            n = cls._where_query(db_sess, condition, where).update(values, synchronize_session=False)
+            if tagged:
+                tag_index.reindex_rows(cls._tag_connection(db_sess), cls, pks, tagged)
+            if limit and limit < n:
+                txn.rollback()
+                msg = "You're trying update {} rows of {}, which is over limit={}".format(n, cls.__name__, limit)
+                raise errors.SecurityError(msg)
+            sess = db_sess()
+            for m in list(sess.identity_map.values()):
+                if isinstance(m, cls):
+                    sess.expire(m, keys)
+            _pk_cache_invalidate(sess, cls)
+            txn.commit()
+            return n
+
+    @classmethod
+    def _tag_connection(cls, db_sess):
+        return db_sess.connection(bind_arguments=dict(mapper=inspect(cls)))
+
+    @classmethod
+    def filter_by_tags(cls, attr, any_of=None, all_of=None, none_of=None, condition=None, **condition_kws):
+        """
+        models matched by the tags of $attr in `__tag_index__`, tags are list or comma string,
+        the conditions are AND-ed, other arguments are same as `filter_by`. refer: `tag_index.tag_conditions`
+        """
+        clauses = tag_index.tag_conditions(cls, attr, any_of, all_of, none_of)
+        qry = cls._make_query(condition, query=cls.query.filter(*clauses), **condition_kws)
+        return qry.all()
+
+    @classmethod
+    def rebuild_tag_index(cls, batch_size=1000):
+        """
+        rebuild `__tag_index__` of cls from the table in one transaction, eg: after `insert_many`
+        :return: count of the index rows
+        """
+        with _chunk_transaction() as db_sess:
+            return tag_index.rebuild(cls, cls._tag_connection(db_sess), batch_size=batch_size)
+
+    @classmethod
+    def import_file(cls, path, **kwargs):
+        """
+        stream rows of a CSV/JSONL file into the table of cls by chunked transactions, resumable.
+        refer: `transfer.import_file`
+        """
+        from .transfer import import_file
+        engine = db.get_engine(bind=getattr(cls, "__bind_key__", None))
+        return import_file(cls, engine, path, **kwargs)
+
+    @classmethod
+    def _from_columns(cls, sess, rows):
+        # models of committed column values, tuples in the order of `_schema().column_attrs`, without SELECT.
+        # models already in the session keep their loaded values, the expired/unloaded ones are filled
+        # as by a query, eg: after commit; the others are attached as loaded by a query
+        schema = cls._schema()
+        attrs = [attr for _, attr in schema.column_attrs]
+        names = [name for name, _ in schema.column_attrs]
+        pk_index = [names.index(name) for name in schema.primary_keys]
+        mapper = inspect(cls)
+        identity_map = sess.identity_map
+        manager = mapper.class_manager
+        state_of = manager.state_getter()
+        items = []
+        for r in rows:
+            key = mapper.identity_key_from_primary_key([r[i] for i in pk_index])
+            m = identity_map.get(key)
+            if m is None:
+                m = manager.new_instance()
+                state = state_of(m)
+                state.dict.update(zip(attrs, map(_copy_mutable, r)))
+                # attached as `sqlalchemy.orm.loading` does, `Session.add` of detached models is much slower
+                state.key = key
+                state.identity_token = key[2]
+                state.session_id = sess.hash_key
+                identity_map._add_unpresent(state, key)
+            else:
+                state = state_of(m)
+                unloaded = state.unloaded
+                if unloaded and not state._deleted:
+                    keys = [k for k in attrs if k in unloaded]
+                    state.dict.update((k, _copy_mutable(v)) for k, v in zip(attrs, r) if k in unloaded)
+                    state._commit(state.dict, keys)
+            items.append(m)
+        return items
+
+    @classmethod
+    def _result_key(cls, sess, qry):
+        # => (key, tables) of `_result_cache`, key is None if qry is not cacheable
+        if qry._with_options:
+            return None, ()
+        stmt = qry.statement
+        tables = sorted({tbl.name for tbl in find_tables(stmt, include_aliases=True)})
+        pending = sess.info.get(_RESULT_PENDING)
+        if pending and not pending.isdisjoint(tables):
+            # uncommitted writes of the session
+            return None, tables
+        generations = tuple(_table_generations.get(name, 0) for name in tables)
+        # the key of SQLAlchemy's compiled cache, or the SQL string if missing, eg: types without `cache_ok`
+        cache_key = stmt._generate_cache_key()
+        if cache_key is not None:
+            sql = cache_key.key
+            params = tuple(_freeze(p.effective_value) for p in cache_key.bindparams)
+        else:
+            compiled = stmt.compile(dialect=sess.get_bind(mapper=inspect(cls)).dialect)
+            sql = str(compiled)
+            params = tuple(sorted((k, _freeze(v)) for k, v in compiled.params.items()))
+        return (cls._pk_cache_namespace(), (sql, params, generations)), tables
+
+    @classmethod
+    def _cached_result(cls, key, tables, fetch):
+        cache = cls._result_cache
+        value = cache.get(key)
+        if value is None:
+            value = fetch()
+            # skip if the tables are written meanwhile
+            if key[1][2] == tuple(_table_generations.get(name, 0) for name in tables):
+                cache.set(key, value)
+        return value
+
+    @classmethod
+    def _all(cls, qry):
+        # `qry.all()` of models, read through `_result_cache`, rows are cached as column tuples
+        if cls._result_cache is None or [d["entity"] for d in qry.column_descriptions] != [cls]:
+            return qry.all()
+        sess = db.session()
+        key, tables = cls._result_key(sess, qry)
+        if key is None:
+            return qry.all()
+        cols = [getattr(cls, attr) for _, attr in cls._schema().column_attrs]
+        rows = cls._cached_result(key, tables, lambda: [tuple(r) for r in qry.with_entities(*cols)])
+        # each model gets its own copy of the mutable values of the cached rows
+        return cls._from_columns(sess, rows)
+
+    @classmethod
+    def _scalar(cls, qry):
+        # `qry.scalar()`, read through `_result_cache`
+        if cls._result_cache is None:
+            return qry.scalar()
+        key, tables = cls._result_key(db.session(), qry)
+        if key is None:
+            return qry.scalar()
+        return cls._cached_result(key, tables, lambda: (qry.scalar(),))[0]
+
+    @classmethod
+    def _seek_page(cls, qry, limit, order_by, cursor):
+        keys = cls._order_keys(order_by)
+        if cursor:
+            try:
+                values = utils.decode_cursor(cursor)
+                assert len(values) == len(keys)
+            except Exception:
+                raise errors.BadRequest("Invalid cursor of {}: {}".format(cls.__name__, cursor))
+            qry = qry.filter(cls._seek_condition(keys, values))
+        qry = qry.order_by(*[col.desc() if is_desc else col.asc() for col, _, is_desc in keys])
+        if limit > 0:
+            items = cls._all(qry.limit(limit + 1))
+            has_more = len(items) > limit
+            items = items[:limit]
+        elif limit == 0:
+            items = []
+            has_more = bool(cls._all(qry.limit(1)))
+        else:
+            items = cls._all(qry)
+            has_more = False
+        next_cursor = None
+        if has_more and items:
+            next_cursor = utils.encode_cursor([getattr(items[-1], k) for _, k, _ in keys])
+        elif has_more:
+            next_cursor = cursor
+        return dict(limit=limit, next_cursor=next_cursor, has_more=has_more, items=items)
+
+    @classmethod
+    def _estimate_rows(cls):
+        # rows of the whole table from statistics of the dialect, None if missing
+        tbl = cls.__table__
+        mapper = inspect(cls)
+        sess = db.session()
+        dialect = sess.get_bind(mapper=mapper).dialect.name
+        params = dict(name=tbl.name, schema=tbl.schema, fullname=tbl.fullname)
+
+        def scalar(sql):
+            return sess.execute(text(sql), params, bind_arguments=dict(mapper=mapper)).scalar()
+
+        n = None
+        if dialect == "sqlite":
+            # refer: https://www.sqlite.org/fileformat2.html#stat1tab, created by `ANALYZE`
+            if scalar("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"):
+                stat = scalar("SELECT stat FROM sqlite_stat1 WHERE tbl = :name LIMIT 1")
+                n = int(stat.split()[0]) if stat else None
+        elif dialect == "postgresql":
+            n = scalar("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:fullname)")
+        elif dialect in ("mysql", "mariadb"):
+            n = scalar(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES"
+                " WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND TABLE_NAME = :name"
+            )
+        # NOTE: reltuples is -1/0 if never analyzed, exact count is cheap for small tables anyway.
+        return int(n) if n and n > 0 else None
+
+    @classmethod
+    def _count_rows(cls, qry, total="exact"):
+        """
+        :param total: strategy of counting rows of qry
+            - "exact": `SELECT count(pk)` of all matched rows
+            - "estimate": statistics of the dialect if qry is unfiltered, else fallback to "exact"
+            - "none": skip counting, return None
+            - "capped:N": count up to N rows
+        """
+        pk = getattr(cls, cls._schema().primary_keys[0])
+        if total == "none":
+            return None
+        elif total == "estimate":
+            if qry.whereclause is None:
+                n = cls._estimate_rows()
+                if n is not None:
+                    return n
+        elif isinstance(total, str) and total.startswith("capped:"):
+            cap = int(total[len("capped:"):])
+            sub = qry.with_entities(pk).limit(cap).subquery()
+            return cls._scalar(_replica_reads(db.session.query(func.count()).select_from(sub)))
+        elif total != "exact":
+            raise ValueError("Unknown count strategy of {}: {}".format(cls.__name__, total))
+        return cls._scalar(qry.with_entities(func.count(pk)))
+
+    @classmethod
+    def page_items(cls, condition=None, limit=10, offset=0, order_by=None, cursor=None, total="exact",
+                   **condition_kws):
+        """
+        :param cursor: keyset pagination if not None, use "" for the first page,
+            then `next_cursor` of the previous page, which is None at the last page.
+            the primary key is appended to order_by as tie-breaker, NULL order values are not supported.
+        :param total: "exact" | "estimate" | "none" | "capped:N", refer: `_count_rows`,
+            `has_more` is checked by fetching limit+1 rows unless "exact".
+        :param condition_kws: also accepts only/defer/load of `_load_options`
+        """
         qry = cls._make_query(condition, **condition_kws)
-        pk = cls.primary_keys()[0]
-        total = qry.value(func.count(getattr(cls, pk)))
+        n = cls._count_rows(qry, total)
+        if cursor is not None:
+            page = cls._seek_page(qry, limit, order_by, cursor)
+            page.update(total=n)
+            return page
         if isinstance(order_by, (list, tuple)):
             qry = qry.order_by(*order_by)
         elif order_by is not None:
             qry = qry.order_by(order_by)
-        if limit > 0:
-            items = qry.limit(limit).offset(offset).all()
+        if total == "exact":
+            if limit > 0:
+                items = cls._all(qry.limit(limit).offset(offset))
+            elif limit == 0:
+                items = []
+            else:
+                items = cls._all(qry)
+            has_more = n > offset + len(items)
+        elif limit > 0:
+            items = cls._all(qry.limit(limit + 1).offset(offset))
+            has_more = len(items) > limit
+            items = items[:limit]
         elif limit == 0:
             items = []
+            has_more = bool(cls._all(qry.offset(offset).limit(1)))
         else:
-            items = qry.all()
+            items = cls._all(qry.offset(offset))
+            has_more = False
         next_offset = offset + len(items)
-        has_more = total > next_offset
-        return dict(total=total, limit=limit, next_offset=next_offset, has_more=has_more, items=items)
+        return dict(total=n, limit=limit, next_offset=next_offset, has_more=has_more, items=items)
 
     @classmethod
     def filter_by(cls, condition=None, **condition_kws):
         qry = cls._make_query(condition, **condition_kws)
-        ms = qry.all()
+        ms = cls._all(qry)
         return ms
 
     @classmethod
-    def count(cls, condition=None, **condition_kws):
+    def _stream_query(cls, qry, batch_size):
+        # fetch by batch_size rows, with server-side cursor if the dialect supports it
+        bind = db.session().get_bind(mapper=inspect(cls))
+        if bind.dialect.supports_server_side_cursors:
+            qry = qry.execution_options(stream_results=True)
+        return qry.yield_per(batch_size)
+
+    @classmethod
+    def iter_by(cls, condition=None, batch_size=1000, **condition_kws):
+        """
+        generator of models matched by condition, same arguments as `_make_query`.
+        NOTE: each batch is expunged from session after yielded, treat the models as read-only.
+        """
+        qry = cls._make_query(condition, **condition_kws)
+        sess = db.session()
+        batch = []
+        for m in cls._stream_query(qry, batch_size):
+            yield m
+            batch.append(m)
+            if len(batch) >= batch_size:
+                for b in batch:
+                    sess.expunge(b)
+                batch = []
+        for b in batch:
+            sess.expunge(b)
+
+    @classmethod
+    def iter_dicts(cls, condition=None, batch_size=1000, **condition_kws):
+        # generator of dicts same as `BaseModel.to_dict`, columns are loaded without ORM models
+        qry = cls._make_query(condition, **condition_kws)
+        column_attrs = cls._schema().column_attrs
+        qry = qry.with_entities(*[getattr(cls, attr) for _, attr in column_attrs])
+        names = [name for name, _ in column_attrs]
+        tp = cls.__name__
+        for row in cls._stream_query(qry, batch_size):
+            d = dict(_type=tp)
+            d.update(zip(names, row))
+            yield d
+
+    @classmethod
+    def count(cls, condition=None, total="exact", **condition_kws):
         # https://docs.sqlalchemy.org/en/latest/orm/query.html#sqlalchemy.orm.query.Query.count
         qry = cls._make_query(condition, **condition_kws)
-        pk = cls.primary_keys()[0]
-        qry = qry.value(func.count(getattr(cls, pk)))
-        return qry
+        return cls._count_rows(qry, total)
 
     @classmethod
-    def get_or_none(cls, condition=None, **condition_kws):
+    def _pk_cache_namespace(cls):
+        return "{}.{}".format(cls.__module__, cls.__qualname__)
+
+    @classmethod
+    def _pk_ident(cls, cond):
+        # primary key of cond as `inspect(m).identity`, eg: id="1" => (1,), None if not exactly the primary key
+        schema = cls._schema()
+        column_attrs = dict(schema.column_attrs)
+        pk_attrs = [column_attrs[name] for name in schema.primary_keys]
+        if len(cond) != len(pk_attrs) or any(cond.get(k) is None for k in pk_attrs):
+            return None
+        ident = []
+        for k, col in zip(pk_attrs, cls.__table__.primary_key.columns):
+            v = cond[k]
+            try:
+                tp = col.type.python_type
+                if not isinstance(v, tp):
+                    v = tp(v)
+            except NotImplementedError:
+                pass
+            except (TypeError, ValueError):
+                return None
+            ident.append(v)
+        return tuple(ident)
+
+    @classmethod
+    def _cached_get(cls, ident, cond):
+        # read through `_pk_cache`, which stores column dicts of committed rows
+        cache = cls._pk_cache
+        namespace = cls._pk_cache_namespace()
+        sess = db.session()
+        d = cache.get((namespace, ident))
+        if d is not None:
+            return cls._from_columns(sess, [tuple(d[attr] for _, attr in cls._schema().column_attrs)])[0]
+
+        # fill the cache by the row from primary, never from a lagging replica,
+        # nor from the model in the session, which may be edited in place
+        attrs = [attr for _, attr in cls._schema().column_attrs]
+        r = cls.query.filter_by(**cond).with_entities(*[getattr(cls, k) for k in attrs]).one_or_none()
+        if r is None:
+            return None
+        m = cls._from_columns(sess, [tuple(r)])[0]
+        # keyed by the identity which is invalidated by flush
+        key = (namespace, inspect(m).identity)
+        if not _pk_cache_pending(sess, cache, key):
+            cache.set(key, {attr: _copy_mutable(v) for attr, v in zip(attrs, r)})
+        return m
+
+    @classmethod
+    def get_or_none(cls, condition=None, only=None, defer=None, load=None, **condition_kws):
         cond = cls.strict_form(condition, **condition_kws)
-        return cls.query.filter_by(**cond).one_or_none()
+        options = cls._load_options(only, defer, load)
+        if options:
+            return _replica_reads(cls.query.filter_by(**cond).options(*options)).one_or_none()
+        if cls._pk_cache is not None:
+            ident = cls._pk_ident(cond)
+            if ident is not None:
+                return cls._cached_get(ident, cond)
+        return _replica_reads(cls.query.filter_by(**cond)).one_or_none()
 
     @classmethod
     def upsert_one(cls, condition: dict, **updated_kws):
-        m = cls.get_or_none(condition)
+        with primary_reads():
+            m = cls.get_or_none(condition)
         if isinstance(m, cls):
             m.update(updated_kws)
         else:
@@ -206,75 +1154,27 @@ class BaseModel():
             msg = "Data Not Found: {}: {}".format(name, pformat(condition_kws))
             raise errors.NotFound(msg)
 
-    def to_dict(self, **kwargs):
-        d = dict(_type=self.__class__.__name__)
-        columns = self.columns()
-        for col in columns:
-            name = col.name
-            value = getattr(self, name)
-            d[name] = value
-        d.update(kwargs)
-        return d
-
     def update(self, form=None, __force=False, **kwargs):
-        data = self.strict_form(form, **kwargs)
-        keys = self._immutable_keys()
-        is_modified = False
-        for k, v in data.items():
-            is_mutable = k not in keys
-            if __force or is_mutable:
-                is_modified = True
-                setattr(self, k, v)
-                if isinstance(v, (dict, list, tuple)):
-                    flag_modified(self, k)
-            else:
-                v0 = getattr(self, k, None)
-                tp = self.__class__.__name__
-                msg = "Immutable Field {}.{}, ignore updating `{} => {}`".format(tp, k, v0, v)
-                logger.warning(msg)
+        is_modified = self._set_form(form, __force, **kwargs)
         if is_modified:
-            db.session.commit()
+            _commit()
 
     def save(self):
         db.session.add(self)
-        db.session.commit()
+        # flush inside `batch_writes`, the primary key is available after save()
+        _commit(flush=True)
 
     def remove(self):
         db.session.delete(self)
-        db.session.commit()
+        _commit()
 
 
-class CoModel(BaseModel):
-
-    @declared_attr
-    def created_time(self):
-        return db.Column(db.DateTime, default=utils.now)
-
-    @declared_attr
-    def updated_time(self):
-        return db.Column(db.DateTime, default=utils.now, onupdate=utils.now)
-
-    @classmethod
-    def initial(cls, data=None, **kwargs):
-        form = cls.strict_form(data, **kwargs)
-        created_time = form.pop('created_time', None)
-        if isinstance(created_time, datetime):
-            form['created_time'] = created_time
-        elif isinstance(created_time, str):
-            form['created_time'] = utils.parse_date(created_time)
-
-        updated_time = form.pop('updated_time', None)
-        if isinstance(updated_time, datetime):
-            form['updated_time'] = updated_time
-        elif isinstance(updated_time, str):
-            form['updated_time'] = utils.parse_date(updated_time)
-        m = cls(**form)
-        return m
+class CoModel(CoMixin, BaseModel):
 
     @classmethod
-    def lastOrNone(cls, **kwargs):
+    def lastOrNone(cls, only=None, defer=None, load=None, **kwargs):
         order_by = kwargs.pop("order_by", cls.created_time.desc())
-        qry = cls._make_query(kwargs, limit=1, order_by=order_by)
+        qry = cls._make_query(kwargs, limit=1, order_by=order_by, only=only, defer=defer, load=load)
         return qry.one_or_none()
 
     @classmethod
@@ -284,3 +1184,76 @@ class CoModel(BaseModel):
             return m
         msg = "Data Not Found: {}: {}".format(cls.__name__, pformat(kwargs))
         raise errors.NotFound(msg)
+
+    @classmethod
+    def range_by(cls, start=None, end=None, condition=None, batch_size=1000, desc=False, **condition_kws):
+        """
+        generator of models of start <= created_time < end in the order of (created_time, primary keys),
+        fetched by chunks of batch_size rows, each chunk seeks after the last row, so it reads the index
+        of `created_time` (or `__created_group__, created_time` with the group in condition).
+        NOTE: each chunk is expunged from session after yielded, treat the models as read-only.
+        """
+        condition = cls.strict_form(condition, **condition_kws)
+        created = cls.created_time
+        keys = cls._order_keys(created.desc() if desc else created)
+        order_by = [col.desc() if is_desc else col.asc() for col, _, is_desc in keys]
+        sess = db.session()
+        values = None
+        while True:
+            qry = cls._make_query(condition)
+            if start is not None:
+                qry = qry.filter(created >= start)
+            if end is not None:
+                qry = qry.filter(created < end)
+            if values is not None:
+                qry = qry.filter(cls._seek_condition(keys, values))
+            items = qry.order_by(*order_by).limit(batch_size).all()
+            for m in items:
+                yield m
+            if len(items) < batch_size:
+                break
+            values = [getattr(items[-1], k) for _, k, _ in keys]
+            for m in items:
+                sess.expunge(m)
+
+    @classmethod
+    def latest_per(cls, group_key=None, condition=None, strategy=None, **condition_kws):
+        """
+        the newest row (by created_time, then primary keys) of each group matched by condition, in one statement.
+        :param group_key: attribute name, default `__created_group__`
+        :param strategy:
+            - "window": ROW_NUMBER() OVER (PARTITION BY group ORDER BY created_time DESC)
+            - "subquery": correlated subquery of the newest primary key per group, rows of NULL group are skipped
+            - None: "window" if the dialect supports it
+        :return: list of models ordered by group
+        """
+        group_key = group_key or cls.__created_group__
+        if not group_key:
+            raise ValueError("group_key of {}.latest_per is required".format(cls.__name__))
+        condition = cls.strict_form(condition, **condition_kws)
+        sess = db.session()
+        if strategy is None:
+            strategy = "window" if _supports_window(sess.get_bind(mapper=inspect(cls))) else "subquery"
+        keys = cls._order_keys(cls.created_time.desc())
+        if strategy == "window":
+            rn = func.row_number().over(
+                partition_by=getattr(cls, group_key),
+                order_by=[col.desc() for col, _, _ in keys],
+            ).label("rn")
+            sub = cls._make_query(condition).add_columns(rn).subquery()
+            latest = aliased(cls, sub)
+            qry = sess.query(latest).filter(sub.c.rn == 1).order_by(getattr(latest, group_key))
+            return qry.all()
+        elif strategy == "subquery":
+            pks = [getattr(cls, k) for _, k, _ in keys[1:]]
+            if len(pks) != 1:
+                raise ValueError("subquery strategy of {}.latest_per requires one primary key".format(cls.__name__))
+            inner = aliased(cls)
+            newest = select(getattr(inner, keys[1][1])) \
+                .filter_by(**condition) \
+                .where(getattr(inner, group_key) == getattr(cls, group_key)) \
+                .order_by(*[getattr(inner, k).desc() for _, k, _ in keys]) \
+                .limit(1).scalar_subquery()
+            qry = cls._make_query(condition).filter(pks[0] == newest).order_by(getattr(cls, group_key))
+            return qry.all()
+        raise ValueError("Unknown latest_per strategy of {}: {}".format(cls.__name__, strategy))
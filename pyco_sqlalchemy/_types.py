@@ -1,4 +1,6 @@
 import json
+import weakref
+import functools
 from datetime import datetime
 from collections import OrderedDict
 from sqlalchemy import types
@@ -17,6 +19,70 @@ class CustomParameterError(Exception, sqlerrors.DontWrapMixin):
         return "{}: {} {}".format(self.__class__.__name__, self.description, self.args if self.args else "")
 
 
+class MemoBindMixin(object):
+    """
+    memoize bound values of str in a LRU, for columns of a few distinct values across many rows.
+    - bind_processor: closure of `process_bind_param` and the dialect processor of impl,
+        one LRU (`functools.lru_cache`) per type instance and dialect name
+    - normalize_many: `process_bind_param` of a whole column of values, for bulk loads
+    - memo_stats: sum of `cache_info` of the live LRUs of the class
+    """
+    memo_size = 1024
+
+    def bind_processor(self, dialect):
+        # NOTE: `TypeDecorator.copy` shares `_memos` of the instance, LRUs are released with the instances
+        memos = self.__dict__.setdefault('_memos', {})
+        memo, bind = memos.get(dialect.name, (None, None))
+        if memo is None:
+            process_param = self.process_bind_param
+            impl_processor = self.impl.bind_processor(dialect)
+            if impl_processor:
+                def bind(value):
+                    return impl_processor(process_param(value, dialect))
+            else:
+                def bind(value):
+                    return process_param(value, dialect)
+
+            memo = functools.lru_cache(maxsize=self.memo_size)(bind)
+            memos[dialect.name] = memo, bind
+            cls = type(self)
+            if '_live_memos' not in cls.__dict__:
+                cls._live_memos = weakref.WeakSet()
+            cls._live_memos.add(memo)
+
+        def process(value):
+            if type(value) is str:
+                return memo(value)
+            return bind(value)
+
+        return process
+
+    def normalize_many(self, values, dialect=None):
+        # NOTE: results of the same str are shared, eg: lists of SortedTags
+        process_param = self.process_bind_param
+        memo = {}
+        results = []
+        for v in values:
+            if type(v) is str:
+                r = memo.get(v, memo)
+                if r is memo:
+                    r = memo[v] = process_param(v, dialect)
+            else:
+                r = process_param(v, dialect)
+            results.append(r)
+        return results
+
+    @classmethod
+    def memo_stats(cls):
+        stats = dict(hits=0, misses=0, maxsize=cls.memo_size, currsize=0)
+        for memo in list(cls.__dict__.get('_live_memos', ())):
+            info = memo.cache_info()
+            stats['hits'] += info.hits
+            stats['misses'] += info.misses
+            stats['currsize'] += info.currsize
+        return stats
+
+
 class DateTime(types.TypeDecorator):
     """
     # sample 1:
@@ -65,7 +131,7 @@ class DatetimeTZUtc(types.TypeDecorator):
         return utils.parse_date(value, tz=utils.TZ_UTC)
 
 
-class BoolField(types.TypeDecorator):
+class BoolField(MemoBindMixin, types.TypeDecorator):
     impl = types.Boolean
     # NOTE: origin `sqltypes.Boolean` use _strict_bools = frozenset([None, True, False])
 
@@ -126,7 +192,7 @@ class TrimString(types.TypeDecorator):
         return value
 
 
-class SnakeField(types.TypeDecorator):
+class SnakeField(MemoBindMixin, types.TypeDecorator):
     impl = types.String
 
     def process_bind_param(self, value, dialect):
@@ -138,7 +204,7 @@ class SnakeField(types.TypeDecorator):
             raise CustomParameterError(f"invalid ${type(value)}:'{value}', Column<SnakeField> require [0-9a-zA-Z_]")
 
 
-class StringTags(types.TypeDecorator):
+class StringTags(MemoBindMixin, types.TypeDecorator):
     impl = types.String
 
     def process_bind_param(self, value, dialect):
@@ -149,7 +215,7 @@ class StringTags(types.TypeDecorator):
         return ""
 
 
-class SortedTags(types.TypeDecorator):
+class SortedTags(MemoBindMixin, types.TypeDecorator):
     impl = types.JSON
 
     def process_bind_param(self, value, dialect):
@@ -166,24 +232,198 @@ class SortedTags(types.TypeDecorator):
 SortedTagsArray = SortedTags
 
 
+class LazyJson(object):
+    """
+    JSON text decoded on first access, proxy of the decoded dict/list.
+    - value: the decoded object
+    - text: the raw JSON text, re-bound as it is if never decoded
+    """
+    __slots__ = ('text', '_loads', '_value')
+    _UNDECODED = object()
+
+    def __init__(self, text, loads=json.loads):
+        self.text = text
+        self._loads = loads
+        self._value = self._UNDECODED
+
+    @property
+    def decoded(self):
+        return self._value is not self._UNDECODED
+
+    @property
+    def value(self):
+        if self._value is self._UNDECODED:
+            self._value = self._loads(self.text)
+        return self._value
+
+    def to_json(self):
+        # refer: `utils.BaseJSONEncoder.stringify`
+        return self.value
+
+    def __getattr__(self, name):
+        # eg: keys/items/get/append
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __setitem__(self, key, value):
+        self.value[key] = value
+
+    def __delitem__(self, key):
+        del self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __contains__(self, item):
+        return item in self.value
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyJson):
+            other = other.value
+        return self.value == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self.decoded:
+            return "LazyJson({!r})".format(self._value)
+        return "LazyJson(<undecoded {} chars>)".format(len(self.text))
+
+
+class JsonBackend(object):
+    """
+    loads(text) => object; dumps(obj, indent=None, encoder=None) => str
+    builtin: "stdlib", "orjson", "simdjson" (pysimdjson), fallback to "stdlib" if not installed.
+    """
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _stdlib_dumps(obj, indent=None, encoder=json.JSONEncoder):
+    separators = None if indent else (',', ':')
+    return json.dumps(obj, indent=indent, separators=separators, cls=encoder)
+
+
+def _make_json_backends():
+    backends = dict(stdlib=JsonBackend("stdlib", json.loads, _stdlib_dumps))
+    try:
+        import orjson
+
+        def orjson_dumps(obj, indent=None, encoder=json.JSONEncoder):
+            option = orjson.OPT_INDENT_2 if indent else 0
+            return orjson.dumps(obj, default=encoder().default, option=option).decode()
+
+        backends["orjson"] = JsonBackend("orjson", orjson.loads, orjson_dumps)
+    except ImportError:
+        pass
+    try:
+        import simdjson
+        backends["simdjson"] = JsonBackend("simdjson", simdjson.loads, _stdlib_dumps)
+    except ImportError:
+        pass
+    return backends
+
+
+JSON_BACKEND_NAMES = ("stdlib", "orjson", "simdjson")
+JSON_BACKENDS = _make_json_backends()
+
+
+def json_backend(backend):
+    # name or JsonBackend => JsonBackend
+    if isinstance(backend, JsonBackend):
+        return backend
+    if backend not in JSON_BACKEND_NAMES:
+        raise ValueError("unknown json backend {!r}, expected one of {}".format(backend, JSON_BACKEND_NAMES))
+    # optional backends fallback to stdlib if not installed
+    return JSON_BACKENDS.get(backend) or JSON_BACKENDS["stdlib"]
+
+
 class OrderedJson(types.TypeDecorator):
+    """
+    :param lazy: return `LazyJson` of the raw text, decoded by OrderedDict on first access
+    """
     impl = types.JSON
+    cache_ok = True
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+
+    def __init__(self, *args, lazy=False, **kwargs):
+        self.lazy = lazy
+        super().__init__(*args, **kwargs)
+
+    def result_processor(self, dialect, coltype):
+        if not self.lazy:
+            return super().result_processor(dialect, coltype)
+        decode = self.decoder.decode
+
+        def process(value):
+            # NOTE: some drivers (eg: psycopg2) return decoded values
+            if isinstance(value, str):
+                return LazyJson(value, decode)
+            return value
+
+        return process
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, LazyJson):
+            return value.value
+        return value
 
     def process_result_value(self, value, dialect):
         if isinstance(value, str):
-            return json.JSONDecoder(object_pairs_hook=OrderedDict).decode(value)
+            return self.decoder.decode(value)
         return value
 
 
 class JsonText(types.TypeDecorator):
+    """
     # NOTE: actually it supports `sqltypes.JSON`
     # https://docs.sqlalchemy.org/en/13/core/custom_types.html#sqlalchemy.types.TypeDecorator
+    :param lazy: return `LazyJson`, decoded on first access
+    :param backend: "stdlib" | "orjson" | "simdjson" | JsonBackend, refer: `JSON_BACKENDS`
+    :param indent: None is compact, eg: `JsonText(indent=2)` for the former format
+    """
     impl = types.Text
+    cache_ok = True
     JSONDecoder = json.JSONDecoder
     JSONEncoder = json.JSONEncoder
 
+    def __init__(self, *args, lazy=False, backend="stdlib", indent=None, **kwargs):
+        self.lazy = lazy
+        self.backend = json_backend(backend)
+        self.indent = indent
+        super().__init__(*args, **kwargs)
+
+    def _loads(self, text):
+        if self.backend.name == "stdlib":
+            return json.loads(text, cls=self.JSONDecoder)
+        return self.backend.loads(text)
+
     def process_bind_param(self, value, dialect):
-        return json.dumps(value, indent=2, cls=self.JSONEncoder)
+        if isinstance(value, LazyJson):
+            if not value.decoded:
+                return value.text
+            value = value.value
+        return self.backend.dumps(value, indent=self.indent, encoder=self.JSONEncoder)
 
     def process_result_value(self, value, dialect):
-        return json.loads(value, cls=self.JSONDecoder)
+        if value is None:
+            return None
+        if self.lazy:
+            return LazyJson(value, self._loads)
+        return self._loads(value)
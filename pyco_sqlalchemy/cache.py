@@ -0,0 +1,177 @@
+"""
+cache backends of `BaseModel._pk_cache`, values are column dicts of a row.
+
+key: (namespace, ident), namespace is the model name, ident is the primary key tuple.
+- LRUCache: in-process, LRU + TTL.
+- SharedMemoryCache: direct-mapped slots in `multiprocessing.shared_memory`, shared across worker processes.
+"""
+import time
+import zlib
+import pickle
+import struct
+import threading
+from collections import OrderedDict
+
+
+class CacheBackend(object):
+    """
+    interface of cache backends, `get` returns None if missing.
+    stats: counters of the current process, dict(hits, misses, evictions)
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.stats = dict(hits=0, misses=0, evictions=0)
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self, namespace=None):
+        # drop keys of $namespace, or all keys if None
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+
+    def __init__(self, maxsize=1024, ttl=60):
+        super().__init__(ttl=ttl)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire_at, value = item
+                if expire_at is None or expire_at > time.time():
+                    self._data.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._data[key]
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        expire_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, namespace=None):
+        with self._lock:
+            if namespace is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if k[0] == namespace]:
+                    del self._data[key]
+
+
+class SharedMemoryCache(CacheBackend):
+    """
+    create it in the master process before forking workers, and attach by name in each worker:
+    >>> cache = SharedMemoryCache("pyco_users", create=True)  # master
+    >>> cache = SharedMemoryCache("pyco_users")  # workers
+
+    layout: [generation of namespaces] + [slot] * slots
+        slot: [crc32 of payload][length of payload][payload: pickle((key, generation, expire_at, value))]
+    lock-free: a torn or concurrent write fails the crc32 check, and is read as a miss.
+    `clear(namespace)` bumps the generation of the namespace, old slots are ignored.
+    NOTE: python<3.13 unlinks the segment when the process attached it exits,
+          unless it shares the resource tracker of the master, i.e. forked from it.
+    """
+    GENERATIONS = 64
+    _HEADER = struct.Struct("<II")
+    _GEN = struct.Struct("<Q")
+
+    def __init__(self, name, slots=4096, slot_size=1024, ttl=60, create=False):
+        from multiprocessing import shared_memory
+        super().__init__(ttl=ttl)
+        self.slots = slots
+        self.slot_size = slot_size
+        self._offset = self.GENERATIONS * self._GEN.size
+        size = self._offset + slots * slot_size
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._created = create
+        if create:
+            self.shm.buf[:size] = bytes(size)
+
+    def close(self):
+        self.shm.close()
+        if self._created:
+            self.shm.unlink()
+
+    @staticmethod
+    def _hash(obj):
+        # builtin hash() of str is randomized per process
+        return zlib.crc32(repr(obj).encode())
+
+    def _generation_offset(self, namespace):
+        return self._hash(namespace) % self.GENERATIONS * self._GEN.size
+
+    def _generation(self, namespace):
+        return self._GEN.unpack_from(self.shm.buf, self._generation_offset(namespace))[0]
+
+    def _slot(self, key):
+        return self._offset + self._hash(key) % self.slots * self.slot_size
+
+    def _read(self, pos):
+        crc, n = self._HEADER.unpack_from(self.shm.buf, pos)
+        if n == 0 or n > self.slot_size - self._HEADER.size:
+            return None
+        payload = bytes(self.shm.buf[pos + self._HEADER.size:pos + self._HEADER.size + n])
+        if zlib.crc32(payload) != crc:
+            return None
+        return pickle.loads(payload)
+
+    def get(self, key):
+        item = self._read(self._slot(key))
+        if item is not None:
+            k, gen, expire_at, value = item
+            if k == key and gen == self._generation(key[0]) and (expire_at is None or expire_at > time.time()):
+                self.stats["hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        expire_at = time.time() + self.ttl if self.ttl else None
+        payload = pickle.dumps((key, self._generation(key[0]), expire_at, value), protocol=pickle.HIGHEST_PROTOCOL)
+        pos = self._slot(key)
+        if len(payload) > self.slot_size - self._HEADER.size:
+            # too large to cache, drop the old value of the slot
+            self._HEADER.pack_into(self.shm.buf, pos, 0, 0)
+            return
+        old = self._read(pos)
+        if old is not None and old[0] != key:
+            self.stats["evictions"] += 1
+        # invalidate the slot first, then write payload and header
+        self._HEADER.pack_into(self.shm.buf, pos, 0, 0)
+        start = pos + self._HEADER.size
+        self.shm.buf[start:start + len(payload)] = payload
+        self._HEADER.pack_into(self.shm.buf, pos, zlib.crc32(payload), len(payload))
+
+    def delete(self, key):
+        self._HEADER.pack_into(self.shm.buf, self._slot(key), 0, 0)
+
+    def clear(self, namespace=None):
+        if namespace is None:
+            n = self.GENERATIONS * self._GEN.size
+            self.shm.buf[self._offset:] = bytes(len(self.shm.buf) - self._offset)
+            self.shm.buf[:n] = bytes(n)
+        else:
+            pos = self._generation_offset(namespace)
+            self._GEN.pack_into(self.shm.buf, pos, self._generation(namespace) + 1)
@@ -0,0 +1,247 @@
+"""
+query instrumentation of `_flask.BaseModel`, disabled by default.
+- per model and method: calls, errors, SQL statements, rows, latency histogram
+- slow query log of statements over `slow_ms`, by the logger of `FLASK_SQL_LOGGER`
+- N+1 warning if the same statement is executed `n_plus_one` times in one app context
+
+>>> from pyco_sqlalchemy.instrument import instrument, LoggingExporter
+>>> instrument.enable(slow_ms=200)
+>>> instrument.add_exporter(LoggingExporter())
+>>> instrument.snapshot()["User.filter_by"]
+{'calls': 3, 'errors': 0, 'statements': 3, 'rows': 30, 'total_ms': 2.1, 'max_ms': 1.2, 'histogram': {...}}
+>>> instrument.export()
+
+NOTE: the methods are wrapped and the engine events are listened only while enabled,
+      `disable()` restores them, so it costs nothing when disabled.
+      rows: affected rows of DML statements if any, else the count of returned models/items.
+"""
+import time
+import json
+import threading
+import contextvars
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flask import g, has_app_context
+from ._base import logger
+from ._flask import BaseModel, CoModel
+
+# upper bounds of latency buckets in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+INSTRUMENTED_METHODS = {
+    BaseModel: (
+        "insert", "insert_many", "upsert_many", "upsert_one", "update_where", "discard", "discard_in_batches",
+        "page_items", "filter_by", "count", "get_or_none", "getOr404", "update", "save", "remove",
+    ),
+    CoModel: ("lastOrNone", "lastOr404"),
+}
+
+# statements out of the instrumented methods
+UNSCOPED = "sql"
+
+_frames = contextvars.ContextVar("pyco_instrument_frames", default=())
+
+
+class MethodStats(object):
+    __slots__ = ("calls", "errors", "statements", "rows", "total_ms", "max_ms", "n_plus_one", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.statements = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.n_plus_one = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def observe(self, ms):
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def to_dict(self):
+        histogram = {"+Inf" if b == float("inf") else str(b): n for b, n in zip(BUCKETS_MS, self.buckets)}
+        return dict(calls=self.calls, errors=self.errors, statements=self.statements, rows=self.rows,
+                    total_ms=round(self.total_ms, 3), max_ms=round(self.max_ms, 3),
+                    n_plus_one=self.n_plus_one, histogram=histogram)
+
+
+class _Frame(object):
+    __slots__ = ("key", "statements", "rows")
+
+    def __init__(self, key):
+        self.key = key
+        self.statements = 0
+        self.rows = 0
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    elif isinstance(result, (list, tuple)):
+        return len(result)
+    elif isinstance(result, dict) and isinstance(result.get("items"), list):
+        return len(result["items"])
+    elif isinstance(result, BaseModel):
+        return 1
+    return 0
+
+
+class Exporter(object):
+    """
+    interface of exporters, `export` receives the `Instrumentation.snapshot()`
+    """
+
+    def export(self, snapshot):
+        raise NotImplementedError
+
+
+class LoggingExporter(Exporter):
+
+    def __init__(self, log=logger):
+        self.logger = log
+
+    def export(self, snapshot):
+        for key, stats in snapshot.items():
+            self.logger.info("sql-metrics {} {}".format(key, json.dumps(stats)))
+
+
+class Instrumentation(object):
+    """
+    :param slow_ms: log statements slower than it, None to disable
+    :param n_plus_one: warn if the same statement runs this times in one app context, None to disable
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = None
+        self.n_plus_one = None
+        self.exporters = []
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def _get_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, MethodStats())
+        return stats
+
+    def enable(self, slow_ms=500, n_plus_one=10):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        if self.enabled:
+            return
+        for model, names in INSTRUMENTED_METHODS.items():
+            for name in names:
+                orig = model.__dict__[name]
+                self._originals.append((model, name, orig))
+                setattr(model, name, self._wrap(name, orig))
+        event.listen(Engine, "before_cursor_execute", self._before_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_execute)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        event.remove(Engine, "before_cursor_execute", self._before_execute)
+        event.remove(Engine, "after_cursor_execute", self._after_execute)
+        for model, name, orig in reversed(self._originals):
+            setattr(model, name, orig)
+        self._originals = []
+        self.enabled = False
+
+    def _wrap(self, name, orig):
+        is_classmethod = isinstance(orig, classmethod)
+        func = orig.__func__ if is_classmethod else orig
+        instrumentation = self
+
+        def wrapper(obj, *args, **kwargs):
+            model = obj if is_classmethod else type(obj)
+            frame = _Frame("{}.{}".format(model.__name__, name))
+            token = _frames.set(_frames.get() + (frame,))
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                result = func(obj, *args, **kwargs)
+                ok = True
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                _frames.reset(token)
+                stats = instrumentation._get_stats(frame.key)
+                with instrumentation._lock:
+                    stats.calls += 1
+                    stats.errors += not ok
+                    stats.statements += frame.statements
+                    stats.rows += frame.rows or (_count_rows(result) if ok else 0)
+                    stats.observe(ms)
+            return result
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return classmethod(wrapper) if is_classmethod else wrapper
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("pyco_instrument_t0", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        ms = (time.perf_counter() - conn.info["pyco_instrument_t0"].pop()) * 1000
+        frames = _frames.get()
+        key = frames[-1].key if frames else UNSCOPED
+        rows = 0
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete) and cursor.rowcount > 0:
+            rows = cursor.rowcount
+        for frame in frames:
+            frame.statements += 1
+            frame.rows += rows
+        if not frames:
+            stats = self._get_stats(UNSCOPED)
+            with self._lock:
+                stats.calls += 1
+                stats.statements += 1
+                stats.rows += rows
+                stats.observe(ms)
+
+        if self.slow_ms is not None and ms >= self.slow_ms:
+            logger.warning("slow query {:.1f}ms [{}]: {}; params={:.200}".format(ms, key, statement, repr(parameters)))
+        if self.n_plus_one and has_app_context():
+            counter = g.setdefault("_pyco_statements", Counter())
+            counter[statement] += 1
+            if counter[statement] == self.n_plus_one:
+                stats = self._get_stats(key)
+                with self._lock:
+                    stats.n_plus_one += 1
+                msg = "N+1 query: executed {} times in one app context [{}]: {}"
+                logger.warning(msg.format(self.n_plus_one, key, statement))
+
+    def snapshot(self):
+        # {"Model.method": MethodStats.to_dict()}
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def add_exporter(self, exporter: Exporter):
+        self.exporters.append(exporter)
+
+    def export(self):
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                logger.exception(e)
+        return snapshot
+
+
+instrument = Instrumentation()
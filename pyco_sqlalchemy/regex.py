@@ -1,5 +1,8 @@
 import re
 
+_NON_ALPHANUMERIC = re.compile('[^0-9a-zA-Z]+')
+_CAMEL_BOUNDARY = re.compile('((?<=[a-z0-9])[A-Z]|(?!^)[A-Z](?=[a-z]))')
+
 
 def alphanumeric(s: str, sep='_'):
     """
@@ -9,7 +12,7 @@ def alphanumeric(s: str, sep='_'):
     >>> alphanumeric('h^&ell`.,|o w]{+orld')
     'h_ell_o_w_orld'
     """
-    return re.sub('[^0-9a-zA-Z]+', sep, s.strip())
+    return _NON_ALPHANUMERIC.sub(sep, s.strip())
 
 
 def simple_case(s: str):
@@ -39,8 +42,7 @@ def snake_case(s: str):
     'http_response_code_xyz'
     """
     s = alphanumeric(s, '_')
-    a = re.compile('((?<=[a-z0-9])[A-Z]|(?!^)[A-Z](?=[a-z]))')
-    return a.sub(r'_\1', s).lower()
+    return _CAMEL_BOUNDARY.sub(r'_\1', s).lower()
 
 
 def camel_case(s: str):
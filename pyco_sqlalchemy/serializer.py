@@ -0,0 +1,121 @@
+"""
+compact JSON serializer of models, precompiled by the column types of a model.
+the output is compatible with `utils.json_stringify([m.to_dict() for m in items])`, without indent.
+
+optional: `orjson` is used if installed.
+"""
+import io
+import json
+import uuid
+from datetime import datetime
+from operator import attrgetter
+from .utils import BaseJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_stdlib_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=BaseJSONEncoder.stringify)
+
+if orjson is not None:
+    # datetime/dataclass fallback to `BaseJSONEncoder.stringify` as json_stringify does
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+def encode(obj, use_orjson=True):
+    # compact json bytes of obj, never raise TypeError as `json_stringify`
+    if use_orjson and orjson is not None:
+        try:
+            return orjson.dumps(obj, default=BaseJSONEncoder.stringify, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # eg: integers out of 64-bit range
+            pass
+    return _stdlib_encoder.encode(obj).encode()
+
+
+def _datetime_str(v):
+    # same as `BaseJSONEncoder.stringify`
+    return str(v.astimezone())
+
+
+def column_converter(col_type):
+    # converter of non-null column values, None if they are left to the encoder
+    try:
+        tp = col_type.python_type
+    except NotImplementedError:
+        return None
+    if issubclass(tp, datetime):
+        return _datetime_str
+    elif issubclass(tp, uuid.UUID):
+        return str
+    return None
+
+
+class ModelSerializer(object):
+    """
+    >>> s = ModelSerializer(User)
+    >>> s.dumps(User.filter_by())
+    b'[{"_type":"User","id":1,...}]'
+    >>> with open("users.json", "wb") as fp:
+            s.dump(User.iter_by(), fp)
+    """
+
+    def __init__(self, model, use_orjson=True):
+        self.model = model
+        self.use_orjson = use_orjson
+        column_attrs = model._schema().column_attrs
+        self.names = [name for name, _ in column_attrs]
+        attrs = [attr for _, attr in column_attrs]
+        self._attrs = frozenset(attrs)
+        getter = attrgetter(*attrs)
+        self._getter = getter if len(attrs) > 1 else lambda m: (getter(m),)
+        columns = model.__table__.columns
+        self.converters = []
+        for i, name in enumerate(self.names):
+            conv = column_converter(columns[name].type)
+            if conv is not None:
+                self.converters.append((i, name, conv))
+
+    def row(self, m):
+        # dict same as `BaseModel.to_dict`, values are JSON-ready; accepts dicts of `BaseModel.iter_dicts` too
+        if isinstance(m, dict):
+            d = dict(m)
+            for _, name, conv in self.converters:
+                v = d.get(name)
+                if v is not None:
+                    d[name] = conv(v)
+            return d
+        if not self._attrs <= m.__dict__.keys():
+            # deferred or expired columns, refer: `to_dict`
+            return self.row(m.to_dict())
+        values = self._getter(m)
+        d = {"_type": self.model.__name__}
+        d.update(zip(self.names, values))
+        for i, name, conv in self.converters:
+            v = values[i]
+            if v is not None:
+                d[name] = conv(v)
+        return d
+
+    def dumps(self, items):
+        return encode([self.row(m) for m in items], self.use_orjson)
+
+    def dump(self, items, fp, batch_size=1000):
+        # write a JSON array to binary or text stream, by batches of rows
+        is_text = isinstance(fp, io.TextIOBase)
+        write = (lambda b: fp.write(b.decode())) if is_text else fp.write
+        sep = b"["
+        rows = []
+        n = 0
+        for m in items:
+            rows.append(encode(self.row(m), self.use_orjson))
+            if len(rows) >= batch_size:
+                write(sep + b",".join(rows))
+                sep = b","
+                n += len(rows)
+                rows = []
+        if rows or n == 0:
+            write(sep + b",".join(rows))
+        write(b"]")
+        return n + len(rows)
@@ -0,0 +1,229 @@
+"""
+inverted index of tag columns (`SortedTags`, `StringTags`), opt-in per model:
+
+>>> class Post(db.Model, BaseModel):
+        __tag_index__ = ("tags",)
+        tags = db.Column(SortedTags())
+>>> Post.filter_by_tags("tags", any_of=["a", "b"], none_of=["c"], order_by=Post.id.desc(), limit=10)
+
+the side table `<table>_tags` of (attr, tag, primary keys...) is created by `db.create_all()`,
+and maintained by flush of the ORM session, including `discard/discard_in_batches/update_where`.
+NOTE: Core inserts bypass the flush, eg: `insert_many/upsert_many/transfer.import_file`, rebuild after them:
+$ python -m pyco_sqlalchemy.tag_index rebuild app.models:Post --url sqlite:///app.db
+"""
+import sys
+import argparse
+from sqlalchemy import Table, Column, String, Index, PrimaryKeyConstraint, create_engine, event, inspect, \
+    select, tuple_, func
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from ._base import logger, ModelMixin
+
+TABLE_SUFFIX = "_tags"
+TAG_LENGTH = 191  # max length of indexed utf8mb4 strings of mysql
+
+
+def tag_set(value):
+    # tags of a column value, same as `SortedTags.process_bind_param`: list or comma string
+    if not value:
+        return set()
+    if isinstance(value, str):
+        tags = (x.strip() for x in value.split(","))
+    elif isinstance(value, (list, tuple, set)):
+        tags = map(str, value)
+    else:
+        tags = [str(value)]
+    return {t for t in tags if t}
+
+
+def indexed(cls):
+    return getattr(cls, "_tag_table", None) is not None
+
+
+def _pk_columns(side):
+    return [c for c in side.primary_key.columns if c.name not in ("attr", "tag")]
+
+
+@event.listens_for(ModelMixin, "instrument_class", propagate=True)
+def _build_tag_table(mapper, cls):
+    attrs = getattr(cls, "__tag_index__", None)
+    tbl = mapper.local_table
+    if not attrs or tbl is None:
+        return
+    name = tbl.name + TABLE_SUFFIX
+    side = tbl.metadata.tables.get(name)
+    if side is None:
+        pks = [Column(c.name, c.type) for c in tbl.primary_key.columns]
+        side = Table(
+            name, tbl.metadata,
+            Column("attr", String(64), nullable=False),
+            Column("tag", String(TAG_LENGTH), nullable=False),
+            *pks,
+            PrimaryKeyConstraint("attr", "tag", *[c.name for c in pks]),
+            Index("ix_{}_pk".format(name), *[c.name for c in pks]),
+            info=dict(tbl.info),
+        )
+    cls._tag_table = side
+
+
+def _rows(obj_or_row, pk, attrs):
+    # index rows of a model or a Core row
+    return [
+        dict(attr=attr, tag=tag, **pk)
+        for attr in attrs
+        for tag in sorted(tag_set(getattr(obj_or_row, attr)))
+    ]
+
+
+def _pk_dict(side, values):
+    return {c.name: v for c, v in zip(_pk_columns(side), values)}
+
+
+def _in(cols, pks):
+    # pks: scalars, tuples or rows of primary keys
+    if len(cols) == 1:
+        return cols[0].in_([pk[0] if isinstance(pk, (tuple, list, Row)) else pk for pk in pks])
+    return tuple_(*cols).in_([tuple(pk) for pk in pks])
+
+
+def delete_rows(conn, cls, pks, attrs=None):
+    # drop tags of the rows of $pks, of all indexed attrs if attrs is None
+    side = cls._tag_table
+    if not pks:
+        return
+    stmt = side.delete().where(_in(_pk_columns(side), pks))
+    if attrs is not None:
+        stmt = stmt.where(side.c.attr.in_(list(attrs)))
+    conn.execute(stmt)
+
+
+def reindex_rows(conn, cls, pks, attrs=None, chunk_size=500):
+    # rewrite tags of the rows of $pks by the values in the table
+    side = cls._tag_table
+    attrs = list(attrs or cls.__tag_index__)
+    pk_cols = list(inspect(cls).primary_key)
+    stmt = select(*pk_cols, *[getattr(cls, attr) for attr in attrs])
+    pks = list(pks)
+    for i in range(0, len(pks), chunk_size):
+        chunk = pks[i:i + chunk_size]
+        delete_rows(conn, cls, chunk, attrs)
+        rows = []
+        for r in conn.execute(stmt.where(_in(pk_cols, chunk))):
+            rows.extend(_rows(r, _pk_dict(side, r[:len(pk_cols)]), attrs))
+        if rows:
+            conn.execute(side.insert(), rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_tag_index(sess, flush_context):
+    # the attribute history is not reset yet in `after_flush`
+    inserts = {}
+    for m in sess.new:
+        cls = type(m)
+        if indexed(cls):
+            mapper = inspect(cls)
+            pk = _pk_dict(cls._tag_table, mapper.primary_key_from_instance(m))
+            inserts.setdefault(cls, []).extend(_rows(m, pk, cls.__tag_index__))
+    deletes = {}
+    for m in sess.dirty:
+        cls = type(m)
+        if indexed(cls):
+            changed = [attr for attr in cls.__tag_index__ if get_history(m, attr).has_changes()]
+            if changed:
+                ident = inspect(cls).primary_key_from_instance(m)
+                conn = sess.connection(bind_arguments=dict(mapper=inspect(cls)))
+                delete_rows(conn, cls, [ident], changed)
+                pk = _pk_dict(cls._tag_table, ident)
+                inserts.setdefault(cls, []).extend(_rows(m, pk, changed))
+    for m in sess.deleted:
+        cls = type(m)
+        if indexed(cls):
+            deletes.setdefault(cls, []).append(inspect(m).identity)
+    for cls, pks in deletes.items():
+        delete_rows(sess.connection(bind_arguments=dict(mapper=inspect(cls))), cls, pks)
+    for cls, rows in inserts.items():
+        if rows:
+            sess.connection(bind_arguments=dict(mapper=inspect(cls))).execute(cls._tag_table.insert(), rows)
+
+
+def tag_conditions(cls, attr, any_of=None, all_of=None, none_of=None):
+    """
+    SQL conditions of the primary keys resolved in the index, AND-ed by the caller:
+    - any_of: pk IN (union of the rows of the tags)
+    - all_of: pk IN (intersection of the rows of the tags, by GROUP BY pk HAVING COUNT(*) = n)
+    - none_of: pk NOT IN (union of the rows of the tags)
+    """
+    if not indexed(cls) or attr not in cls.__tag_index__:
+        raise ValueError("{}.{} is not in __tag_index__".format(cls.__name__, attr))
+    side = cls._tag_table
+    side_pks = _pk_columns(side)
+    mapper = inspect(cls)
+    pk = tuple_(*mapper.primary_key) if len(side_pks) > 1 else mapper.primary_key[0]
+    clauses = []
+
+    def rows_of(tags):
+        return select(*side_pks).where(side.c.attr == attr, side.c.tag.in_(sorted(tags)))
+
+    any_of, all_of, none_of = tag_set(any_of), tag_set(all_of), tag_set(none_of)
+    if any_of:
+        clauses.append(pk.in_(rows_of(any_of)))
+    if all_of:
+        clauses.append(pk.in_(rows_of(all_of).group_by(*side_pks).having(func.count() == len(all_of))))
+    if none_of:
+        clauses.append(pk.notin_(rows_of(none_of)))
+    return clauses
+
+
+def rebuild(cls, conn, batch_size=1000):
+    """
+    rebuild the index of cls from the table, in the transaction of conn.
+    :return: count of the index rows
+    """
+    side = cls._tag_table
+    side.create(conn, checkfirst=True)
+    conn.execute(side.delete())
+    mapper = inspect(cls)
+    pk_cols = list(mapper.primary_key)
+    attrs = list(cls.__tag_index__)
+    stmt = select(*pk_cols, *[getattr(cls, attr) for attr in attrs]).order_by(*pk_cols)
+    n = 0
+    last = None
+    while True:
+        qry = stmt if last is None else stmt.where(tuple_(*pk_cols) > tuple_(*last))
+        rows = conn.execute(qry.limit(batch_size)).fetchall()
+        if not rows:
+            break
+        values = []
+        for r in rows:
+            values.extend(_rows(r, _pk_dict(side, r[:len(pk_cols)]), attrs))
+        if values:
+            conn.execute(side.insert(), values)
+        n += len(values)
+        last = tuple(rows[-1][:len(pk_cols)])
+    logger.info("rebuilt {} rows of {}".format(n, side.name))
+    return n
+
+
+def main(argv=None):
+    from .transfer import load_model
+    parser = argparse.ArgumentParser(prog="python -m pyco_sqlalchemy.tag_index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser("rebuild", help="rebuild the tag index of a model from its table")
+    cmd.add_argument("model", help="package.module:Model")
+    cmd.add_argument("--url", required=True, help="database URL")
+    cmd.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    model = load_model(args.model)
+    engine = create_engine(args.url)
+    try:
+        with engine.begin() as conn:
+            n = rebuild(model, conn, batch_size=args.batch_size)
+    finally:
+        engine.dispose()
+    print("rebuilt {} rows of {}".format(n, model._tag_table.name))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,465 @@
+"""
+bulk transfer of BaseModel tables.
+
+export: split the table by ranges of an integer primary key, export partitions in a process pool,
+    each worker opens its own engine of $url, and writes `<table>-<i>.<jsonl|csv>` and `manifest.json`.
+
+>>> export_table(Post, "postgresql://...", "dump/posts", fmt="jsonl", partitions=16, workers=8)
+$ python -m pyco_sqlalchemy.transfer export app.models:Post --url sqlite:///app.db --out dump/posts -p 16 -w 8
+
+NOTE: the model must be importable in workers, in-memory sqlite can not be shared by workers.
+
+import: stream rows of a CSV/JSONL file, coerce values by the column types, insert by chunked transactions,
+    checkpoint the file offset of the last committed chunk to resume, and write bad rows to a reject file.
+
+>>> import_file(Post, "postgresql://...", "posts.csv", chunk_size=1000)
+$ python -m pyco_sqlalchemy.transfer import app.models:Post --url sqlite:///app.db posts.csv
+
+NOTE: rows of a chunk committed right before a crash may be imported again by resuming,
+      a unique key is recommended to reject them.
+"""
+import io
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import importlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from sqlalchemy import create_engine, select, func, and_, bindparam, types
+from sqlalchemy.engine import Engine
+from . import utils
+from ._base import logger
+from ._types import BoolField, JsonText, OrderedJson
+from .serializer import ModelSerializer, encode
+
+FORMATS = ("jsonl", "csv")
+
+
+def load_model(path):
+    # "package.module:Model" => Model
+    module, _, name = path.partition(":")
+    obj = importlib.import_module(module)
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _pk_column(model):
+    pks = list(model.__table__.primary_key.columns)
+    if len(pks) == 1:
+        try:
+            if issubclass(pks[0].type.python_type, int):
+                return pks[0]
+        except NotImplementedError:
+            pass
+    return None
+
+
+def _where(model, condition):
+    # $condition of `strict_form` => SQL expression of table columns
+    attr_columns = model._schema().attr_columns
+    tbl = model.__table__
+    form = model.strict_form(condition)
+    return and_(*[tbl.c[attr_columns[k]] == v for k, v in form.items()])
+
+
+def pk_ranges(model, engine, partitions, condition=None):
+    # [(lo, hi)] of integer primary key, lo inclusive and hi exclusive, hi of the last range is None
+    pk = _pk_column(model)
+    if pk is None or partitions <= 1:
+        return [(None, None)]
+    stmt = select(func.min(pk), func.max(pk))
+    if condition:
+        stmt = stmt.where(_where(model, condition))
+    with engine.connect() as conn:
+        lo, hi = conn.execute(stmt).one()
+    if lo is None:
+        return [(None, None)]
+    step = max((hi - lo + 1) // partitions, 1)
+    bounds = list(range(lo, hi + 1, step))[:partitions] + [None]
+    return [(bounds[i] if i else None, bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    elif isinstance(v, (dict, list)):
+        return encode(v).decode()
+    return v
+
+
+def export_partition(model, url, path, fmt="jsonl", lo=None, hi=None, condition=None, chunk_size=10000,
+                     engine_kws=None):
+    """
+    export rows of lo <= pk < hi to $path, values are serialized as `ModelSerializer`.
+    :return: dict(path, lo, hi, rows, bytes, seconds)
+    """
+    t0 = time.monotonic()
+    engine = create_engine(url, **(engine_kws or {}))
+    tbl = model.__table__
+    ser = ModelSerializer(model)
+    names = [name for name, _ in model._schema().column_attrs]
+    stmt = select(*[tbl.c[name] for name in names])
+    pk = _pk_column(model)
+    if lo is not None:
+        stmt = stmt.where(pk >= lo)
+    if hi is not None:
+        stmt = stmt.where(pk < hi)
+    if condition:
+        stmt = stmt.where(_where(model, condition))
+    if pk is not None:
+        stmt = stmt.order_by(pk)
+    n = 0
+    try:
+        fp = open(path, "wb") if fmt == "jsonl" else open(path, "w", newline="")
+        with engine.connect() as conn, fp:
+            if engine.dialect.supports_server_side_cursors:
+                conn = conn.execution_options(stream_results=True)
+            result = conn.execute(stmt)
+            if fmt == "csv":
+                writer = csv.writer(fp)
+                writer.writerow(names)
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if fmt == "jsonl":
+                    fp.write(b"".join(encode(ser.row(dict(zip(names, row)))) + b"\n" for row in rows))
+                else:
+                    for row in rows:
+                        d = ser.row(dict(zip(names, row)))
+                        writer.writerow([_csv_value(d[name]) for name in names])
+                n += len(rows)
+    finally:
+        engine.dispose()
+    return dict(path=os.path.basename(path), lo=lo, hi=hi, rows=n, bytes=os.path.getsize(path),
+                seconds=round(time.monotonic() - t0, 3))
+
+
+def export_table(model, url, out_dir, fmt="jsonl", partitions=None, workers=None, condition=None,
+                 chunk_size=10000, engine_kws=None):
+    """
+    :param partitions: count of primary key ranges, default is workers
+    :param workers: processes of the pool, default is `os.cpu_count()`, 0 to export in this process
+    :return: the manifest, which is written to `<out_dir>/manifest.json`
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown export format: {}".format(fmt))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if partitions is None:
+        partitions = max(workers, 1)
+    started = datetime.now()
+    t0 = time.monotonic()
+    os.makedirs(out_dir, exist_ok=True)
+    engine = create_engine(url, **(engine_kws or {}))
+    try:
+        ranges = pk_ranges(model, engine, partitions, condition)
+    finally:
+        engine.dispose()
+
+    tbl = model.__table__
+    jobs = []
+    for i, (lo, hi) in enumerate(ranges):
+        path = os.path.join(out_dir, "{}-{:04d}.{}".format(tbl.name, i, fmt))
+        jobs.append((model, url, path, fmt, lo, hi, condition, chunk_size, engine_kws))
+    if workers and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(export_partition, *job) for job in jobs]
+            results = [f.result() for f in futures]
+    else:
+        results = [export_partition(*job) for job in jobs]
+
+    manifest = dict(
+        model="{}.{}".format(model.__module__, model.__qualname__),
+        table=tbl.name,
+        format=fmt,
+        columns=[name for name, _ in model._schema().column_attrs],
+        condition=condition,
+        rows=sum(r["rows"] for r in results),
+        partitions=results,
+        started=started.isoformat(),
+        seconds=round(time.monotonic() - t0, 3),
+    )
+    with io.open(os.path.join(out_dir, "manifest.json"), "w") as fp:
+        json.dump(manifest, fp, indent=2, default=str)
+    return manifest
+
+
+def _is_json(tp):
+    return isinstance(tp, (JsonText, OrderedJson, types.JSON)) or isinstance(getattr(tp, "impl", None), types.JSON)
+
+
+def _text_parser(tp):
+    # str of CSV => value of a plain column type
+    if isinstance(tp, types.Boolean):
+        return lambda v: BoolField.BoolStrings.get(v.strip().lower(), True)
+    elif isinstance(tp, types.DateTime):
+        return utils.parse_date
+    elif isinstance(tp, types.Date):
+        return lambda v: utils.parse_date(v).date()
+    elif isinstance(tp, types.Time):
+        return lambda v: utils.parse_date(v).time()
+    elif isinstance(tp, types.Integer):
+        return int
+    elif isinstance(tp, types.Numeric):
+        return Decimal if tp.asdecimal else float
+    elif isinstance(tp, types.JSON):
+        return json.loads
+    return None
+
+
+# plain column types of values serialized as str in JSON
+_NON_JSON_TYPES = (types.DateTime, types.Date, types.Time, types.Numeric)
+
+
+def _lenient_loads(v):
+    try:
+        return json.loads(v)
+    except ValueError:
+        # eg: "a,b" of SortedTags, processed by the TypeDecorator
+        return v
+
+
+def column_coercer(col, from_text=False):
+    """
+    => (coerce, bind_type), `coerce(value)` runs `process_bind_param` of TypeDecorator,
+    and the coerced value is bound as `bind_type` (impl of TypeDecorator) to avoid processing twice.
+    :param from_text: values are str of CSV, "" is NULL unless the column is a string,
+        otherwise str of the types missing in JSON are parsed still, eg: datetimes of `export_table`
+    """
+    tp = col.type
+    is_decorator = isinstance(tp, types.TypeDecorator)
+    impl = tp.impl if is_decorator else tp
+    process = tp.process_bind_param if is_decorator else None
+    parse = None
+    if from_text and _is_json(tp):
+        parse = _lenient_loads if is_decorator else json.loads
+    elif not is_decorator and (from_text or isinstance(impl, _NON_JSON_TYPES)):
+        parse = _text_parser(impl)
+    is_string = isinstance(impl, types.String) and not _is_json(tp)
+
+    def coerce(v):
+        if isinstance(v, str):
+            if from_text and v == "" and not is_string:
+                v = None
+            elif parse is not None:
+                v = parse(v)
+        if process is not None:
+            v = process(v, None)
+        return v
+
+    return coerce, impl
+
+
+def _read_records(path, fmt, offset=0):
+    # => generator of (record, offset after it), record is dict of JSONL or CSV with header
+    with open(path, "rb") as fp:
+        if fmt == "jsonl":
+            fp.seek(offset)
+            while True:
+                line = fp.readline()
+                if not line:
+                    break
+                pos = fp.tell()
+                if line.strip():
+                    yield line, pos
+            return
+
+        state = dict(pos=0)
+
+        def lines():
+            while True:
+                line = fp.readline()
+                if not line:
+                    return
+                state["pos"] = fp.tell()
+                yield line.decode("utf-8-sig" if state["pos"] == len(line) else "utf-8")
+
+        reader = csv.reader(lines())
+        header = next(reader, None)
+        if header is None:
+            return
+        if offset > state["pos"]:
+            fp.seek(offset)
+            state["pos"] = offset
+        for row in reader:
+            if row:
+                yield dict(zip(header, row)), state["pos"]
+
+
+def _write_checkpoint(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump(data, fp)
+    os.replace(tmp, path)
+
+
+def import_file(model, url, path, fmt=None, chunk_size=1000, checkpoint=None, resume=True, reject=None,
+                progress=None, engine_kws=None):
+    """
+    :param url: database URL or Engine
+    :param fmt: "jsonl" | "csv", by the extension of path if None
+    :param checkpoint: path of the checkpoint, default `<path>.checkpoint`, which keeps the offset of
+        the last committed chunk, the import starts from it if resume
+    :param reject: path of rejected rows in JSONL of dict(offset, row, error), default `<path>.rejects.jsonl`
+    :param progress: callback of dict(rows, rejected, offset, rows_per_sec) after each chunk
+    :return: dict(rows, rejected, offset, seconds, rows_per_sec)
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError("Unknown import format: {}".format(fmt))
+    checkpoint = checkpoint or path + ".checkpoint"
+    reject = reject or path + ".rejects.jsonl"
+    state = dict(path=os.path.abspath(path), offset=0, rows=0, rejected=0, done=False)
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint) as fp:
+            state.update(json.load(fp))
+        if state["done"]:
+            logger.warning("import of {} is done by checkpoint {}".format(path, checkpoint))
+            return dict(rows=0, rejected=0, offset=state["offset"], seconds=0, rows_per_sec=0)
+
+    tbl = model.__table__
+    schema = model._schema()
+    # keys of a row are attribute or column names, unknown keys are ignored as `strict_form`
+    columns = {col.name: col for col in tbl.columns}
+    columns.update((attr, tbl.c[key]) for attr, key in schema.attr_columns.items())
+    coercers = {col.key: column_coercer(col, from_text=fmt == "csv") for col in tbl.columns}
+    stmts = {}
+
+    def insert_stmt(keys):
+        stmt = stmts.get(keys)
+        if stmt is None:
+            stmt = stmts[keys] = tbl.insert().values({k: bindparam(k, type_=coercers[k][1]) for k in keys})
+        return stmt
+
+    t0 = time.monotonic()
+    rows = rejected = 0
+    base_rows, base_rejected = state["rows"], state["rejected"]
+    engine = url if isinstance(url, Engine) else create_engine(url, **(engine_kws or {}))
+    rejects = open(reject, "a")
+
+    def reject_row(offset, row, error):
+        rejects.write(json.dumps(dict(offset=offset, row=row, error=str(error)), default=str) + "\n")
+
+    def commit(chunk, offset):
+        nonlocal rows, rejected
+        groups = {}
+        for p in chunk:
+            groups.setdefault(tuple(sorted(p[1])), []).append(p)
+        try:
+            with engine.begin() as conn:
+                for keys, group in groups.items():
+                    conn.execute(insert_stmt(keys), [p for _, p, _ in group])
+            rows += len(chunk)
+        except Exception as e:
+            # retry row by row, reject the rows failed
+            logger.warning("import chunk of {} failed, retry by rows: {}".format(path, e))
+            for row_offset, p, raw in chunk:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert_stmt(tuple(sorted(p))), p)
+                    rows += 1
+                except Exception as e:
+                    reject_row(row_offset, raw, e)
+                    rejected += 1
+        rejects.flush()
+        state.update(offset=offset, rows=base_rows + rows, rejected=base_rejected + rejected)
+        _write_checkpoint(checkpoint, state)
+        if progress is not None:
+            dt = time.monotonic() - t0
+            progress(dict(rows=rows, rejected=rejected, offset=offset, rows_per_sec=rows / dt if dt else 0))
+
+    try:
+        chunk = []
+        offset = state["offset"]
+        defaults = model._chunk_defaults()
+        for record, pos in _read_records(path, fmt, state["offset"]):
+            row_offset, offset = offset, pos
+            row = None
+            try:
+                row = json.loads(record) if fmt == "jsonl" else record
+                if not isinstance(row, dict):
+                    raise ValueError("row must be an object")
+                p = {}
+                for k, v in row.items():
+                    col = columns.get(k)
+                    if col is not None:
+                        p[col.key] = coercers[col.key][0](v)
+                for k, v in defaults.items():
+                    key = columns[k].key
+                    if key not in p:
+                        p[key] = coercers[key][0](v)
+            except Exception as e:
+                if row is None:
+                    row = record.decode() if isinstance(record, bytes) else record
+                reject_row(row_offset, row, e)
+                rejected += 1
+                continue
+            chunk.append((row_offset, p, row))
+            if len(chunk) >= chunk_size:
+                commit(chunk, offset)
+                chunk = []
+                defaults = model._chunk_defaults()
+        commit(chunk, offset)
+        state["done"] = True
+        _write_checkpoint(checkpoint, state)
+    finally:
+        rejects.close()
+        if engine is not url:
+            engine.dispose()
+    dt = time.monotonic() - t0
+    return dict(rows=rows, rejected=rejected, offset=offset, seconds=round(dt, 3),
+                rows_per_sec=round(rows / dt, 1) if dt else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyco_sqlalchemy.transfer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    exp = commands.add_parser("export", help="export a table to JSONL/CSV partitions")
+    exp.add_argument("model", help="package.module:Model")
+    exp.add_argument("--url", required=True, help="database URL")
+    exp.add_argument("--out", required=True, help="output directory")
+    exp.add_argument("--format", default="jsonl", choices=FORMATS)
+    exp.add_argument("-p", "--partitions", type=int)
+    exp.add_argument("-w", "--workers", type=int)
+    exp.add_argument("--where", help="JSON of condition, eg: '{\"status\": 1}'")
+    exp.add_argument("--chunk-size", type=int, default=10000)
+    imp = commands.add_parser("import", help="import rows of a JSONL/CSV file")
+    imp.add_argument("model", help="package.module:Model")
+    imp.add_argument("path", help="file to import")
+    imp.add_argument("--url", required=True, help="database URL")
+    imp.add_argument("--format", choices=FORMATS, help="by the extension of path if missing")
+    imp.add_argument("--chunk-size", type=int, default=1000)
+    imp.add_argument("--checkpoint", help="default: <path>.checkpoint")
+    imp.add_argument("--reject", help="default: <path>.rejects.jsonl")
+    imp.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        model = load_model(args.model)
+        condition = json.loads(args.where) if args.where else None
+        manifest = export_table(model, args.url, args.out, fmt=args.format, partitions=args.partitions,
+                                workers=args.workers, condition=condition, chunk_size=args.chunk_size)
+        print("exported {} rows of {} in {} partitions, {}s".format(
+            manifest["rows"], manifest["table"], len(manifest["partitions"]), manifest["seconds"]))
+    elif args.command == "import":
+        model = load_model(args.model)
+
+        def report(p):
+            print("imported {rows} rows, rejected {rejected}, offset {offset}, {rows_per_sec:.0f} rows/s".format(**p))
+
+        result = import_file(model, args.url, args.path, fmt=args.format, chunk_size=args.chunk_size,
+                             checkpoint=args.checkpoint, resume=not args.restart, reject=args.reject,
+                             progress=report)
+        print("done: {}".format(json.dumps(result)))
+        return 1 if result["rejected"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
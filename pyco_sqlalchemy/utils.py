@@ -1,18 +1,52 @@
 """
 require:
     python-dateutil>=2.8.0
+
+NOTE: pprint and dateutil are imported on first use, keep the import of this module cheap.
 """
+import re
 import json
 import uuid
 import time
-from pprint import pformat
-from datetime import datetime, timedelta, timezone
-from dateutil.parser import parse as parse_datestr
+import base64
+import threading
+import importlib
+from decimal import Decimal
+from itertools import islice
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone
 
 TZ_UTC = timezone.utc
 TZ_LOCAL = timezone(timedelta(seconds=-time.timezone))
 
 
+class LazyModule(object):
+    """
+    module imported on first attribute access, eg: `errors = LazyModule("werkzeug.exceptions")`
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+def pformat(obj, **kwargs):
+    from pprint import pformat as _pformat
+    return _pformat(obj, **kwargs)
+
+
+def _dateutil_parse(s, **parse_kws):
+    # the slowest layer of `parse_datestr`
+    from dateutil.parser import parse
+    return parse(s, **parse_kws)
+
+
 def now(tz=None):
     # 使用datetime.now, 使得到的日期, 不管时间区是多少, 时间戳都是一致的.
     # 返回等同于: datetime.utcnow().replace(tz_info=TZ_UTC)
@@ -22,6 +56,85 @@ def now(tz=None):
     return datetime.now(tz=tz)
 
 
+_ISO_DATESTR = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}(?::\d{2}(?::\d{2}(?:[.,]\d{1,6})?)?)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?"
+)
+# NOTE: dateutil fails on numbers of 9~11 digits, 8/12/14 digits are parsed as `%Y%m%d[%H%M[%S]]`
+_EPOCH_DATESTR = re.compile(r"\d{9,11}(?:\.\d+)?")
+# candidates of `strptime`, must agree with dateutil's defaults (dayfirst=False, yearfirst=False),
+# so no `%d/%m/%Y`, no `%y` (dateutil resolves 2-digit years around the current year)
+_STRPTIME_FORMATS = (
+    "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d",
+    "%Y.%m.%d %H:%M:%S", "%Y.%m.%d",
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+    "%Y-%m-%d %H:%M:%S %z", "%Y/%m/%d %H:%M:%S %z",
+    "%a, %d %b %Y %H:%M:%S %z", "%a, %d %b %Y %H:%M:%S",
+    "%d %b %Y %H:%M:%S", "%d %b %Y", "%b %d %Y", "%b %d, %Y", "%B %d, %Y", "%d %B %Y",
+    "%Y%m%d%H%M%S", "%Y%m%d%H%M", "%Y%m%d",
+)
+# shape of datestr: digits => "9", ascii letters => "a"
+_SHAPE_TABLE = str.maketrans("0123456789" + "abcdefghijklmnopqrstuvwxyz" + "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "9" * 10 + "a" * 52)
+# LRU: shape => strptime format detected, or None if no candidate agrees with dateutil
+_shape_formats = OrderedDict()
+_shape_formats_lock = threading.Lock()
+SHAPE_FORMATS_MAXSIZE = 128
+
+
+def _same_datetime(a, b):
+    return a == b and (a.tzinfo is None) == (b.tzinfo is None) and a.utcoffset() == b.utcoffset()
+
+
+def _detect_format(s, shape, dt):
+    fmt = None
+    for f in _STRPTIME_FORMATS:
+        try:
+            if _same_datetime(datetime.strptime(s, f), dt):
+                fmt = f
+                break
+        except ValueError:
+            continue
+    with _shape_formats_lock:
+        _shape_formats[shape] = fmt
+        while len(_shape_formats) > SHAPE_FORMATS_MAXSIZE:
+            _shape_formats.popitem(last=False)
+
+
+def parse_datestr(s: str, **parse_kws):
+    """
+    same result as `dateutil.parser.parse`, layered for speed:
+    1. ISO-8601/RFC-3339 by `datetime.fromisoformat`
+    2. epoch seconds, eg: "1616416322.5", returns datetime of TZ_LOCAL (dateutil raise ValueError)
+    3. `strptime` formats recently detected for strings of the same shape
+    4. `dateutil.parser.parse`, always used if $parse_kws given
+    """
+    if parse_kws:
+        return _dateutil_parse(s, **parse_kws)
+    if _ISO_DATESTR.fullmatch(s):
+        try:
+            if s[-1] == "Z":
+                return datetime.fromisoformat(s[:-1]).replace(tzinfo=TZ_UTC)
+            return datetime.fromisoformat(s)
+        except ValueError:
+            pass
+    elif _EPOCH_DATESTR.fullmatch(s):
+        return datetime.fromtimestamp(float(s), tz=TZ_LOCAL)
+
+    shape = s.translate(_SHAPE_TABLE)
+    with _shape_formats_lock:
+        fmt = _shape_formats.get(shape, "")
+        if fmt != "":
+            _shape_formats.move_to_end(shape)
+    if fmt:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    dt = _dateutil_parse(s)
+    if fmt == "":
+        _detect_format(s, shape, dt)
+    return dt
+
+
 def parse_date(val, nullable=True, tz=TZ_LOCAL, **parse_kws):
     v = None
     if isinstance(val, datetime):
@@ -38,6 +151,48 @@ def parse_date(val, nullable=True, tz=TZ_LOCAL, **parse_kws):
     raise ValueError(f"Unknown DateValue{val}")
 
 
+def chunked(iterable, size):
+    # yield lists of $size items, the last one may be shorter
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_CURSOR_TYPES = {
+    "dt"  : (datetime, datetime.isoformat, datetime.fromisoformat),
+    "d"   : (date, date.isoformat, date.fromisoformat),
+    "dec" : (Decimal, str, Decimal),
+    "uuid": (uuid.UUID, str, uuid.UUID),
+}
+
+
+def encode_cursor(values):
+    # opaque urlsafe string of values, keep the types of datetime/date/Decimal/UUID
+    items = []
+    for v in values:
+        for tag, (tp, dump, _) in _CURSOR_TYPES.items():
+            if isinstance(v, tp):
+                v = {tag: dump(v)}
+                break
+        items.append(v)
+    text = json.dumps(items, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def decode_cursor(cursor):
+    items = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    values = []
+    for v in items:
+        if isinstance(v, dict):
+            (tag, text), = v.items()
+            v = _CURSOR_TYPES[tag][2](text)
+        values.append(v)
+    return values
+
+
 class BaseJSONEncoder(json.JSONEncoder):
     @classmethod
     def stringify(cls, obj, strict=False):
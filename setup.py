@@ -38,8 +38,8 @@ setup(
         "Development Status :: 4 - Beta",
     ],
     install_requires=[
-        "sqlalchemy",
-        "flask-sqlalchemy",
+        "sqlalchemy>=1.4,<2.0",
+        "flask-sqlalchemy>=2.5,<3",
         "python-dateutil"
     ],
     platforms='any',
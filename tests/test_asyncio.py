@@ -0,0 +1,108 @@
+import os
+import asyncio
+import pytest
+import tempfile
+from sqlalchemy import Column, Integer, String
+from pyco_sqlalchemy._asyncio import adb, AsyncBaseModel, AsyncCoModel, async_db_session_maker
+
+cwd = os.path.dirname(__file__)
+
+
+class AsyncUser(adb.Model, AsyncBaseModel):
+    __tablename__ = "async_user"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(32))
+    email = Column(String(64), unique=True)
+
+
+class AsyncPost(adb.Model, AsyncCoModel):
+    __tablename__ = "async_post"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    title = Column(String(32))
+
+
+def run(main):
+    db_fd, db_file = tempfile.mkstemp(suffix="sqlite.db", dir=cwd)
+
+    async def wrapper():
+        adb.init_engine("sqlite+aiosqlite:///{}".format(db_file))
+        await adb.create_all()
+        try:
+            async with async_db_session_maker(auto_close=True):
+                await main()
+        finally:
+            await adb.dispose()
+
+    try:
+        asyncio.run(wrapper())
+    finally:
+        os.close(db_fd)
+        os.unlink(db_file)
+
+
+def test_async_user():
+    async def main():
+        form = dict(name="dev")
+        u1 = await AsyncUser.insert(form, email="dev@pypi.com", unknown=1)
+        u2 = await AsyncUser.upsert_one(form, email="dev@oncode.cc")
+        assert u1.id == u2.id
+        assert u2.to_dict()["email"] == "dev@oncode.cc"
+
+        await AsyncUser.insert(name="dev3")
+        assert await AsyncUser.discard(name="dev3") == 1
+        await AsyncUser.insert(name="dev4")
+        with pytest.raises(Exception) as e:
+            await AsyncUser.discard()
+        assert e.value.__class__.__name__ == "SecurityError"
+        assert await AsyncUser.count() == 2
+        assert await AsyncUser.discard(limit=None) == 2
+        assert await AsyncUser.filter_by() == []
+        assert await AsyncUser.get_or_none(name="dev") is None
+
+    run(main)
+
+
+def test_async_page_items():
+    async def main():
+        for i in range(25):
+            await AsyncPost.insert(title="p{}".format(i % 5))
+        page = await AsyncPost.page_items(limit=10, offset=20)
+        assert page["total"] == 25 and len(page["items"]) == 5 and not page["has_more"]
+        page = await AsyncPost.page_items(title="p1", limit=2, total="none")
+        assert page["total"] is None and page["has_more"]
+        assert await AsyncPost.count(total="capped:7") == 7
+
+        ids = []
+        cursor = ""
+        while cursor is not None:
+            page = await AsyncPost.page_items(limit=10, cursor=cursor, total="none")
+            ids.extend(m.id for m in page["items"])
+            cursor = page["next_cursor"]
+        assert ids == list(range(1, 26))
+
+        page = await AsyncPost.page_items(limit=2, only=["title"])
+        assert page["total"] == 25 and "created_time" not in page["items"][0].to_dict()
+
+        last = await AsyncPost.lastOrNone(title="p4")
+        assert last.id == 25
+        await last.update(title="p9", created_time=None)
+        assert (await AsyncPost.getOr404(id=25)).title == "p9"
+
+    run(main)
+
+
+def test_async_concurrency():
+    async def worker(i):
+        # one session per task
+        async with async_db_session_maker(auto_close=True):
+            m = await AsyncUser.insert(name="u{}".format(i))
+            m2 = await AsyncUser.get_or_none(id=m.id)
+            assert m2 is m
+            return m.id
+
+    async def main():
+        ids = await asyncio.gather(*[worker(i) for i in range(50)])
+        assert len(set(ids)) == 50
+        assert await AsyncUser.count() == 50
+
+    run(main)
@@ -1,8 +1,21 @@
+import io
 import os
+import json
+import time
+import uuid
 import pytest
 import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
 from flask import Flask
-from pyco_sqlalchemy._flask import BaseModel, db
+from sqlalchemy import event, create_engine, text
+from pyco_sqlalchemy import utils, serializer
+from pyco_sqlalchemy.cache import LRUCache, SharedMemoryCache
+from pyco_sqlalchemy.serializer import ModelSerializer
+from pyco_sqlalchemy.instrument import instrument, Exporter
+from pyco_sqlalchemy._types import SortedTags, StringTags
+from pyco_sqlalchemy._flask import BaseModel, CoModel, db, batch_writes, init_batch_writes, force_remove_multiple, \
+    primary_reads, ReplicaPool, _supports_window
 
 cwd = os.path.dirname(__file__)
 
@@ -55,3 +68,768 @@ def test_user(app):
     n = User.discard(limit=None)
     us = User.filter_by()
     assert len(us) == 0
+
+
+class Post(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    title = db.Column(db.String(32))
+
+
+def test_insert_many(app):
+    rows = [dict(name="bulk{}".format(i), unknown=i) for i in range(25)]
+    rows.append(dict(email="bulk@pypi.com"))
+    n = User.insert_many(rows, chunk_size=10)
+    assert n == 26
+    assert User.count(name="bulk3") == 1
+    assert User.get_or_none(email="bulk@pypi.com").name is None
+
+    pks = User.insert_many([dict(name="pk1"), dict(name="pk2")], return_pks=True)
+    assert [User.get_or_none(id=pk).name for pk in pks] == ["pk1", "pk2"]
+
+    Post.insert_many([dict(title="t{}".format(i)) for i in range(5)], chunk_size=5)
+    ps = Post.filter_by()
+    assert len(ps) == 5
+    assert len({(p.created_time, p.updated_time) for p in ps}) == 1
+    assert ps[0].created_time == ps[0].updated_time
+
+    Post.insert_many([dict(title="old", created_time="2020-01-02 03:04:05")])
+    assert Post.get_or_none(title="old").created_time.year == 2020
+
+
+def test_schema(app):
+    schema = Post._schema()
+    assert schema is Post._schema()
+    assert schema.primary_keys == ("id",)
+    assert schema.immutable_keys == frozenset(["id"])
+    assert schema.column_names == frozenset(["id", "title", "created_time", "updated_time"])
+    assert Post.strict_form(dict(title="t", unknown=1), id=1) == dict(title="t", id=1)
+    p = Post.insert(title="t")
+    p.update(id=100, title="t2")
+    assert p.id != 100 and p.title == "t2"
+    assert set(p.to_dict()) == {"_type", "id", "title", "created_time", "updated_time"}
+
+
+def _walk_pages(model, order_by, limit=3, **kwargs):
+    ids = []
+    cursor = ""
+    while cursor is not None:
+        page = model.page_items(limit=limit, order_by=order_by, cursor=cursor, **kwargs)
+        assert "next_offset" not in page
+        assert len(page["items"]) <= limit
+        ids.extend(m.id for m in page["items"])
+        cursor = page["next_cursor"]
+    return ids
+
+
+def test_page_items_cursor(app):
+    t0 = datetime(2021, 1, 1)
+    for i in range(10):
+        # duplicated created_time, tie-breaker by primary key
+        Post.insert(title="t{}".format(i % 4), created_time=t0 + timedelta(days=i // 3))
+    ps = Post.filter_by()
+
+    expected = [p.id for p in sorted(ps, key=lambda p: (p.created_time, p.id), reverse=True)]
+    assert _walk_pages(Post, Post.created_time.desc()) == expected
+    assert _walk_pages(Post, [Post.created_time.desc()]) == expected
+    expected = [p.id for p in sorted(ps, key=lambda p: (p.title, p.id))]
+    assert _walk_pages(Post, (Post.title,)) == expected
+    assert _walk_pages(Post, ["title"], limit=4) == expected
+    # mixed directions
+    expected = [p.id for p in sorted(ps, key=lambda p: (p.title, -p.id))]
+    assert _walk_pages(Post, [Post.title.asc(), Post.id.desc()]) == expected
+    assert _walk_pages(Post, None, title="t1") == [p.id for p in ps if p.title == "t1"]
+
+    page = Post.page_items(limit=20, cursor="")
+    assert page["total"] == 10 and not page["has_more"] and page["next_cursor"] is None
+
+
+def test_count_strategy(app):
+    User.insert_many([dict(name="u{}".format(i % 3)) for i in range(12)])
+    assert User.count() == 12
+    assert User.count(total="capped:5") == 5
+    assert User.count(name="u1", total="capped:100") == 4
+    # fallback to exact without statistics, or with condition
+    assert User.count(total="estimate") == 12
+    db.session.execute(db.text("ANALYZE"))
+    User.insert(name="u0")
+    assert User.count(total="estimate") == 12
+    assert User.count(name="u0", total="estimate") == 5
+
+    page = User.page_items(limit=5, offset=10, total="none")
+    assert page["total"] is None and page["has_more"] is False
+    assert len(page["items"]) == 3 and page["next_offset"] == 13
+    page = User.page_items(limit=5, total="capped:6")
+    assert page["total"] == 6 and page["has_more"] is True
+    page = User.page_items(limit=5, offset=5, total="exact")
+    assert page["total"] == 13 and page["has_more"] is True
+    page = User.page_items(limit=0, offset=13, total="none")
+    assert page["has_more"] is False
+    page = User.page_items(limit=2, cursor="", total="none", name="u1")
+    assert page["total"] is None and page["has_more"] is True
+
+
+def _peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_iter_by(app):
+    Post.insert_many([dict(title="t{}".format(i)) for i in range(25)])
+    ms = list(Post.iter_by(batch_size=10, order_by=Post.id.desc()))
+    assert [m.id for m in ms] == list(range(25, 0, -1))
+    assert not any(m in db.session for m in ms)
+    assert [m.id for m in Post.iter_by(dict(title="t3"), batch_size=2)] == [4]
+
+    ds = list(Post.iter_dicts(batch_size=10, order_by=Post.id))
+    assert ds == [m.to_dict() for m in Post.filter_by(order_by=Post.id)]
+
+    def consume(it):
+        return lambda: sum(1 for _ in it)
+
+    Post.insert_many([dict(title="x" * 30) for i in range(1000)])
+    peak_small = _peak_memory(consume(Post.iter_by(batch_size=50)))
+    peak_small_dicts = _peak_memory(consume(Post.iter_dicts(batch_size=50)))
+    Post.insert_many([dict(title="x" * 30) for i in range(8000)])
+    peak_large = _peak_memory(consume(Post.iter_by(batch_size=50)))
+    peak_large_dicts = _peak_memory(consume(Post.iter_dicts(batch_size=50)))
+    peak_all = _peak_memory(lambda: Post.filter_by())
+    assert peak_large < peak_small * 1.5
+    assert peak_large_dicts < peak_small_dicts * 1.5
+    assert peak_all > peak_large * 10
+
+
+def test_upsert_many(app):
+    u1 = User.insert(name="a", email="a@pypi.com")
+    res = User.upsert_many([
+        dict(email="a@pypi.com", name="a2", id=100),
+        dict(email="b@pypi.com", name="b"),
+        dict(email="b@pypi.com", name="b2"),
+        dict(email="c@pypi.com", name="c"),
+    ], conflict_keys=["email"], chunk_size=3)
+    assert res == dict(inserted=2, updated=1)
+    db.session.expire_all()
+    assert User.get_or_none(email="a@pypi.com").id == u1.id
+    assert User.get_or_none(email="a@pypi.com").name == "a2"
+    assert User.get_or_none(email="b@pypi.com").name == "b2"
+    assert User.count() == 3
+
+    res = User.upsert_many([dict(id=u1.id, name="a3", email="x@pypi.com")], update_keys=["name"])
+    assert res == dict(inserted=0, updated=1)
+    db.session.expire_all()
+    assert (u1.name, u1.email) == ("a3", "a@pypi.com")
+
+    try:
+        User.upsert_many([dict(name="no-email")], conflict_keys=["email"])
+    except ValueError as e:
+        print(e)
+    else:
+        assert False
+
+    t0 = datetime(2020, 1, 1)
+    p = Post.insert(title="p", created_time=t0, updated_time=t0)
+    res = Post.upsert_many([dict(id=p.id, title="p2"), dict(id=p.id + 1, title="q")])
+    assert res == dict(inserted=1, updated=1)
+    db.session.expire_all()
+    assert p.title == "p2" and p.created_time == t0 and p.updated_time > t0
+
+
+def test_batch_writes(app):
+    commits = []
+    event.listen(db.engine, "commit", lambda conn: commits.append(1))
+
+    with batch_writes():
+        u1 = User.insert(name="b1")
+        assert u1.id is not None
+        u2 = User.insert(name="b2")
+        u1.update(name="b1-2")
+        u2.remove()
+        User.insert_many([dict(name="b3"), dict(name="b4")], chunk_size=1)
+        with batch_writes():
+            User.insert(name="b5")
+        assert User.discard(name="b5") == 1
+        # flushed, not committed: columns never set are still in the dict
+        u = User.insert(name="b7")
+        assert u.to_dict() == dict(_type="User", id=u.id, name="b7", email=None)
+        User.discard(name="b7")
+        assert not commits
+    assert len(commits) == 1
+    assert sorted(u.name for u in User.filter_by()) == ["b1-2", "b3", "b4"]
+
+    try:
+        with batch_writes():
+            User.insert(name="b6")
+            force_remove_multiple(None)
+    except Exception as e:
+        assert e.__class__.__name__ == "NotFound"
+    assert User.count(name="b6") == 0
+
+    with batch_writes():
+        User.insert(name="b7")
+        try:
+            with batch_writes(savepoint=True):
+                User.insert(name="b8")
+                User.discard(limit=1)
+        except Exception as e:
+            assert e.__class__.__name__ == "SecurityError"
+    assert User.count(name="b7") == 1 and User.count(name="b8") == 0
+
+
+def test_init_batch_writes(app):
+    init_batch_writes(app)
+    commits = []
+
+    @app.route("/users/<name>", methods=["POST"])
+    def create_users(name):
+        User.insert(name=name)
+        User.insert(name=name + "2")
+        if name == "bad":
+            User.getOr404(name="none")
+        return "ok"
+
+    event.listen(db.engine, "commit", lambda conn: commits.append(1))
+    client = app.test_client()
+    assert client.post("/users/good").status_code == 200
+    assert len(commits) == 1
+    assert client.post("/users/bad").status_code == 404
+    assert User.count(name="good") == 1 and User.count(name="bad") == 0
+
+
+class Device(db.Model, BaseModel):
+    _pk_cache = LRUCache(maxsize=2, ttl=60)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(32))
+    payload = db.Column(db.JSON)
+
+
+def test_pk_cache(app):
+    cache = Device._pk_cache
+    cache.clear()
+    d1, d2, d3 = [Device.insert(name="d{}".format(i)).id for i in range(1, 4)]
+    db.session.remove()
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert Device.get_or_none(id=d1).name == "d1"
+    db.session.remove()
+    m = Device.getOr404(id=d1)
+    assert m.name == "d1" and len(statements) == 1
+    assert cache.stats["hits"] == 1
+    # not exactly the primary key
+    assert Device.get_or_none(id=d1, name="d1") is m
+    assert len(statements) == 2
+
+    m.update(name="d1-2")
+    db.session.remove()
+    assert Device.get_or_none(id=d1).name == "d1-2"
+    Device.get_or_none(id=d2)
+    Device.get_or_none(id=d3)
+    assert cache.stats["evictions"] == 1
+
+    Device.get_or_none(id=d3).remove()
+    assert Device.get_or_none(id=d3) is None
+    db.session.remove()
+    Device.get_or_none(id=d2)
+    Device.discard(name="d2")
+    assert Device.get_or_none(id=d2) is None
+
+
+def test_pk_cache_coherence(app):
+    cache = Device._pk_cache
+    cache.clear()
+    pk = Device.insert(name="d", payload=dict(w=1)).id
+    db.session.remove()
+
+    # keyed as the identity, which is invalidated by flush
+    hits = cache.stats["hits"]
+    assert Device.get_or_none(id=str(pk)).name == "d"
+    assert Device.get_or_none(id=pk) and cache.stats["hits"] == hits + 1
+    Device.get_or_none(id=str(pk)).update(name="d-2")
+    db.session.remove()
+    assert Device.get_or_none(id=str(pk)).name == "d-2"
+    assert Device.get_or_none(id="x") is None
+
+    # the model in the session is kept with its unflushed changes
+    m = Device.get_or_none(id=pk)
+    m.name = "pending"
+    assert Device.get_or_none(id=pk) is m and m.name == "pending"
+    db.session.rollback()
+    db.session.remove()
+
+    # in place edits without save are not cached
+    m = Device.get_or_none(id=pk)
+    m.payload["w"] = 5
+    db.session.remove()
+    assert Device.get_or_none(id=pk).payload == dict(w=1)
+    Device.get_or_none(id=pk).payload["w"] = 6
+    db.session.remove()
+    assert Device.get_or_none(id=pk).payload == dict(w=1)
+
+
+def test_shared_memory_cache():
+    name = "pyco_test_{}".format(os.getpid())
+    master = SharedMemoryCache(name, slots=16, slot_size=256, create=True)
+    worker = SharedMemoryCache(name, slots=16, slot_size=256)
+    try:
+        key = ("tests.Device", (1,))
+        master.set(key, dict(id=1, name="d1"))
+        assert worker.get(key) == dict(id=1, name="d1")
+        assert worker.get(("tests.Device", (2,))) is None
+        worker.set(("tests.Other", (1,)), dict(id=1))
+        worker.clear("tests.Device")
+        assert master.get(key) is None
+        assert master.get(("tests.Other", (1,))) == dict(id=1)
+        master.set(key, dict(id=1, name="x" * 1024))
+        assert worker.get(key) is None
+        assert master.stats == dict(hits=1, misses=1, evictions=0)
+    finally:
+        worker.close()
+        master.close()
+
+
+class Event(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    uid = db.Column(db.String(36))
+    payload = db.Column(db.JSON)
+    score = db.Column(db.Float)
+
+
+def test_dumps_many(app):
+    for i in range(5):
+        Event.insert(uid=str(uuid.uuid4()), payload=dict(i=i, tags=["a"]), score=i / 3)
+    Event.insert()
+    ms = Event.filter_by()
+    expected = json.loads(utils.json_stringify([m.to_dict() for m in ms]))
+    assert json.loads(Event.dumps_many(ms)) == expected
+    assert json.loads(ModelSerializer(Event, use_orjson=False).dumps(ms)) == expected
+    assert json.loads(Event.dumps_many(Event.iter_dicts())) == expected
+
+    fp = io.BytesIO()
+    assert Event.dump_many(Event.iter_by(batch_size=2), fp, batch_size=2) == 6
+    assert json.loads(fp.getvalue()) == expected
+    fp = io.StringIO()
+    assert Event.dump_many([], fp) == 0
+    assert fp.getvalue() == "[]"
+
+    assert json.loads(serializer.encode(dict(t=datetime(2021, 1, 1), n=2 ** 70, u=uuid.UUID(int=1)))) == \
+           json.loads(utils.json_stringify(dict(t=datetime(2021, 1, 1), n=2 ** 70, u=uuid.UUID(int=1))))
+
+
+def test_read_replicas():
+    primary_fd, primary_file = tempfile.mkstemp(suffix="sqlite.db", dir=cwd)
+    replica_fd, replica_file = tempfile.mkstemp(suffix="sqlite.db", dir=cwd)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///{}".format(primary_file)
+    app.config["SQLALCHEMY_BINDS"] = {"replica": "sqlite:///{}".format(replica_file)}
+    app.config["SQLALCHEMY_REPLICA_BINDS"] = ["replica"]
+    app.config["SQLALCHEMY_REPLICA_STICKY_SECONDS"] = 0.2
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    try:
+        with app.app_context():
+            db.init_app(app)
+            db.create_all()
+            replica = db.get_engine(app, bind="replica")
+            db.Model.metadata.create_all(replica)
+            with replica.begin() as conn:
+                conn.execute(User.__table__.insert(), [dict(id=1, name="replica")])
+
+            assert User.get_or_none(id=1).name == "replica"
+            u = User.insert(id=1, name="primary")
+            # read your writes
+            assert User.filter_by(name="primary") == [u]
+            with batch_writes():
+                User.insert(id=2, name="primary2")
+                assert User.count() == 2
+            db.session.remove()
+            time.sleep(0.3)
+            assert [m.name for m in User.filter_by()] == ["replica"]
+            assert User.page_items()["total"] == 1
+            with primary_reads():
+                assert User.count() == 2
+            # read-modify-write on primary
+            assert User.upsert_one(dict(id=2), name="dev").name == "dev"
+            assert User.count(name="dev") == 1
+            time.sleep(0.3)
+            assert User.count(name="dev") == 0
+            db.session.remove()
+            # sticky by the session only, unless a sticky key is set
+            User.insert(id=3, name="p3")
+            assert User.count(name="p3") == 1
+            db.session.remove()
+            assert User.count(name="p3") == 0
+            ReplicaPool.from_app(app).sticky_key = lambda: "uid"
+            User.insert(id=4, name="p4")
+            db.session.remove()
+            assert User.count(name="p4") == 1
+            db.session.remove()
+    finally:
+        for fd, f in [(primary_fd, primary_file), (replica_fd, replica_file)]:
+            os.close(fd)
+            os.unlink(f)
+
+
+def test_replica_pool():
+    engines = [create_engine("sqlite://"), create_engine("sqlite://")]
+    pool = ReplicaPool(engines)
+    assert [pool.pick() for _ in range(4)] == engines * 2
+    pool = ReplicaPool(engines, strategy="least_latency")
+    with engines[0].connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert pool.latency[engines[0]] > 0 and pool.pick() is engines[1]
+    with pytest.raises(ValueError):
+        ReplicaPool(engines, strategy="random")
+
+
+def test_instrument(app, caplog):
+    class ListExporter(Exporter):
+        snapshots = []
+
+        def export(self, snapshot):
+            self.snapshots.append(snapshot)
+
+    filter_by = BaseModel.__dict__["filter_by"]
+    instrument.reset()
+    instrument.enable(slow_ms=0, n_plus_one=5)
+    try:
+        exporter = ListExporter()
+        instrument.add_exporter(exporter)
+        for i in range(3):
+            User.insert(name="m{}".format(i))
+        assert len(User.filter_by()) == 3
+        User.upsert_one(dict(name="m1"), email="m1@pypi.com")
+        for i in range(5):
+            User.get_or_none(name="m{}".format(i))
+        with pytest.raises(Exception):
+            User.getOr404(name="none")
+        stats = instrument.export()
+    finally:
+        instrument.disable()
+        instrument.exporters.clear()
+    assert BaseModel.__dict__["filter_by"] is filter_by
+    assert exporter.snapshots == [stats]
+    assert stats["User.insert"]["calls"] == 3 and stats["User.insert"]["rows"] == 3
+    assert stats["User.filter_by"] == dict(stats["User.filter_by"], calls=1, statements=1, rows=3)
+    # nested get_or_none and update are included
+    assert stats["User.upsert_one"]["statements"] >= 2
+    assert stats["User.get_or_none"]["calls"] == 7 and stats["User.get_or_none"]["n_plus_one"] == 1
+    assert stats["User.getOr404"]["errors"] == 1
+    assert sum(stats["User.insert"]["histogram"].values()) == 3
+    assert "slow query" in caplog.text and "N+1 query" in caplog.text
+
+    User.filter_by()
+    assert instrument.snapshot()["User.filter_by"]["calls"] == 1
+
+
+class Article(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    title = db.Column(db.String(32))
+    body = db.Column(db.Text)
+    comments = db.relationship("Comment", order_by="Comment.id")
+
+
+class Comment(db.Model, BaseModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    article_id = db.Column(db.Integer, db.ForeignKey("article.id"))
+    text = db.Column(db.String(32))
+
+
+def test_load_options(app):
+    for i in range(3):
+        a = Article.insert(title="a{}".format(i), body="x" * 1000)
+        Comment.insert_many([dict(article_id=a.id, text="c{}".format(j)) for j in range(2)])
+    db.session.remove()
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    items = Article.page_items(limit=10, only=["title"], load=["comments"], total="none")["items"]
+    assert len(statements) == 2 and "body" not in statements[0]
+    d = items[0].to_dict()
+    assert "body" not in d and d["title"] == "a0"
+    assert [c.text for m in items for c in m.comments] == ["c0", "c1"] * 3
+    assert Article.serializer().row(items[0])["title"] == "a0"
+    assert len(statements) == 2
+    db.session.remove()
+
+    m = Article.lastOrNone(defer=["body"], load={"comments": "joined"})
+    assert len(statements) == 3 and "JOIN" in statements[-1] and "body" not in statements[-1]
+    assert len(m.comments) == 2 and "body" not in m.to_dict()
+    # lazy load on access, and refreshed after commit
+    assert m.body == "x" * 1000
+    m.update(title="b2")
+    assert m.to_dict()["body"] == "x" * 1000
+    db.session.remove()
+
+    m = Article.get_or_none(id=1, only=["title"])
+    assert Article.filter_by(defer=["body", "title"])[0] is m
+    with pytest.raises(ValueError):
+        Article.filter_by(only=["unknown"])
+    with pytest.raises(ValueError):
+        Article.filter_by(load={"comments": "subquery"})
+
+
+def test_update_where(app):
+    ids = [Post.insert(title="t{}".format(i % 2)).id for i in range(5)]
+    p0 = Post.get_or_none(id=ids[0])
+    t0 = p0.updated_time
+    p1 = Post.get_or_none(id=ids[1])
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with pytest.raises(Exception) as e:
+        Post.update_where(dict(title="t0"), dict(title="x"))
+    assert e.value.__class__.__name__ == "SecurityError"
+    assert Post.count(title="t0") == 3 and p0.title == "t0"
+
+    statements.clear()
+    n = Post.update_where(dict(title="t0"), dict(title="x", id=100, unknown=1), limit=None)
+    assert n == 3 and len([s for s in statements if s.startswith("UPDATE")]) == 1
+    assert p0.title == "x" and p0.id == ids[0] and p0.updated_time > t0
+    assert Post.update_where(dict(title="none"), dict(title="y")) == 0
+    assert Post.update_where(where=Post.id == ids[4], values=dict(title="z")) == 1
+
+    with batch_writes():
+        Post.update_where(dict(id=ids[1]), dict(title="t3"))
+        assert p1.title == "t3"
+        with pytest.raises(Exception):
+            Post.update_where(dict(title="x"), dict(title="y"))
+        assert Post.count(title="x") == 2
+    assert Post.update_where(dict(id=ids[1]), dict(id=101), force=True) == 1
+    assert Post.get_or_none(id=101).title == "t3"
+
+
+def test_discard_in_batches(app):
+    t0 = datetime(2020, 1, 1)
+    Post.insert_many([dict(title="old", created_time=t0 + timedelta(days=i)) for i in range(25)])
+    Post.insert_many([dict(title="new") for i in range(5)])
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with pytest.raises(Exception) as e:
+        Post.discard(title="old", limit=10, precheck=True)
+    assert e.value.__class__.__name__ == "SecurityError"
+    assert not [s for s in statements if s.startswith("DELETE")]
+    assert Post.discard(title="new", limit=5, precheck=True) == 5
+
+    commits = []
+    event.listen(db.engine, "commit", lambda conn: commits.append(1))
+    reports = []
+
+    def interrupt(report):
+        reports.append(report)
+        if report["deleted"] >= 10:
+            raise KeyboardInterrupt
+
+    cutoff = t0 + timedelta(days=20)
+    with pytest.raises(KeyboardInterrupt):
+        Post.discard_in_batches(where=Post.created_time < cutoff, batch_size=4, progress=interrupt)
+    assert [r["deleted"] for r in reports] == [4, 8, 12] and len(commits) == 3
+    db.session.remove()
+
+    n = Post.discard_in_batches(title="old", where=[Post.created_time < cutoff], batch_size=4,
+                                after=reports[-1]["last"], progress=reports.append)
+    assert n == 8 and reports[-1]["deleted"] == 8 and reports[-1]["batch"] == 4
+    assert Post.count() == 5
+    assert Post.discard_in_batches(title="old", batch_size=100) == 5
+
+
+def test_import_file(app, tmp_path):
+    path = str(tmp_path / "users.csv")
+    with open(path, "w") as fp:
+        fp.write("name,email,unknown\n")
+        fp.write("a,a@pypi.com,1\n")
+        fp.write("b,a@pypi.com,2\n")
+        fp.write('"c\nd",c@pypi.com,3\n')
+    result = User.import_file(path, chunk_size=2)
+    assert result["rows"] == 2 and result["rejected"] == 1
+    assert [u.name for u in User.filter_by(order_by=User.id)] == ["a", "c\nd"]
+    assert User.import_file(path)["rows"] == 0
+
+
+def test_warmup(app):
+    result = db.warmup(connections=3)
+    assert result["models"] >= 2 and result["connections"] >= 1
+    assert "_schema_cache" in User.__dict__ and "_serializer_cache" in User.__dict__
+
+    app2 = Flask(__name__)
+    app2.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app2.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app2.config["SQLALCHEMY_WARMUP"] = True
+    db.init_app(app2)
+    assert "pyco_replicas" in app2.extensions
+
+    import pyco_sqlalchemy
+    assert pyco_sqlalchemy.BaseModel is BaseModel and "db" in dir(pyco_sqlalchemy)
+
+
+class Reading(db.Model, CoModel):
+    __created_group__ = "device"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    device = db.Column(db.String(16))
+    value = db.Column(db.Integer)
+
+
+def test_time_range(app):
+    assert [ix.name for ix in Reading.__table__.indexes] == ["ix_reading_device_created_time"]
+    assert [[c.name for c in ix.columns] for ix in Post.__table__.indexes] == [["created_time"]]
+    t0 = datetime(2021, 3, 22, tzinfo=utils.TZ_LOCAL)
+    Reading.insert_many(
+        dict(device="d{}".format(i % 3), value=i, created_time=t0 + timedelta(minutes=i // 2)) for i in range(30)
+    )
+    rows = list(Reading.range_by(t0 + timedelta(minutes=2), t0 + timedelta(minutes=10), batch_size=4))
+    assert [m.value for m in rows] == list(range(4, 20))
+    rows = list(Reading.range_by(end=t0 + timedelta(minutes=3), device="d1", batch_size=1, desc=True))
+    assert [m.value for m in rows] == [4, 1]
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for strategy in (None, "window", "subquery"):
+        statements.clear()
+        latest = Reading.latest_per(strategy=strategy)
+        assert [(m.device, m.value) for m in latest] == [("d0", 27), ("d1", 28), ("d2", 29)]
+        assert len(statements) == 1
+        assert ("row_number()" in statements[0].lower()) == (strategy != "subquery")
+        latest = Reading.latest_per("device", value=3, strategy=strategy)
+        assert [(m.device, m.value) for m in latest] == [("d0", 3)]
+    with pytest.raises(ValueError):
+        Post.latest_per()
+    # the version of a new engine is read by connecting
+    engine = create_engine("sqlite://")
+    assert _supports_window(engine) and engine.dialect.server_version_info
+
+
+class Photo(db.Model, BaseModel):
+    __tag_index__ = ("tags", "labels")
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tags = db.Column(SortedTags())
+    labels = db.Column(StringTags(64))
+
+
+def test_tag_index(app):
+    assert "photo_tags" in db.metadata.tables
+    p1 = Photo.insert(tags=["a", "b"], labels="x, y")
+    p2 = Photo.insert(tags="b,c", labels="y")
+    p3 = Photo.insert(tags=["c"])
+
+    def ids(**kwargs):
+        return [m.id for m in Photo.filter_by_tags(order_by=Photo.id, **kwargs)]
+
+    assert ids(attr="tags", any_of=["a", "c"]) == [p1.id, p2.id, p3.id]
+    assert ids(attr="tags", all_of="b,c") == [p2.id]
+    assert ids(attr="tags", any_of="b", none_of=["a"]) == [p2.id]
+    assert ids(attr="tags", none_of=["b"]) == [p3.id]
+    assert ids(attr="labels", all_of=["x", "y"]) == [p1.id]
+    assert ids(attr="tags", any_of="b", limit=1, offset=1) == [p2.id]
+    with pytest.raises(ValueError):
+        User.filter_by_tags("name", any_of=["a"])
+
+    p1.update(tags=["d"])
+    assert ids(attr="tags", any_of="a") == [] and ids(attr="tags", any_of="d") == [p1.id]
+    assert ids(attr="labels", any_of="x") == [p1.id]
+    p2.remove()
+    assert ids(attr="labels", any_of="y") == [p1.id]
+    Photo.update_where(dict(id=p3.id), dict(tags="e"))
+    assert ids(attr="tags", any_of="e") == [p3.id] and ids(attr="tags", any_of="c") == []
+    Photo.discard(id=p3.id)
+    assert ids(attr="tags", any_of="e") == []
+
+    Photo.insert_many([dict(tags=["f"]) for _ in range(5)])
+    assert ids(attr="tags", any_of="f") == []
+    with db.engine.connect() as conn:
+        before = conn.execute(text("SELECT count(*) FROM photo_tags")).scalar()
+    assert Photo.rebuild_tag_index(batch_size=2) == before + 5
+    assert len(ids(attr="tags", any_of="f")) == 5
+    assert Photo.discard_in_batches(batch_size=2) == 6
+    with db.engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM photo_tags")).scalar() == 0
+
+
+class Metric(db.Model, BaseModel):
+    _result_cache = LRUCache(maxsize=8, ttl=60)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(32))
+    value = db.Column(db.Integer)
+    payload = db.Column(db.JSON)
+
+
+def test_result_cache(app):
+    cache = Metric._result_cache
+    cache.clear()
+    Metric.insert_many(dict(name="m{}".format(i % 2), value=i) for i in range(5))
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def reads():
+        return len([s for s in statements if s.startswith("SELECT")])
+
+    assert [m.value for m in Metric.filter_by(name="m0", order_by=Metric.id)] == [0, 2, 4]
+    assert reads() == 1
+    db.session.remove()
+    ms = Metric.filter_by(name="m0", order_by=Metric.id)
+    assert [m.value for m in ms] == [0, 2, 4] and reads() == 1 and cache.stats["hits"] == 1
+    assert Metric.count(name="m1") == 2 and Metric.count(name="m1") == 2 and reads() == 2
+    page = Metric.page_items(limit=2)
+    assert Metric.page_items(limit=2)["total"] == page["total"] == 5 and reads() == 4
+    assert len(Metric.filter_by(only=["name"])) == 5 and reads() == 5
+
+    # flush/commit of the session
+    ms[0].update(name="m1")
+    assert Metric.count(name="m1") == 3
+    Metric.insert(name="m1", value=5)
+    assert [m.value for m in Metric.filter_by(name="m0", order_by=Metric.id)] == [2, 4]
+    # bulk paths
+    Metric.update_where(dict(value=2), dict(name="m1"))
+    assert Metric.count(name="m1") == 5
+    Metric.discard(value=5)
+    Metric.insert_many([dict(name="m0", value=6)])
+    assert [m.value for m in Metric.filter_by(name="m0", order_by=Metric.id)] == [4, 6]
+    # uncommitted writes of the session are never cached
+    with batch_writes():
+        Metric.insert(name="m0", value=7)
+        assert Metric.count(name="m0") == 3
+    assert Metric.count(name="m0") == 3
+
+    # writes outside the session are seen after ttl (max staleness)
+    cache.clear()
+    cache.ttl = 0.05
+    Metric.count(name="m0")
+    n = reads()
+    assert Metric.count(name="m0") == 3 and reads() == n
+    with db.engine.begin() as conn:
+        conn.execute(Metric.__table__.delete().where(Metric.value == 7))
+    assert Metric.count(name="m0") == 3
+    time.sleep(0.06)
+    assert Metric.count(name="m0") == 2
+    cache.ttl = 60
+    for i in range(10):
+        Metric.count(value=i)
+    assert cache.stats["evictions"] > 0 and len(cache._data) == 8
+
+
+def test_result_cache_expired(app):
+    Metric._result_cache.clear()
+    Metric.insert_many(dict(name="e", value=i) for i in range(20))
+    ms = Metric.filter_by(name="e", order_by=Metric.id)
+    ms[0].update(value=100)
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    # models expired by the commit are filled by the rows, instead of lazy loading one by one
+    ds = [m.to_dict() for m in Metric.filter_by(name="e", order_by=Metric.id)]
+    assert len(statements) == 1 and ds[0]["value"] == 100 and len(ds) == 20
+    ds = [m.to_dict() for m in Metric.filter_by(name="e", order_by=Metric.id)]
+    assert len(statements) == 1 and [d["value"] for d in ds][1:] == list(range(1, 20))
+
+
+def test_result_cache_mutable(app):
+    Metric._result_cache.clear()
+    Metric.insert_many(dict(name="m", value=i, payload=dict(v=i)) for i in range(2))
+    a, b = Metric.filter_by(name="m", order_by=Metric.id)
+    b.payload["v"] = 999
+    db.session.rollback()
+    assert [m.payload for m in Metric.filter_by(name="m", order_by=Metric.id)] == [dict(v=0), dict(v=1)]
+    db.session.remove()
+    a, b = Metric.filter_by(name="m", order_by=Metric.id)
+    b.payload["v"] = 999
+    db.session.remove()
+    assert [m.payload for m in Metric.filter_by(name="m", order_by=Metric.id)] == [dict(v=0), dict(v=1)]
@@ -0,0 +1,138 @@
+import os
+import csv
+import json
+import pytest
+import tempfile
+from datetime import datetime
+from sqlalchemy import create_engine
+from pyco_sqlalchemy import transfer
+from pyco_sqlalchemy._flask import db, CoModel
+from pyco_sqlalchemy._types import JsonText, SortedTags, BoolField
+
+cwd = os.path.dirname(__file__)
+
+
+class Record(db.Model, CoModel):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    uid = db.Column(db.String(32), unique=True)
+    score = db.Column(db.Float)
+    flag = db.Column(BoolField())
+    tags = db.Column(SortedTags())
+    payload = db.Column(JsonText())
+
+
+@pytest.fixture
+def engine_url():
+    db_fd, db_file = tempfile.mkstemp(suffix="sqlite.db", dir=cwd)
+    url = "sqlite:///{}".format(db_file)
+    engine = create_engine(url)
+    Record.__table__.create(engine)
+    engine.dispose()
+    yield url
+    os.close(db_fd)
+    os.unlink(db_file)
+
+
+def seed(url, n):
+    engine = create_engine(url)
+    t = datetime(2021, 3, 22, 20, 32, 2)
+    rows = [dict(uid="u{}".format(i), score=i / 2, flag=i % 2, tags="b,a", payload=dict(i=i),
+                 created_time=t, updated_time=t) for i in range(1, n + 1)]
+    with engine.begin() as conn:
+        conn.execute(Record.__table__.insert(), rows)
+    engine.dispose()
+
+
+def test_export_table(engine_url, tmp_path):
+    seed(engine_url, 103)
+    out = str(tmp_path / "jsonl")
+    manifest = transfer.export_table(Record, engine_url, out, partitions=4, workers=2, chunk_size=10)
+    assert manifest["rows"] == 103 and len(manifest["partitions"]) == 4
+    with open(os.path.join(out, "manifest.json")) as fp:
+        assert json.load(fp)["rows"] == 103
+    rows = []
+    for p in manifest["partitions"]:
+        with open(os.path.join(out, p["path"])) as fp:
+            lines = [json.loads(line) for line in fp]
+        assert len(lines) == p["rows"]
+        rows.extend(lines)
+    assert [r["id"] for r in rows] == list(range(1, 104))
+    r = rows[0]
+    assert r["tags"] == ["a", "b"] and r["payload"] == {"i": 1} and r["flag"] is True
+    assert r["created_time"] == str(datetime(2021, 3, 22, 20, 32, 2).astimezone())
+
+    out = str(tmp_path / "csv")
+    manifest = transfer.main(["export", "tests.test_transfer:Record", "--url", engine_url, "--out", out,
+                              "--format", "csv", "-w", "0", "-p", "3", "--where", '{"flag": false}'])
+    with open(os.path.join(out, "manifest.json")) as fp:
+        manifest = json.load(fp)
+    assert manifest["rows"] == 51
+    with open(os.path.join(out, manifest["partitions"][0]["path"])) as fp:
+        rows = list(csv.DictReader(fp))
+    assert rows[0]["uid"] == "u2" and rows[0]["tags"] == '["a","b"]' and rows[0]["payload"] == '{"i":2}'
+
+
+def test_import_file(engine_url, tmp_path):
+    path = str(tmp_path / "records.jsonl")
+    with open(path, "w") as fp:
+        for i in range(1, 26):
+            fp.write(json.dumps(dict(uid="u{}".format(i), score=i, flag="no", tags="b,a", payload=dict(i=i), x=1)))
+            fp.write("\n")
+        fp.write("[1, 2]\n")
+        fp.write('{"uid": "u1"}\n')
+        fp.write('{"uid": "u26", "score": "bad"}\n')
+    reports = []
+    result = transfer.import_file(Record, engine_url, path, chunk_size=10, progress=reports.append)
+    assert result["rows"] == 25 and result["rejected"] == 3
+    assert [r["rows"] for r in reports] == [10, 20, 25]
+    with open(path + ".rejects.jsonl") as fp:
+        rejects = sorted((json.loads(line) for line in fp), key=lambda r: r["offset"])
+    assert [r["row"] for r in rejects][1:] == [{"uid": "u1"}, {"uid": "u26", "score": "bad"}]
+
+    engine = create_engine(engine_url)
+    with engine.connect() as conn:
+        r = conn.execute(Record.__table__.select().where(Record.uid == "u2")).one()
+    assert r.tags == ["a", "b"] and r.payload == {"i": 2} and r.flag is False and r.created_time
+
+    # resume from the checkpoint after appended rows, the file is done otherwise
+    assert transfer.import_file(Record, engine_url, path)["rows"] == 0
+    with open(path + ".checkpoint") as fp:
+        state = json.load(fp)
+    state.update(done=False)
+    with open(path + ".checkpoint", "w") as fp:
+        json.dump(state, fp)
+    with open(path, "a") as fp:
+        fp.write('{"uid": "u27"}\n')
+    assert transfer.import_file(Record, engine_url, path)["rows"] == 1
+
+    # csv exported
+    out = str(tmp_path / "csv")
+    transfer.main(["export", "tests.test_transfer:Record", "--url", engine_url, "--out", out,
+                   "--format", "csv", "-w", "0", "-p", "1"])
+    with engine.begin() as conn:
+        conn.execute(Record.__table__.delete())
+    code = transfer.main(["import", "tests.test_transfer:Record", os.path.join(out, "record-0000.csv"),
+                          "--url", engine_url, "--chunk-size", "7"])
+    assert code == 0
+    with engine.connect() as conn:
+        rows = conn.execute(Record.__table__.select().order_by(Record.id)).fetchall()
+    engine.dispose()
+    assert len(rows) == 26 and rows[0].id == 1 and rows[-1].uid == "u27" and rows[-1].score is None
+    assert rows[1].tags == ["a", "b"] and rows[1].payload == {"i": 2} and rows[1].flag is False
+
+
+def test_jsonl_round_trip(engine_url, tmp_path):
+    seed(engine_url, 5)
+    out = str(tmp_path / "jsonl")
+    transfer.export_table(Record, engine_url, out, workers=0, partitions=1)
+    engine = create_engine(engine_url)
+    with engine.begin() as conn:
+        conn.execute(Record.__table__.delete())
+    result = transfer.import_file(Record, engine_url, os.path.join(out, "record-0000.jsonl"))
+    assert result["rows"] == 5 and result["rejected"] == 0
+    with engine.connect() as conn:
+        rows = conn.execute(Record.__table__.select().order_by(Record.id)).fetchall()
+    engine.dispose()
+    assert [r.uid for r in rows] == ["u{}".format(i) for i in range(1, 6)]
+    assert rows[0].created_time == rows[0].updated_time == datetime(2021, 3, 22, 20, 32, 2)
+    assert rows[1].score == 1.0 and rows[1].tags == ["a", "b"] and rows[1].payload == {"i": 2}
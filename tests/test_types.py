@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy.dialects import sqlite
+from pyco_sqlalchemy import regex
+from pyco_sqlalchemy._types import BoolField, SnakeField, StringTags, SortedTags
+
+
+def test_bind_processor_memo():
+    dialect = sqlite.dialect()
+    cases = [
+        (SnakeField(32), ["getHTTPResponseCode", "get HTTP code", 12, None], ["get_http_response_code", "get_http_code", "12", ""]),
+        (StringTags(64), [" a , b,c ", ["x", 1], None], ["a,b,c", "x,1", ""]),
+        (SortedTags(), ["b, a ,b", ["z", "y", 1], None], ['["a", "b"]', '["1", "y", "z"]', '[]']),
+        (BoolField(), [" False ", "否", "yes", 0, 1], [False, False, True, False, True]),
+    ]
+    for tp, values, expected in cases:
+        process = tp.dialect_impl(dialect).bind_processor(dialect)
+        stats = type(tp).memo_stats()
+        for _ in range(3):
+            assert [process(v) for v in values] == expected
+        n = sum(type(v) is str for v in values)
+        stats2 = type(tp).memo_stats()
+        assert stats2["misses"] - stats["misses"] == n
+        assert stats2["hits"] - stats["hits"] == n * 2
+
+    # one LRU per type instance and dialect, released with the instance
+    import gc
+    gc.collect()
+    n = len(SortedTags._live_memos)
+    tp = SortedTags()
+    for _ in range(10):
+        tp.bind_processor(dialect)
+    assert len(SortedTags._live_memos) == n + 1
+    del tp
+    gc.collect()
+    assert len(SortedTags._live_memos) == n
+
+
+def test_normalize_many():
+    tags = SortedTags().normalize_many(["b, a", "getHTTP", "b, a", ["c"], None])
+    assert tags == [["a", "b"], ["getHTTP"], ["a", "b"], ["c"], []]
+    snakes = SnakeField().normalize_many(["getHTTP", "getHTTP", None, 7])
+    assert snakes == ["get_http", "get_http", "", "7"]
+    assert regex.snake_case("HTTPResponseCodeXYZ") == "http_response_code_xyz"
+
+
+def test_json_columns():
+    from collections import OrderedDict
+    from sqlalchemy import create_engine, MetaData, Table, Column, Integer, select
+    from pyco_sqlalchemy import utils
+    from pyco_sqlalchemy._types import JsonText, OrderedJson, LazyJson, JSON_BACKENDS
+
+    engine = create_engine("sqlite://")
+    tbl = Table(
+        "json_rows", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("eager", JsonText()),
+        Column("lazy", JsonText(lazy=True, backend="orjson")),
+        Column("pretty", JsonText(indent=2)),
+        Column("ordered", OrderedJson(lazy=True)),
+    )
+    tbl.create(engine)
+    doc = dict(b=[1, 2], a="x")
+    with engine.begin() as conn:
+        conn.execute(tbl.insert(), dict(id=1, eager=doc, lazy=doc, pretty=doc, ordered=doc))
+        raw = conn.exec_driver_sql("SELECT eager, pretty FROM json_rows").first()
+        assert raw[0] == '{"b":[1,2],"a":"x"}'
+        assert raw[1].startswith('{\n  "b"')
+
+        row = conn.execute(select(tbl)).first()
+        assert row.eager == doc
+        assert isinstance(row.lazy, LazyJson) and not row.lazy.decoded
+        assert row.lazy == doc and row.lazy["b"] == [1, 2] and row.lazy.decoded
+        assert list(row.ordered.keys()) == ["b", "a"] and isinstance(row.ordered.value, OrderedDict)
+        assert utils.json_dumps(row.lazy) == utils.json_dumps(doc)
+
+        # undecoded LazyJson is re-bound as the raw text
+        lazy = LazyJson('{"b":[1,2],"a":"y"}')
+        conn.execute(tbl.update().values(lazy=lazy, eager=None))
+        row = conn.execute(select(tbl)).first()
+        assert row.lazy["a"] == "y" and not lazy.decoded
+        assert row.eager is None
+
+    # unknown names are errors, known optional backends fallback to stdlib
+    with pytest.raises(ValueError):
+        JsonText(backend="ujson")
+    assert JsonText(backend="simdjson").backend is JSON_BACKENDS.get("simdjson", JSON_BACKENDS["stdlib"])
@@ -0,0 +1,54 @@
+from datetime import datetime
+from dateutil.parser import parse
+from pyco_sqlalchemy import utils
+
+DATESTRS = [
+    "2021-01-02", "2021-01-02T03", "2021-01-02T03:04", "2021-01-02 03:04:05,123",
+    "2021-01-02T03:04:05Z", "2021-01-02T03:04:05.123456+08:00", "2021-01-02T03:04:05+0800",
+    "2021-01-02T03:04:05.1234567", "2021-01-02T24:00:00",
+    "20210102", "202101021230", "20210102123045",
+    "01/02/2021", "13/01/2021", "1/2/21", "12/31/70",
+    "2021/01/02 10:20:30", "Tue, 22 Mar 2021 20:32:02 +0800", "22 Mar 2021", "March 22, 2021",
+    "10:30", "3.5", "-100", "99999999",
+]
+
+
+def _parse_or_error(fn, s):
+    try:
+        return fn(s)
+    except ValueError:
+        return ValueError
+
+
+def test_parse_datestr():
+    for _ in range(2):
+        # the 2nd round hits the detected formats
+        for s in DATESTRS:
+            a, b = _parse_or_error(utils.parse_datestr, s), _parse_or_error(parse, s)
+            assert a is b is ValueError or utils._same_datetime(a, b), (s, a, b)
+    assert utils.parse_datestr("02 Jan 2021", dayfirst=True) == datetime(2021, 1, 2)
+
+
+def test_shape_formats_lru(monkeypatch):
+    monkeypatch.setattr(utils, "SHAPE_FORMATS_MAXSIZE", 2)
+    monkeypatch.setattr(utils, "_shape_formats", type(utils._shape_formats)())
+    utils.parse_datestr("2021/01/02")
+    utils.parse_datestr("22 Mar 2021")
+    utils.parse_datestr("2021/01/03")
+    utils.parse_datestr("March 22, 2021")
+    # the shape of "2021/01/03" is hit, "22 Mar 2021" is evicted
+    assert list(utils._shape_formats) == [s.translate(utils._SHAPE_TABLE) for s in ("2021/01/02", "March 22, 2021")]
+
+
+def test_parse_date():
+    ts = 1616416322.5
+    assert utils.parse_date(str(ts)).timestamp() == ts
+    assert utils.parse_date("1616416322", tz=utils.TZ_UTC) == datetime(2021, 3, 22, 12, 32, 2, tzinfo=utils.TZ_UTC)
+    assert utils.parse_date("2021-03-22T12:32:02Z").timestamp() == 1616416322
+    assert utils.parse_date(None) is None
+    try:
+        utils.parse_date(None, nullable=False)
+    except ValueError as e:
+        print(e)
+    else:
+        assert False